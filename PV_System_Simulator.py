@@ -1,29 +1,453 @@
-import tkinter as tk
-from tkinter import ttk
-from tkinter import messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
-import pandas as pd
-from datetime import date
-from matplotlib.ticker import FuncFormatter, MultipleLocator
-from tkinter import filedialog
+import calendar
+import contextlib
+import hashlib
+import json
+import marshal
+import os
+import queue
+import shutil
+import sys
+import threading
+import warnings
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
+from time import perf_counter
+
+# tkinter, matplotlib and pandas are imported on first use (see _load_gui and
+# the local imports), so headless runs start without them.
+
+
+def _load_gui():
+    """Import the GUI and plotting modules into the module namespace."""
+    global tk, ttk, messagebox, filedialog, mdates, FigureCanvasTkAgg, NavigationToolbar2Tk, FuncFormatter, MultipleLocator, pd
+    import tkinter as tk
+    from tkinter import ttk
+    from tkinter import messagebox
+    from tkinter import filedialog
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    from matplotlib.ticker import FuncFormatter, MultipleLocator
+    import pandas as pd
+
+
+class Cancelled(Exception):
+    """Raised inside a long computation when the user cancels it."""
+
+
+# Local directory for on-disk caches (parsed measurement files, ...)
+CACHE_DIR = os.environ.get(
+    "PV_SIM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pv_system_simulator"))
+
+TIME_STEP = 0.25  # Hours between simulated samples
+
+# Per-stage timers and counters. Off unless PV_SIM_PROFILE is set (or
+# enable_profiling() is called); when off, stage() returns a shared no-op.
+PROFILE = os.environ.get("PV_SIM_PROFILE", "").lower() not in ("", "0", "false", "no")
+_stage_times = {}  # name -> [calls, seconds, seconds outside nested stages]
+_stage_callers = {}  # (enclosing stage or None, name) -> [calls, seconds, seconds outside nested stages]
+_counters = {}
+_stats_lock = threading.Lock()
+_open_stages = threading.local()  # per-thread stack of the stages being timed
+_NO_STAGE = contextlib.nullcontext()
+
+
+def _add_stage_time(table, key, calls, seconds, own_seconds):
+    entry = table.setdefault(key, [0, 0.0, 0.0])
+    entry[0] += calls
+    entry[1] += seconds
+    entry[2] += own_seconds
+
+
+class _Stage:
+    __slots__ = ('name', 'start', 'nested', 'caller')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_open_stages, 'stack', None)
+        if stack is None:
+            stack = _open_stages.stack = []
+        self.caller = stack[-1] if stack else None
+        self.nested = 0.0
+        stack.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        _open_stages.stack.pop()
+        caller = self.caller
+        if caller is not None:
+            caller.nested += elapsed
+        with _stats_lock:
+            _add_stage_time(_stage_times, self.name, 1, elapsed, elapsed - self.nested)
+            _add_stage_time(_stage_callers, (caller and caller.name, self.name), 1, elapsed, elapsed - self.nested)
+        return False
+
+
+def stage(name):
+    """Context manager that times the enclosed block as stage `name`."""
+    if not PROFILE:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def count(name, n=1):
+    """Add `n` to counter `name`."""
+    if PROFILE:
+        with _stats_lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def enable_profiling(enabled=True):
+    """Switch the stage timers and counters on or off."""
+    global PROFILE
+    PROFILE = enabled
+
+
+def reset_stats():
+    """Clear all stage timers and counters."""
+    with _stats_lock:
+        _stage_times.clear()
+        _stage_callers.clear()
+        _counters.clear()
+
+
+def profile_stats():
+    """Snapshot of the stage timers and counters as a JSON-ready dict.
+
+    'total_s' is inclusive: a stage that runs inside another (e.g. the
+    astronomy inside a sun-position lookup) is counted in both. 'self_s'
+    leaves out the time spent in nested stages, and 'callers' splits every
+    stage by the stage it ran in (None at the top level).
+    """
+    with _stats_lock:
+        return {
+            'stages': {name: {'calls': calls, 'total_s': seconds, 'self_s': own}
+                       for name, (calls, seconds, own) in _stage_times.items()},
+            'callers': [{'caller': caller, 'stage': name, 'calls': calls, 'total_s': seconds, 'self_s': own}
+                        for (caller, name), (calls, seconds, own) in _stage_callers.items()],
+            'counters': dict(_counters),
+        }
+
+
+def merge_stats(stats):
+    """Add a profile_stats() snapshot, e.g. one returned by a worker process, to the timers and counters."""
+    with _stats_lock:
+        for name, entry in stats['stages'].items():
+            _add_stage_time(_stage_times, name, entry['calls'], entry['total_s'], entry['self_s'])
+        for entry in stats['callers']:
+            _add_stage_time(_stage_callers, (entry['caller'], entry['stage']),
+                            entry['calls'], entry['total_s'], entry['self_s'])
+        for name, n in stats['counters'].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def _profiled(profile, func, *args):
+    """Run func(*args) in a worker process. Returns (result, profile_stats() of the call or None)."""
+    if not profile:
+        return func(*args), None
+    enable_profiling()
+    reset_stats()
+    return func(*args), profile_stats()
+
+
+def export_stats(path):
+    """Write the stage timers to `path`: JSON for .json, otherwise a pstats-compatible dump.
+
+    The dump can be opened with pstats.Stats(path) or snakeviz; every stage
+    appears as a function named after it, with its own time as tottime and
+    the enclosing stages as callers. pstats cannot open a dump without
+    functions, so when no stage was timed only a warning is issued.
+    """
+    stats = profile_stats()
+    if path.lower().endswith('.json'):
+        if not stats['stages']:
+            warnings.warn(f"No stage timings were recorded, {path} has nothing to report.", RuntimeWarning, stacklevel=2)
+        _write_json(path, stats)
+        return
+    if not stats['stages']:
+        warnings.warn(f"No stage timings were recorded, {path} was not written.", RuntimeWarning, stacklevel=2)
+        return
+
+    def function(name):
+        return os.path.basename(__file__), 0, name
+
+    callers = {}
+    for entry in stats['callers']:
+        if entry['caller'] is not None:
+            callers.setdefault(entry['stage'], {})[function(entry['caller'])] = (
+                entry['calls'], entry['calls'], entry['self_s'], entry['total_s'])
+    dump = {
+        function(name): (entry['calls'], entry['calls'], entry['self_s'], entry['total_s'], callers.get(name, {}))
+        for name, entry in stats['stages'].items()
+    }
+    with open(path, 'wb') as f:
+        marshal.dump(dump, f)
+
+
+@lru_cache(maxsize=1)
+def _code_version():
+    """Hash of this module's source; cached results of older code are never reused."""
+    return _file_digest(__file__)
+
+
+@lru_cache(maxsize=16)
+def _measured_digest(file_path, mtime_ns, size):
+    return _file_digest(file_path)
+
+
+def measured_digest(file_path):
+    """Content hash of a measurement file, rehashed only when its mtime or size changes."""
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    return _measured_digest(file_path, stat.st_mtime_ns, stat.st_size)
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive lock on `path` across processes (flock, or msvcrt on Windows)."""
+    with open(path, 'a+b') as f:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ResultCache:
+    """Persistent cache of computed results, addressed by a hash of all their inputs.
+
+    Every entry is one uncompressed .npz file named after the SHA-256 of
+    the inputs (and of the code version), so equal inputs give the same
+    file in every session and for everyone sharing the directory. Entries
+    are written to a temporary file and renamed into place, so readers
+    never see a partial entry and need no lock. Reading an entry touches
+    its mtime. Writers add the entry size to a running total in a small
+    '.size' file, under a lock file shared by concurrent processes; only
+    when that total exceeds `max_bytes` is the directory scanned and the
+    entries with the oldest mtime deleted, which also resets the total.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, kind, inputs):
+        """Hex digest of a JSON-serialisable description of the inputs."""
+        text = json.dumps({'kind': kind, 'code': _code_version(), 'inputs': inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """The arrays stored under `key`, or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+            os.utime(path)
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            count('result_cache_misses')
+            return None
+        count('result_cache_hits')
+        return arrays
+
+    def put(self, key, arrays):
+        """Store a dict of arrays under `key`, evicting down to the size cap if the total exceeds it."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = os.path.join(self.directory, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            size = os.path.getsize(tmp_path)
+            with _file_lock(os.path.join(self.directory, '.lock')):
+                # Read the total before the entry appears, and net out an entry it replaces
+                total = self._read_total() + size
+                try:
+                    total -= os.path.getsize(self._path(key))
+                except FileNotFoundError:
+                    pass
+                os.replace(tmp_path, self._path(key))
+                if total > self.max_bytes:
+                    total = self._evict(self.max_bytes)
+                self._write_total(total)
+        except OSError:
+            pass  # The cache is an optimisation only
+
+    def fetch(self, kind, inputs, compute):
+        """The cached arrays for these inputs, computing and storing them with compute() on a miss."""
+        key = self.key(kind, inputs)
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, arrays)
+        return arrays
+
+    def entries(self):
+        """(path, size, mtime) of every entry, oldest first."""
+        entries = []
+        try:
+            scan = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return entries
+        for entry in scan:
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def _read_total(self):
+        """Running total of the entry sizes, from a directory scan if the '.size' file is missing or broken."""
+        try:
+            with open(os.path.join(self.directory, '.size')) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return sum(size for _, size, _ in self.entries())
+
+    def _write_total(self, total):
+        with open(os.path.join(self.directory, '.size'), 'w') as f:
+            f.write(str(total))
+
+    def _evict(self, max_bytes):
+        # Caller holds the lock; returns the size of the entries that are left
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # Still open elsewhere (Windows); try again next time
+            total -= size
+        return total
+
+    def evict(self, max_bytes=None):
+        """Delete the least recently used entries until the directory fits `max_bytes` (default: the cap)."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with _file_lock(os.path.join(self.directory, '.lock')):
+            self._write_total(self._evict(max_bytes))
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            self.evict(max_bytes=0)
+
 
+# Simulation and comparison results, capped at PV_SIM_RESULT_CACHE_MB (0 turns the cache off)
+RESULT_CACHE_MB = float(os.environ.get("PV_SIM_RESULT_CACHE_MB", 256))
+RESULT_CACHE = ResultCache(os.path.join(CACHE_DIR, 'results'), int(RESULT_CACHE_MB * 1024 * 1024)) if RESULT_CACHE_MB > 0 else None
+
+
+# np.trapz was renamed to np.trapezoid in NumPy 2.0
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
 
 
 def compute_surface_under_plot(time, power):
-    # Function logic
-    time = np.array(time)
-    power = np.array(power)
-    total_energy = np.trapz(power, time)  # Compute integral
-    return total_energy 
+    # Integrates along the last axis, so a (days × timesteps) grid gives one value per day
+    with stage('integrate'):
+        time = np.array(time)
+        power = np.array(power)
+        total_energy = _trapezoid(power, time, axis=-1)  # Compute integral
+    return total_energy
+
+
+def trapezoid_weights(time):
+    """Weights w such that (power * w).sum(axis=-1) is the trapezoid integral over `time`."""
+    time = np.asarray(time, dtype=float)
+    dt = np.diff(time, axis=-1) / 2
+    weights = np.zeros_like(time)
+    weights[..., :-1] += dt
+    weights[..., 1:] += dt
+    return weights
+
+
+class PowerChain:
+    """Turn module irradiance into output power: losses, then DC and AC clipping.
+
+    Loss parameters are percentages, as entered in the GUI. The irradiance loss
+    is applied by the simulator (``mult``), the rest by ``apply``.
+    """
+
+    def __init__(self, surface_area=1.0, num_modules=1, irradiance_losses=0.0, system_losses=0.0,
+                 efficiency_losses=0.0, clip_threshold=np.inf, alt_clip_threshold=np.inf):
+        self.surface_area = surface_area
+        self.num_modules = num_modules
+        self.irradiance_losses = irradiance_losses
+        self.system_losses = system_losses
+        self.efficiency_losses = efficiency_losses
+        self.clip_threshold = clip_threshold  # Nominal power (DC limit) in W
+        self.alt_clip_threshold = alt_clip_threshold  # Max export power (AC limit) in W
+
+    @property
+    def irr_mult(self):
+        return 1 - self.irradiance_losses / 100
+
+    @property
+    def power_mult(self):
+        return 1 - self.system_losses / 100
+
+    @property
+    def efficiency_mult(self):
+        return 1 - self.efficiency_losses / 100
+
+    @property
+    def scale(self):
+        """Factor from module irradiance (before irradiance losses) to unclipped power."""
+        return self.irr_mult * self.surface_area * self.num_modules * self.efficiency_mult * self.power_mult
+
+    @property
+    def limit(self):
+        """Effective clipping limit: the DC limit followed by the AC limit."""
+        return min(self.clip_threshold, self.alt_clip_threshold)
+
+    def apply(self, irradiance, out=None):
+        """Convert irradiance (W/m², already multiplied by irr_mult) to clipped power (W).
+
+        With `out` the power is written into that array without temporaries.
+        """
+        with stage('power_chain'):
+            if out is not None:
+                power = np.multiply(irradiance, self.surface_area, out=out, casting='same_kind')
+                for factor in (self.num_modules, self.efficiency_mult, self.power_mult):
+                    np.multiply(power, factor, out=power, casting='same_kind')
+                np.minimum(power, self.clip_threshold, out=power, casting='same_kind')
+                return np.minimum(power, self.alt_clip_threshold, out=power, casting='same_kind')
+            power = irradiance * self.surface_area * self.num_modules * self.efficiency_mult * self.power_mult
+            power = np.minimum(power, self.clip_threshold)
+            return np.minimum(power, self.alt_clip_threshold)
 
 class PVSystemSimulator:
-    def __init__(self, latitude, longitude, beta, gamma):
+    def __init__(self, latitude, longitude, beta, gamma, shading=None):
         self.latitude = latitude  # Latitude (φ) in degrees
         self.longitude = longitude  # Longitude (λ) in degrees
         self.beta = beta  # Tilt angle (β) in degrees
         self.gamma = gamma  # Azimuth angle (γ) in degrees
+        self.shading = shading  # ShadingProfile of the site, None for an open sky
 
     @staticmethod
     def day_of_year(year, month, day):
@@ -55,10 +479,14 @@ class PVSystemSimulator:
 
     def sunrise_sunset(self, day):
         """Calculate sunrise and sunset times."""
-        phi = self.latitude
         delta = self.declination_angle(day)
-        H = np.degrees(np.arccos(-np.tan(np.radians(phi - self.beta)) * np.tan(np.radians(delta))))
         TC = self.time_correction(day) / 60  # Convert TC to hours
+        return self.sunrise_sunset_from(delta, TC)
+
+    def sunrise_sunset_from(self, delta, TC):
+        """Sunrise and sunset times from a precomputed declination and time correction (hours)."""
+        phi = self.latitude
+        H = np.degrees(np.arccos(-np.tan(np.radians(phi - self.beta)) * np.tan(np.radians(delta))))
         t_sunrise = 12 - (H / 15) - TC
         t_sunset = 12 + (H / 15) - TC
         return t_sunrise, t_sunset
@@ -74,7 +502,7 @@ class PVSystemSimulator:
             np.sin(np.radians(phi)) * np.sin(np.radians(delta)) +
             np.cos(np.radians(phi)) * np.cos(np.radians(delta)) * np.cos(np.radians(omega))
         ))
-        return max(alpha, 0)  # Set to 0 if below the horizon
+        return np.maximum(alpha, 0)  # Set to 0 if below the horizon
 
     def azimuth_of_sun(self, delta, alpha, omega):
         """Calculate the azimuth of the sun (ψ)."""
@@ -85,103 +513,2366 @@ class PVSystemSimulator:
         psi = np.degrees(np.arccos(numerator / denominator))
         return psi
 
-    def module_irradiance(self, ion, alpha, psi):
-        """Calculate the module irradiance (I_module)."""
-        gamma = self.gamma
-        beta = self.beta
+    @staticmethod
+    def full_azimuth(psi, omega):
+        """Sun azimuth over 0-360° clockwise from north: ψ before solar noon, 360° - ψ after."""
+        return np.where(omega > 0, 360 - psi, psi)
+
+    def module_irradiance(self, ion, alpha, psi, beta=None, gamma=None):
+        """Calculate the module irradiance (I_module).
+
+        `beta`/`gamma` override the module orientation and may be arrays.
+        """
+        gamma = self.gamma if gamma is None else gamma
+        beta = self.beta if beta is None else beta
         I_module = ion * (
             np.cos(np.radians(alpha)) * np.sin(np.radians(beta)) *
             np.cos(np.radians(gamma - psi)) +
             np.sin(np.radians(alpha)) * np.cos(np.radians(beta))
         )
-        return max(I_module, 0)
+        return np.maximum(I_module, 0)
 
-    def simulate_day(self, year, month, day, mult=1.0):
-        day_of_year = self.day_of_year(year, month, day)
-        t_sunrise, t_sunset = self.sunrise_sunset(day_of_year)
-        delta = self.declination_angle(day_of_year)
-        solar_noon = self.solar_noon(day_of_year)
+    @staticmethod
+    def extraterrestrial_irradiance(day):
+        """Calculate the extraterrestrial irradiance (I_on) in W/m²."""
+        return 1367 * (1 + 0.033 * np.cos(2 * np.pi * day / 365))
+
+    @staticmethod
+    def dst_shift(day):
+        """Hours to add to solar standard time to get local clock time."""
+        return np.where((89 <= day) & (day <= 301), 1, 0)
+
+    @staticmethod
+    def range_time_grid(t_sunrise, t_sunset):
+        """Build the time grids of many days as one padded (days × timesteps) array.
+
+        Each row is sunrise - 1h, sunrise, every 15 minutes until sunset, sunset
+        and sunset + 1h, with the same values np.arange(t_sunrise, t_sunset, 0.25)
+        gives. Shorter rows are padded by repeating sunset + 1h, so the padding
+        adds nothing to a trapezoid integral. Days without a sunrise are NaN rows.
+        """
         margin = 1  # 60 minutes in hours
+        step = TIME_STEP
+        t_sunrise = np.atleast_1d(t_sunrise)
+        t_sunset = np.atleast_1d(t_sunset)
+        valid = np.isfinite(t_sunrise) & np.isfinite(t_sunset)
+
+        counts = np.zeros(t_sunrise.shape, dtype=int)
+        counts[valid] = np.ceil((t_sunset[valid] - t_sunrise[valid]) / step)
+        delta = (t_sunrise + step) - t_sunrise
+        k = np.arange(counts.max(initial=0) + 2)
+        steps = t_sunrise[:, None] + k * delta[:, None]
+        steps[:, 1] = t_sunrise + step
+        steps = np.where(k < counts[:, None], steps, t_sunset[:, None])
+        steps = np.where(k <= counts[:, None], steps, (t_sunset + margin)[:, None])
+
+        time = np.empty((t_sunrise.size, k.size + 2))
+        time[:, 0] = t_sunrise - margin
+        time[:, 1] = t_sunrise
+        time[:, 2:] = steps
+        return time
+
+    def sun_position(self, day, time):
+        """Solar elevation (α) and azimuth (ψ) at `time` (hours, solar standard time) on day `day`.
+
+        `day` may be a column vector to evaluate a whole (days × timesteps) grid.
+        """
+        delta = self.declination_angle(day)
+        solar_noon = self.solar_noon(day)
+        time_corr = self.time_correction(day) / 60
+        return self.sun_position_from(delta, solar_noon, time_corr, time)
+
+    def sun_position_from(self, delta, solar_noon, time_corr, time):
+        """Solar elevation (α) and azimuth (ψ) from precomputed per-day quantities."""
+        omega = self.hour_angle(time + time_corr, solar_noon)
+        alpha = self.solar_elevation_angle(delta, omega)
+        psi = self.azimuth_of_sun(delta, alpha, omega)
+        return alpha, psi
+
+    def day_sun_position(self, year, month, day, azimuth=False):
+        """Return (time, alpha, psi, ion) for one day, with time in local clock hours.
+
+        With `azimuth` the 0-360° sun azimuth (see full_azimuth) is appended.
+        """
+        day_of_year = self.day_of_year(year, month, day)
+        geometry = site_geometry(self.latitude, self.longitude, year)
+        time, alpha, psi = geometry.sun_grid(self.beta)
+        row = day_of_year - 1
+        if not np.isfinite(time[row, 0]):
+            raise ValueError("No sunrise/sunset on this day at this latitude and tilt.")
+
+        width = np.count_nonzero(time[row] != time[row, -1]) + 1  # Drop the padding
+        time = time[row, :width] + self.dst_shift(day_of_year)  # shift back so graph matches local clock time
+        if azimuth:
+            return (time, alpha[row, :width], psi[row, :width], geometry.ion[row],
+                    geometry.azimuth_grid(self.beta)[row, :width])
+        return time, alpha[row, :width], psi[row, :width], geometry.ion[row]
+
+    def range_sun_position(self, start, end, azimuth=False):
+        """Return (dates, time, alpha, psi, ion) for every day from `start` to `end` (inclusive).
+
+        dates is a datetime64[D] array, ion a column vector and time/alpha/psi
+        padded (days × timesteps) arrays, with time in local clock hours. The
+        astronomy comes from the shared per-site cache (see site_geometry).
+        With `azimuth` the padded 0-360° sun azimuth is appended.
+        """
+        dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        if dates.size == 0:
+            raise ValueError("End date must be after or equal to start date.")
+        years = dates.astype('datetime64[Y]')
+        days = (dates - years).astype(int) + 1
+        years = years.astype(int) + 1970
+
+        parts = []
+        for year in np.unique(years):
+            geometry = site_geometry(self.latitude, self.longitude, int(year))
+            grid_time, grid_alpha, grid_psi = geometry.sun_grid(self.beta)
+            rows = days[years == year] - 1
+            part = (grid_time[rows], grid_alpha[rows], grid_psi[rows], geometry.ion[rows])
+            if azimuth:
+                part += (geometry.azimuth_grid(self.beta)[rows],)
+            parts.append(part)
+
+        if not all(np.all(np.isfinite(part[0][:, 0])) for part in parts):
+            raise ValueError("No sunrise/sunset for some days at this latitude and tilt.")
+
+        # Trim (or extend) the per-year padding to the longest day in the range
+        width = max(np.count_nonzero(part[0] != part[0][:, -1:], axis=1).max() + 1 for part in parts)
+        padded = (0, 1, 2, 4) if azimuth else (0, 1, 2)
+        time, alpha, psi, *sun_azimuth = (
+            np.concatenate([_pad_columns(part[i], width) for part in parts]) for i in padded
+        )
+        ion = np.concatenate([part[3] for part in parts])[:, None]
+        time += self.dst_shift(days)[:, None]  # shift back so graph matches local clock time
+        return (dates, time, alpha, psi, ion, *sun_azimuth)
+
+    def simulate_day_arrays(self, year, month, day, mult=1.0):
+        """Simulate one day and return (time, irradiance) NumPy arrays.
+
+        The irradiance before `mult` is memoized per site, orientation and day
+        (see _day_irradiance); time is shared with the cache and read-only.
+        """
+        time, irradiance = _day_irradiance(self.latitude, self.longitude, self.beta, self.gamma,
+                                           date(year, month, day), self.shading)
+        return time, irradiance * mult
+
+    def simulate_range(self, start, end, mult=1.0):
+        """Simulate every day from `start` to `end` (inclusive) in one pass.
+
+        Returns (dates, time, irradiance): dates is a datetime64[D] array and
+        time/irradiance are padded (days × timesteps) arrays in local clock time.
+        As in simulate_day_arrays, the irradiance before `mult` is memoized and
+        dates/time are read-only.
+        """
+        dates, time, irradiance = _range_irradiance(self.latitude, self.longitude, self.beta, self.gamma,
+                                                    np.datetime64(start, 'D'), np.datetime64(end, 'D'), self.shading)
+        return dates, time, irradiance * mult
+
+    def range_energy(self, start, end, chain=None, method="numeric"):
+        """Daily energy (Wh) after the power chain for every day from `start` to `end` (inclusive).
+
+        method="numeric" integrates the sampled 15-minute power curves.
+        method="analytic" uses SiteGeometry.daily_insolation on days whose peak
+        cannot reach the clipping limit and integrates only the other days
+        numerically; both give the same energies up to round-off. The closed
+        form knows no horizon, so with a shading profile every day is
+        integrated numerically. Returns (dates, energy).
+        """
+        chain = chain or PowerChain()
+        if method == "numeric" or (method == "analytic" and self.shading is not None):
+            result = SimulationResult.simulate(self, start, end, mult=chain.irr_mult)
+            result.apply_chain(chain)
+            return result.dates, result.daily_energy()
+        if method != "analytic":
+            raise ValueError(f"Unknown energy method '{method}'. Please use 'numeric' or 'analytic'.")
+
+        dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        if dates.size == 0:
+            raise ValueError("End date must be after or equal to start date.")
+        years = dates.astype('datetime64[Y]')
+        days = (dates - years).astype(int) + 1
+        years = years.astype(int) + 1970
+
+        insolation = np.empty(dates.size)
+        peak = np.empty(dates.size)
+        exact = np.empty(dates.size, dtype=bool)
+        for year in np.unique(years):
+            in_year = years == year
+            geometry = site_geometry(self.latitude, self.longitude, int(year))
+            year_insolation, year_peak, year_exact = geometry.daily_insolation(self.beta, self.gamma)
+            rows = days[in_year] - 1
+            insolation[in_year], peak[in_year], exact[in_year] = year_insolation[rows], year_peak[rows], year_exact[rows]
+        if np.any(np.isnan(insolation)):
+            raise ValueError("No sunrise/sunset for some days at this latitude and tilt.")
+
+        energy = chain.scale * insolation
+        numeric = ~exact | (chain.scale * peak > chain.limit)
+        if np.any(numeric):
+            # Clipped days: integrate the sampled curves
+            first, last = np.flatnonzero(numeric)[[0, -1]]
+            _, time, alpha, psi, ion = self.range_sun_position(dates[first], dates[last])
+            irradiance = self.module_irradiance(ion, alpha, psi) * chain.irr_mult
+            sampled = compute_surface_under_plot(time, chain.apply(irradiance))
+            energy[numeric] = sampled[numeric[first:last + 1]]
+        count('analytic_days', np.count_nonzero(~numeric))
+        return dates, energy
+
+    def simulate_day(self, year, month, day, mult=1.0):
+        """One day as a DataFrame, for display and export (see SimulationResult for computation)."""
+        import pandas as pd
+
+        time, irradiance = self.simulate_day_arrays(year, month, day, mult=mult)
+        with stage('dataframe'):
+            return pd.DataFrame({'Time': time, 'Irradiance': irradiance})
+
+
+def _pad_columns(array, width):
+    """Cut a padded (days × timesteps) array to `width` columns, repeating the last column if short."""
+    if array.shape[1] >= width:
+        return array[:, :width]
+    return np.concatenate([array, np.repeat(array[:, -1:], width - array.shape[1], axis=1)], axis=1)
+
+
+class SiteGeometry:
+    """Solar geometry of one site for every day of one year.
+
+    Holds the per-day table (declination, EoT, time correction, solar noon,
+    extraterrestrial irradiance) and, per tilt angle, the padded time grid
+    with the sun elevation/azimuth arrays. Only the sunrise/sunset window
+    depends on the tilt in this model, so those grids are kept per β in a
+    small LRU; everything downstream of the sun position (γ, losses,
+    clipping) reuses them as is.
+    """
+
+    max_grids = 4  # Sun-position grids kept per site and year
+
+    def __init__(self, latitude, longitude, year):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.year = year
+        self.days = np.arange(1, (366 if calendar.isleap(year) else 365) + 1)
+
+        site = PVSystemSimulator(latitude, longitude, 0, 0)
+        self.declination = site.declination_angle(self.days)
+        self.equation_of_time = site.equation_of_time(self.days)
+        self.time_correction = site.time_correction(self.days)  # minutes
+        self.solar_noon = site.solar_noon(self.days)
+        self.ion = site.extraterrestrial_irradiance(self.days)
+
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sun_grid(self, beta):
+        """Return (time, alpha, psi) for every day of the year at tilt `beta`.
+
+        time is in solar standard time (no DST shift); rows of days without a
+        sunrise are NaN. The arrays are shared, hence read-only.
+        """
+        with self._lock:
+            if beta in self._grids:
+                self._grids.move_to_end(beta)
+                count('astronomy_cache_hits')
+                return self._grids[beta]
+
+        simulator = PVSystemSimulator(self.latitude, self.longitude, beta, 0)
+        time_corr = self.time_correction / 60
+        with stage('astronomy'), np.errstate(invalid='ignore'):
+            t_sunrise, t_sunset = simulator.sunrise_sunset_from(self.declination, time_corr)
+            time = simulator.range_time_grid(t_sunrise, t_sunset)
+            alpha, psi = simulator.sun_position_from(
+                self.declination[:, None], self.solar_noon[:, None], time_corr[:, None], time)
+        grid = _read_only(time, alpha, psi)  # Shared by every simulator of the site and year
+
+        with self._lock:
+            self._grids[beta] = grid
+            while len(self._grids) > self.max_grids:
+                self._grids.popitem(last=False)
+        return grid
+
+    def azimuth_grid(self, beta):
+        """0-360° sun azimuth (see PVSystemSimulator.full_azimuth) on the time grid of sun_grid(beta)."""
+        time, _, psi = self.sun_grid(beta)
+        site = PVSystemSimulator(self.latitude, self.longitude, beta, 0)
+        omega = site.hour_angle(time + self.time_correction[:, None] / 60, self.solar_noon[:, None])
+        return site.full_azimuth(psi, omega)
+
+    def daily_insolation(self, beta, gamma):
+        """Closed-form daily insolation (Wh/m²) on a plane at (β, γ) for every day of the year.
+
+        Gives the trapezoid integral of the sampled curve (the range_time_grid
+        of sun_grid, TIME_STEP apart) without evaluating every sample. While
+        the sun is up, cos α cos ψ and cos α sin ψ reduce to functions of δ and
+        ω (the latter is cos δ |sin ω|), so the module irradiance is
+        ion · max(A + B cos ω + C |sin ω|, 0). The samples are evenly spaced in
+        ω, so over each run of them where that is positive the sum is a sum of
+        cosines and sines in arithmetic progression, known in closed form.
+        Only the samples with the sun below the horizon (where the model clamps
+        α to 0) and the sunrise, sunset and ±1 h margin points are evaluated
+        one by one. Returns (insolation, peak, exact): peak is an upper bound
+        of the irradiance, exact is False where the window wraps past midnight
+        and the sums do not apply. Days without a sunrise are NaN.
+        """
+        simulator = PVSystemSimulator(self.latitude, self.longitude, beta, gamma)
+        time_corr = self.time_correction / 60
+
+        def irradiance(time):
+            # The sampled model itself, at (days × n) times
+            alpha, psi = simulator.sun_position_from(
+                self.declination[:, None], self.solar_noon[:, None], time_corr[:, None], time)
+            return simulator.module_irradiance(self.ion[:, None], alpha, psi)
+
+        with stage('analytic_insolation'), np.errstate(invalid='ignore'):
+            t_sunrise, t_sunset = simulator.sunrise_sunset_from(self.declination, time_corr)
+            valid = np.isfinite(t_sunrise) & np.isfinite(t_sunset)
+            margin = 1  # hours, as in range_time_grid
+            spacing = (t_sunrise + TIME_STEP) - t_sunrise  # as in range_time_grid
+            samples = np.zeros(t_sunrise.shape, dtype=int)  # evenly spaced samples from sunrise on
+            samples[valid] = np.ceil((t_sunset[valid] - t_sunrise[valid]) / TIME_STEP)
+            omega_0 = np.radians(15 * (t_sunrise - 12))  # hour angle of sample 0
+            d_omega = np.radians(15 * spacing)
+
+            def position(omega):
+                # Fractional sample index of hour angle ω
+                return np.where(valid, (omega - omega_0) / d_omega, 0)
+
+            def floor(x):
+                return np.floor(x).astype(int)
+
+            def ceil(x):
+                return np.ceil(x).astype(int)
+
+            phi, beta, gamma = np.radians([self.latitude, beta, gamma])
+            delta = np.radians(self.declination)
+            A = np.sin(delta) * (np.sin(beta) * np.cos(gamma) * np.cos(phi) + np.cos(beta) * np.sin(phi))
+            B = np.cos(delta) * (np.cos(beta) * np.cos(phi) - np.sin(beta) * np.cos(gamma) * np.sin(phi))
+            C = np.cos(delta) * np.sin(beta) * np.sin(gamma)
+
+            def series(first, last, sign):
+                # Sum of A + B cos ω + sign · C sin ω over the samples first..last
+                n = np.maximum(last - first + 1, 0)
+                middle = omega_0 + (first + last) / 2 * d_omega
+                ratio = np.sin(n * d_omega / 2) / np.sin(d_omega / 2)
+                return A * n + ratio * (B * np.cos(middle) + sign * C * np.sin(middle))
+
+            # Sun above the horizon for |ω| < ω_s
+            omega_s = np.arccos(np.clip(-np.tan(phi) * np.tan(delta), -1, 1))
+            first_up = np.maximum(floor(position(-omega_s)) + 1, 0)
+            last_up = np.minimum(ceil(position(omega_s)) - 1, samples - 1)
+            noon = floor(position(0))  # last morning sample (ω <= 0)
+            # A + B cos u + C sin u = A + R cos(u - θ) > 0 for |u - θ| < κ (mod 2π), u = |ω|
+            R = np.hypot(B, C)
+            theta = np.arctan2(C, B)
+            kappa = np.where(R > 0, np.arccos(np.clip(-A / np.where(R > 0, R, 1), -1, 1)), np.where(A > 0, np.pi, 0))
+
+            total = np.zeros_like(A)
+            u_end = np.minimum(omega_s, np.pi)
+            for turn in (-2 * np.pi, 0, 2 * np.pi):
+                # Positive for u in [lo, hi): ω in (-hi, -lo] in the morning, [lo, hi) in the afternoon
+                lo = np.maximum(theta - kappa + turn, 0)
+                hi = np.maximum(np.minimum(u_end, theta + kappa + turn), lo)
+                total += series(np.maximum(floor(position(-hi)) + 1, first_up),
+                                np.minimum(np.minimum(floor(position(-lo)), noon), last_up), -1)
+                total += series(np.maximum(np.maximum(ceil(position(lo)), noon + 1), first_up),
+                                np.minimum(ceil(position(hi)) - 1, last_up), 1)
+            total *= self.ion
+
+            # Samples before sunrise and after sunset of the horizon, where α is clamped to 0
+            morning = np.minimum(first_up, samples)
+            evening = np.maximum(np.maximum(last_up + 1, morning), 0)
+            for offset, n in ((np.zeros_like(morning), morning), (evening, samples - evening)):
+                k = np.arange(n.max(initial=0))
+                clamped = irradiance(t_sunrise[:, None] + (offset[:, None] + k) * spacing[:, None])
+                total += np.where(k < n[:, None], clamped, 0).sum(axis=1)
+
+            # Trapezoid weights: half-weight ends of the even run, then the uneven panels
+            t_last = t_sunrise + np.maximum(samples - 1, 0) * spacing
+            before, first, last, sunset, after = irradiance(
+                np.stack([t_sunrise - margin, t_sunrise, t_last, t_sunset, t_sunset + margin], axis=1)).T
+            insolation = ((before + first) / 2 * margin
+                          + np.where(samples > 0, spacing * (total - (first + last) / 2), 0)
+                          + (last + sunset) / 2 * (t_sunset - t_last)
+                          + (sunset + after) / 2 * margin)
+
+        peak = self.ion * np.maximum(np.maximum(A + R, np.sin(beta)), 0)  # sin β: beam with α clamped to 0
+        exact = (omega_0 >= -np.pi) & (np.radians(15 * (t_sunset - 12)) <= np.pi)
+        return insolation, peak, exact
+
+
+@lru_cache(maxsize=32)
+def site_geometry(latitude, longitude, year):
+    """Shared SiteGeometry for (latitude, longitude, year), kept in a bounded LRU cache."""
+    return SiteGeometry(latitude, longitude, year)
+
+
+class ShadingProfile:
+    """Beam shading of a site as a precomputed (elevation × azimuth) lookup grid.
+
+    ``grid[i, j]`` is the fraction of the beam that reaches the modules with
+    the sun in elevation bin i and azimuth bin j, each `resolution` degrees
+    wide (azimuth clockwise from north over 0-360°): 0 below the horizon
+    profile, otherwise the near-shading mask (1 without one). The grid is
+    built once, so factor() is a single indexed lookup per timestep however
+    long the run. The model has no diffuse part, so the factor scales the
+    whole module irradiance.
+    """
+
+    def __init__(self, grid, resolution=1.0):
+        self.grid = np.ascontiguousarray(grid, dtype=float)
+        self.resolution = resolution
+        self.digest = hashlib.sha256(self.grid.tobytes() + repr(resolution).encode()).hexdigest()
+
+    @classmethod
+    def build(cls, azimuths=None, elevations=None, near_shading=None, resolution=1.0):
+        """Grid from horizon points (azimuth, elevation in degrees) and/or a near-shading mask.
+
+        The horizon is interpolated linearly between the points, wrapping
+        around north. `near_shading` is an (elevation × azimuth) array of beam
+        fractions covering 0-90° × 0-360° at any resolution; each grid bin
+        takes the mask cell its centre falls in.
+        """
+        elevation = (np.arange(int(np.ceil(90 / resolution))) + 0.5) * resolution  # Bin centres
+        azimuth = (np.arange(int(np.ceil(360 / resolution))) + 0.5) * resolution
+        grid = np.ones((elevation.size, azimuth.size))
+        if azimuths is not None:
+            azimuths = np.atleast_1d(np.asarray(azimuths, dtype=float))
+            elevations = np.atleast_1d(np.asarray(elevations, dtype=float))
+            if azimuths.size == 0 or azimuths.shape != elevations.shape:
+                raise ValueError("A horizon profile needs one elevation per azimuth.")
+            horizon = np.interp(azimuth, azimuths % 360, elevations, period=360)
+            grid[elevation[:, None] < horizon] = 0
+        if near_shading is not None:
+            near = np.asarray(near_shading, dtype=float)
+            if near.ndim != 2 or near.size == 0 or np.any((near < 0) | (near > 1)):
+                raise ValueError("A near-shading mask must be a 2-D table of fractions between 0 and 1.")
+            rows = np.minimum((elevation * near.shape[0] / 90).astype(int), near.shape[0] - 1)
+            columns = np.minimum((azimuth * near.shape[1] / 360).astype(int), near.shape[1] - 1)
+            grid *= near[rows[:, None], columns]
+        return cls(grid, resolution)
+
+    @classmethod
+    def from_files(cls, horizon_file=None, near_shading_file=None, resolution=1.0):
+        """Read a horizon CSV (azimuth and elevation columns) and/or a near-shading mask (.npy or CSV)."""
+        azimuths = elevations = near_shading = None
+        if horizon_file is not None:
+            table = np.genfromtxt(horizon_file, delimiter=',', names=True)
+            columns = {name.lower(): name for name in table.dtype.names or ()}
+            if 'azimuth' not in columns or 'elevation' not in columns:
+                raise ValueError(f"Horizon profile {horizon_file} needs 'azimuth' and 'elevation' columns.")
+            azimuths, elevations = table[columns['azimuth']], table[columns['elevation']]
+        if near_shading_file is not None:
+            if near_shading_file.lower().endswith('.npy'):
+                near_shading = np.load(near_shading_file)
+            else:
+                near_shading = np.loadtxt(near_shading_file, delimiter=',', ndmin=2)
+        return cls.build(azimuths, elevations, near_shading, resolution)
+
+    def factor(self, alpha, azimuth):
+        """Beam fraction for sun elevations `alpha` and 0-360° azimuths `azimuth` (arrays of one shape)."""
+        i = np.clip(np.nan_to_num(alpha) / self.resolution, 0, self.grid.shape[0] - 1).astype(np.intp)
+        j = (np.nan_to_num(azimuth) / self.resolution).astype(np.intp) % self.grid.shape[1]
+        return self.grid[i, j]
+
+
+@lru_cache(maxsize=16)
+def _load_shading(horizon_file, near_shading_file, stamps):
+    return ShadingProfile.from_files(horizon_file, near_shading_file)
+
+
+def load_shading(horizon_file=None, near_shading_file=None):
+    """Shared ShadingProfile of a horizon and/or near-shading file, None without either.
+
+    The profile is read again only when a file's mtime or size changes, so
+    the irradiance caches below keep hitting for the same site.
+    """
+    paths = tuple(os.path.abspath(path) if path else None for path in (horizon_file, near_shading_file))
+    if paths == (None, None):
+        return None
+    stamps = tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if path else None for path in paths)
+    return _load_shading(*paths, stamps)
+
+
+# Module irradiance before any loss (mult=1) per site, orientation, shading
+# profile and day or date range. Losses, area, module count and clipping are applied on top by
+# the callers, so changing only those re-runs none of the simulation. The
+# cached arrays are shared, hence read-only.
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.setflags(write=False)
+    return arrays
+
+
+@lru_cache(maxsize=64)
+def _day_irradiance(latitude, longitude, beta, gamma, day, shading=None):
+    simulator = PVSystemSimulator(latitude, longitude, beta, gamma)
+    with stage('sun_position'):
+        time, alpha, psi, ion, *azimuth = simulator.day_sun_position(day.year, day.month, day.day,
+                                                                     azimuth=shading is not None)
+    with stage('irradiance'):
+        irradiance = simulator.module_irradiance(ion, alpha, psi)
+    if shading is not None:
+        with stage('shading'):
+            irradiance *= shading.factor(alpha, azimuth[0])
+    count('simulated_days')
+    return _read_only(time, irradiance)
+
+
+@lru_cache(maxsize=8)
+def _range_irradiance(latitude, longitude, beta, gamma, start, end, shading=None):
+    simulator = PVSystemSimulator(latitude, longitude, beta, gamma)
+    with stage('sun_position'):
+        dates, time, alpha, psi, ion, *azimuth = simulator.range_sun_position(start, end, azimuth=shading is not None)
+    with stage('irradiance'):
+        irradiance = simulator.module_irradiance(ion, alpha, psi)
+    if shading is not None:
+        with stage('shading'):
+            irradiance *= shading.factor(alpha, azimuth[0])
+    count('simulated_days', dates.size)
+    return _read_only(dates, time, irradiance)
+
+
+class SimulationResult:
+    """Simulated days as a struct of arrays with a fixed schema.
+
+    ``dates`` is datetime64[D] (days,); ``time`` (local clock hours),
+    ``irradiance`` (W/m², after ``mult``) and ``power`` (W) are contiguous
+    (days × timesteps) buffers of one float dtype, padded like
+    range_time_grid. ``power`` is filled in place by apply_chain. With a
+    `path` the buffers are memory-mapped .npy files in that directory, so
+    long runs need not fit in memory. to_frame builds a DataFrame on demand.
+    """
+
+    fields = ('time', 'irradiance', 'power')
+
+    def __init__(self, dates, time, irradiance, power):
+        self.dates = dates
+        self.time = time
+        self.irradiance = irradiance
+        self.power = power
+
+    @classmethod
+    def allocate(cls, dates, timesteps, dtype=np.float64, path=None):
+        """Empty result for `dates`, in memory or memory-mapped under `path`."""
+        shape = (dates.size, timesteps)
+        if path is None:
+            return cls(dates, *(np.empty(shape, dtype=dtype) for _ in cls.fields))
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'dates.npy'), dates)
+        buffers = [np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+                   for name in cls.fields]
+        return cls(dates, *buffers)
+
+    @classmethod
+    def load(cls, path, mode='r'):
+        """Memory-map a result written with `path` (mode 'r+' to modify it)."""
+        dates = np.load(os.path.join(path, 'dates.npy'))
+        return cls(dates, *(np.load(os.path.join(path, name + '.npy'), mmap_mode=mode) for name in cls.fields))
+
+    @classmethod
+    def simulate(cls, simulator, start, end, mult=1.0, dtype=np.float64, path=None):
+        """Simulate every day from `start` to `end` (inclusive) into a new result."""
+        dates, time, irradiance = _range_irradiance(simulator.latitude, simulator.longitude, simulator.beta,
+                                                    simulator.gamma, np.datetime64(start, 'D'), np.datetime64(end, 'D'),
+                                                    simulator.shading)
+        result = cls.allocate(dates, time.shape[1], dtype, path)
+        result.time[...] = time
+        np.multiply(irradiance, mult, out=result.irradiance, casting='same_kind')
+        return result
+
+    def apply_chain(self, chain):
+        """Fill ``power`` from ``irradiance`` through `chain`, without temporaries."""
+        chain.apply(self.irradiance, out=self.power)
+        return self.power
+
+    def daily_energy(self, field='power'):
+        """Trapezoid integral of a field over time for every day (Wh, or Wh/m² for irradiance)."""
+        with stage('integrate'):
+            return _trapezoid(getattr(self, field), self.time, axis=-1)
+
+    def day(self, i):
+        """(time, irradiance, power) of day `i` without the padding."""
+        time = self.time[i]
+        width = np.count_nonzero(time != time[-1]) + 1
+        return time[:width], self.irradiance[i, :width], self.power[i, :width]
+
+    def flush(self):
+        """Write memory-mapped buffers back to disk."""
+        for name in self.fields:
+            buffer = getattr(self, name)
+            if isinstance(buffer, np.memmap):
+                buffer.flush()
+
+    def to_frame(self):
+        """Long DataFrame with Date, Time, Irradiance and Power columns, padding dropped."""
+        import pandas as pd
+
+        with stage('dataframe'):
+            width = np.count_nonzero(self.time != self.time[:, -1:], axis=1) + 1
+            keep = np.arange(self.time.shape[1]) < width[:, None]
+            return pd.DataFrame({
+                'Date': np.repeat(self.dates, width),
+                'Time': self.time[keep],
+                'Irradiance': self.irradiance[keep],
+                'Power': self.power[keep],
+            })
+
+
+def orientation_sweep(latitude, longitude, betas, gammas, start, end, chain=None, gamma_chunk=32, progress=None,
+                      shading=None, cache=RESULT_CACHE):
+    """Energy (Wh) of every (β, γ) pair over a date range, scored after the power chain.
+
+    Returns (energy, best_beta, best_gamma) where energy has shape
+    (len(betas), len(gammas)). The sunrise/sunset window depends on β, so the
+    sun position is computed once per tilt and broadcast over all azimuths,
+    using cos(γ - ψ) = cos γ cos ψ + sin γ sin ψ. Tilts without a sunrise on
+    some day of the range score NaN. `progress(fraction)` is called after
+    every tilt. A `shading` profile depends on the sun position only, so it
+    scales the per-timestep terms once per tilt. Results are kept in `cache`
+    (None to always recompute).
+    """
+    chain = chain or PowerChain()
+    betas = np.atleast_1d(np.asarray(betas, dtype=float))
+    gammas = np.atleast_1d(np.asarray(gammas, dtype=float))
+    if cache is None:
+        return _orientation_sweep(latitude, longitude, betas, gammas, start, end, chain, gamma_chunk, progress, shading)
+
+    inputs = {
+        'site': [latitude, longitude], 'betas': betas.tolist(), 'gammas': gammas.tolist(),
+        'start': start, 'end': end, 'chain': vars(chain), 'time_step': TIME_STEP,
+        'shading': shading.digest if shading is not None else None,
+    }
+    result = cache.fetch('orientation_sweep', inputs, lambda: dict(zip(
+        ('energy', 'best_beta', 'best_gamma'),
+        _orientation_sweep(latitude, longitude, betas, gammas, start, end, chain, gamma_chunk, progress, shading))))
+    return result['energy'], result['best_beta'][()], result['best_gamma'][()]
+
+
+def _orientation_sweep(latitude, longitude, betas, gammas, start, end, chain, gamma_chunk, progress, shading=None):
+    cos_gamma = np.cos(np.radians(gammas))[:, None]
+    sin_gamma = np.sin(np.radians(gammas))[:, None]
+
+    energy = np.full((betas.size, gammas.size), np.nan)
+    for i, beta in enumerate(betas):
+        simulator = PVSystemSimulator(latitude, longitude, beta, gammas[0])
+        try:
+            with stage('sun_position'):
+                _, time, alpha, psi, ion, *azimuth = simulator.range_sun_position(start, end, azimuth=shading is not None)
+        except ValueError:
+            continue
+        weights = trapezoid_weights(time).ravel()
+        # Power chain scale (and shading) folded into the per-timestep terms
+        scale = chain.scale * ion
+        if shading is not None:
+            scale = scale * shading.factor(alpha, azimuth[0])
+        horizontal = (scale * np.cos(np.radians(alpha)) * np.sin(np.radians(beta))).ravel()
+        north = horizontal * np.cos(np.radians(psi)).ravel()
+        east = horizontal * np.sin(np.radians(psi)).ravel()
+        vertical = (scale * np.sin(np.radians(alpha)) * np.cos(np.radians(beta))).ravel()
+
+        with stage('sweep_scoring'):
+            for j in range(0, gammas.size, gamma_chunk):
+                block = slice(j, j + gamma_chunk)
+                power = np.multiply(cos_gamma[block], north)
+                power += sin_gamma[block] * east
+                power += vertical
+                np.clip(power, 0, chain.limit, out=power)
+                energy[i, block] = power @ weights
+        if progress is not None:
+            progress((i + 1) / betas.size)
+
+    if np.all(np.isnan(energy)):
+        raise ValueError("No tilt in the sweep has a sunrise on every day of the range.")
+    best_i, best_j = np.unravel_index(np.nanargmax(energy), energy.shape)
+    return energy, betas[best_i], gammas[best_j]
+
+
+
+class MeasuredData:
+    """Measured plant data as a day-indexed columnar store.
+
+    Rows are sorted by timestamp. Day i of ``days`` spans rows
+    ``offsets[i]:offsets[i + 1]``, so a day lookup is a binary search
+    instead of a scan over the whole sheet. ``power`` is in kW and
+    ``irradiance`` in W/m², as in the workbook; missing columns are NaN.
+    """
+
+    _arrays = ('timestamps', 'hour', 'power', 'irradiance', 'days', 'offsets')
+
+    def __init__(self, timestamps, hour, power, irradiance, days, offsets, has_power=True, has_irradiance=True):
+        self.timestamps = timestamps  # datetime64[ns]
+        self.hour = hour  # hour + minute / 60, as used for plotting and integration
+        self.power = power
+        self.irradiance = irradiance
+        self.days = days  # datetime64[D], unique and sorted
+        self.offsets = offsets
+        self.has_power = has_power
+        self.has_irradiance = has_irradiance
+        self.day_index = np.repeat(np.arange(days.size), np.diff(offsets))
+        self._power_energy = None
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build the store from a DataFrame with 'date', 'power' and 'irradiance' columns."""
+        count('ingested_rows', len(df))
+        with stage('ingest_parse'):
+            return cls._from_frame(df)
+
+    @classmethod
+    def _from_frame(cls, df):
+        import pandas as pd
+
+        df.columns = df.columns.str.strip().str.lower()  # normalize headers
+        timestamps = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+        has_power = 'power' in df.columns
+        has_irradiance = 'irradiance' in df.columns
+        nan_column = np.full(len(df), np.nan)
+        power = pd.to_numeric(df['power'], errors='coerce').to_numpy(dtype=float) if has_power else nan_column
+        irradiance = pd.to_numeric(df['irradiance'], errors='coerce').to_numpy(dtype=float) if has_irradiance else nan_column
+
+        valid = ~np.isnat(timestamps)
+        order = np.argsort(timestamps[valid], kind='stable')
+        timestamps = timestamps[valid][order]
+        power = power[valid][order]
+        irradiance = irradiance[valid][order]
+
+        day_of = timestamps.astype('datetime64[D]')
+        minutes = (timestamps - day_of).astype('timedelta64[m]').astype(int)
+        hour = minutes // 60 + (minutes % 60) / 60
+        days, starts = np.unique(day_of, return_index=True)
+        offsets = np.append(starts, timestamps.size)
+        return cls(timestamps, hour, power, irradiance, days, offsets, has_power, has_irradiance)
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Parse an .xlsx (or .csv) measurement file."""
+        import pandas as pd
+
+        with stage('ingest_read'):
+            if file_path.lower().endswith('.csv'):
+                df = pd.read_csv(file_path)
+            else:
+                df = pd.read_excel(file_path)
+        return cls.from_frame(df)
+
+    def save(self, directory):
+        """Write the arrays as .npy files so they can be memory-mapped back."""
+        os.makedirs(directory, exist_ok=True)
+        for name in self._arrays:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, has_power=True, has_irradiance=True):
+        """Memory-map a store written by save()."""
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in cls._arrays]
+        return cls(*arrays, has_power=has_power, has_irradiance=has_irradiance)
+
+    def day_slice(self, day):
+        """Row slice of one day (empty if the day has no data)."""
+        day = np.datetime64(day, 'D')
+        i = np.searchsorted(self.days, day)
+        if i < self.days.size and self.days[i] == day:
+            return slice(self.offsets[i], self.offsets[i + 1])
+        return slice(0, 0)
+
+    def day_arrays(self, day):
+        """Return (hour, power, irradiance) for one day."""
+        rows = self.day_slice(day)
+        return self.hour[rows], self.power[rows], self.irradiance[rows]
+
+    def daily_power_energy(self):
+        """daily_energy of the measured power in W, computed once per store."""
+        if self._power_energy is None:
+            self._power_energy = self.daily_energy(self.power * 1e3)  # from kW to W
+        return self._power_energy
+
+    def daily_energy(self, values):
+        """Trapezoid integral of `values` over hour for every day, skipping NaN samples.
+
+        Returns (energy, samples) aligned with ``days``; samples is the number
+        of non-NaN rows that went into each day.
+        """
+        with stage('integrate'):
+            keep = np.isfinite(values)
+            hour = self.hour[keep]
+            values = np.asarray(values)[keep]
+            day_index = self.day_index[keep]
+
+            same_day = day_index[1:] == day_index[:-1]
+            areas = np.where(same_day, np.diff(hour) * (values[1:] + values[:-1]) / 2, 0)
+            energy = np.bincount(day_index[1:], weights=areas, minlength=self.days.size)
+            samples = np.bincount(day_index, minlength=self.days.size)
+        return energy, samples
+
+
+def _file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_measured_from_disk(file_path, cache_dir):
+    """Parse `file_path` once and keep a memory-mappable copy under `cache_dir`.
+
+    Copies are content-addressed: ``measured/<sha256>/`` holds the arrays of
+    one file content, and ``measured/<sha1 of the path>.json`` points the
+    path at its current content, with the mtime and size it was hashed at.
+    The file is rehashed only when those change. A copy is written to a
+    temporary directory, renamed into place and never rewritten, so stores
+    still memory-mapped from an older version of the file (in other
+    threads or processes) keep their data.
+    """
+    root = os.path.join(cache_dir, 'measured')
+    pointer_path = os.path.join(root, hashlib.sha1(file_path.encode('utf-8')).hexdigest() + '.json')
+    stat = os.stat(file_path)
+    signature = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    pointer = None
+    try:
+        with open(pointer_path) as f:
+            pointer = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if pointer is not None and pointer.get('signature') == signature:
+        sha256 = pointer['sha256']
+    else:
+        sha256 = _file_digest(file_path)
+
+    entry = os.path.join(root, sha256)
+    measured = _load_measured_entry(entry)
+    if measured is None:
+        measured = MeasuredData.from_file(file_path)
+        _store_measured_entry(entry, measured)
+
+    if pointer is None or pointer.get('signature') != signature or pointer.get('sha256') != sha256:
+        try:
+            _write_json(pointer_path, {'file': file_path, 'signature': signature, 'sha256': sha256})
+        except OSError:
+            pass  # The cache is an optimisation only
+        if pointer is not None and pointer.get('sha256') not in (None, sha256):
+            _prune_measured_entry(root, pointer['sha256'])
+    return measured
+
+
+def _load_measured_entry(entry):
+    """Memory-map the copy in `entry`, or None if there is no complete copy."""
+    try:
+        with open(os.path.join(entry, 'meta.json')) as f:
+            meta = json.load(f)
+        with stage('ingest_cache_load'):
+            return MeasuredData.load(entry, meta['has_power'], meta['has_irradiance'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _store_measured_entry(entry, measured):
+    """Write a copy to a temporary directory and rename it to `entry`; an existing entry is kept."""
+    tmp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        measured.save(tmp_path)
+        _write_json(os.path.join(tmp_path, 'meta.json'),
+                    {'has_power': measured.has_power, 'has_irradiance': measured.has_irradiance})
+        os.replace(tmp_path, entry)
+    except OSError:
+        # No cache directory, or another thread or process stored the same content first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _prune_measured_entry(root, sha256):
+    """Delete the copy of a content no path points at any more.
+
+    Stores that still map it keep reading it on POSIX; where an open file
+    cannot be deleted (Windows) the copy is left in place.
+    """
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(root, name)) as f:
+                    if json.load(f).get('sha256') == sha256:
+                        return
+            except (OSError, ValueError):
+                continue
+    shutil.rmtree(os.path.join(root, sha256), ignore_errors=True)
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=4)
+def _load_measured_cached(file_path, mtime_ns, size, cache_dir):
+    if cache_dir is None:
+        return MeasuredData.from_file(file_path)
+    return _load_measured_from_disk(file_path, cache_dir)
+
+
+def load_measured(file_path, cache_dir=CACHE_DIR):
+    """Load a measurement workbook as MeasuredData, parsing it at most once.
+
+    Kept in memory per (path, mtime, size) and, unless `cache_dir` is None,
+    persisted there for memory-mapped re-opens in later sessions.
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    return _load_measured_cached(file_path, stat.st_mtime_ns, stat.st_size, cache_dir)
+
+
+def erbs_diffuse_fraction(kt):
+    """Diffuse fraction of global horizontal irradiance from the clearness index (Erbs correlation)."""
+    kt = np.asarray(kt, dtype=float)
+    middle = 0.9511 - 0.1604 * kt + 4.388 * kt ** 2 - 16.638 * kt ** 3 + 12.336 * kt ** 4
+    return np.where(kt <= 0.22, 1 - 0.09 * kt, np.where(kt <= 0.8, middle, 0.165))
+
+
+def transpose_to_plane(simulator, timestamps, ghi, albedo=0.2):
+    """Plane-of-array irradiance (W/m²) at the simulator's β/γ from global horizontal irradiance.
+
+    `timestamps` are local clock times, as in the measurement files. The sun
+    position of every sample comes from the per-site tables and formulas of
+    the simulation (sun_position_from), vectorized over all samples. GHI is
+    split into beam and diffuse with the Erbs correlation, then recombined
+    on the plane with an isotropic sky and ground reflection of `albedo`.
+    """
+    timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+    ghi = np.maximum(np.asarray(ghi, dtype=float), 0)  # NaN stays NaN
+    with stage('transposition'), np.errstate(divide='ignore', invalid='ignore'):
+        day_of = timestamps.astype('datetime64[D]')
+        years = day_of.astype('datetime64[Y]')
+        days = (day_of - years).astype(int) + 1
+        years = years.astype(int) + 1970
+        # Back from local clock time to solar standard time
+        hour = (timestamps - day_of).astype('timedelta64[s]').astype(float) / 3600 - simulator.dst_shift(days)
+
+        alpha = np.empty(ghi.shape)
+        psi = np.empty(ghi.shape)
+        ion = np.empty(ghi.shape)
+        for year in np.unique(years):
+            rows = years == year
+            geometry = site_geometry(simulator.latitude, simulator.longitude, int(year))
+            i = days[rows] - 1
+            alpha[rows], psi[rows] = simulator.sun_position_from(
+                geometry.declination[i], geometry.solar_noon[i], geometry.time_correction[i] / 60, hour[rows])
+            ion[rows] = geometry.ion[i]
+
+        sin_alpha = np.sin(np.radians(alpha))
+        up = sin_alpha > 0.01  # Sun too low to split off a beam: all diffuse
+        kt = np.where(up, ghi / (ion * sin_alpha), 0)
+        diffuse = np.where(up, erbs_diffuse_fraction(np.clip(kt, 0, 1)) * ghi, ghi)
+        beam_normal = np.where(up, (ghi - diffuse) / sin_alpha, 0)
+
+        beta = np.radians(simulator.beta)
+        cos_incidence = simulator.module_irradiance(1, alpha, psi)
+        poa = beam_normal * cos_incidence + diffuse * (1 + np.cos(beta)) / 2 + ghi * albedo * (1 - np.cos(beta)) / 2
+    count('transposed_samples', ghi.size)
+    return poa
+
+
+def corrected_range_energy(dates, sim_daily_energies, measured, chain, irradiance=None):
+    """Compare simulated and measured energy over a range of days.
+
+    Days without measured power are skipped. Where the simulated day is off
+    by more than 10 %, its energy is replaced by the power chain applied to
+    the measured irradiance (or to `irradiance`, one value per measured row,
+    e.g. transposed from GHI). Returns (total corrected simulated energy,
+    total measured energy), both in Wh.
+    """
+    excel_energy, samples = measured.daily_power_energy()
+    i = np.clip(np.searchsorted(measured.days, dates), 0, max(measured.days.size - 1, 0))
+    present = (measured.days.size > 0) & (measured.days[i] == dates)
+    present &= samples[i] > 0
+    excel_daily = excel_energy[i][present]
+    sim_daily = np.asarray(sim_daily_energies)[present]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_error_percent = ((sim_daily - excel_daily) / excel_daily) * 100
+    correct = np.abs(daily_error_percent) > 10
+
+    if np.any(correct):
+        # Correct using Excel irradiance
+        if not measured.has_irradiance:
+            raise ValueError("Missing 'irradiance' column in Excel file!")
+        corrected_energy, _ = measured.daily_energy(chain.apply(measured.irradiance if irradiance is None else irradiance))
+        sim_daily = np.where(correct, corrected_energy[i][present], sim_daily)
+
+    return sim_daily.sum(), excel_daily.sum()
+
+
+def align_to_measured(dates, time, values, measured):
+    """Simulated (days × timesteps) values at every measured timestamp that falls on one of `dates`.
+
+    All days are laid end to end, each offset by 48 h, so the whole range is
+    one np.interp. Returns (rows, day, aligned): the measured row indices,
+    the index into `dates` of every row, and the interpolated values (0
+    outside the simulated sunrise-sunset window).
+    """
+    day_of = measured.timestamps.astype('datetime64[D]')
+    day = np.clip(np.searchsorted(dates, day_of), 0, dates.size - 1)
+    rows = np.flatnonzero(dates[day] == day_of)
+    day = day[rows]
+    hour = measured.hour[rows]
+    offsets = np.arange(dates.size)[:, None] * 48
+    aligned = np.interp(day * 48 + hour, (offsets + time).ravel(), values.ravel())
+    aligned[(hour < time[day, 0]) | (hour > time[day, -1])] = 0  # outside the simulated window
+    return rows, day, aligned
+
+
+def error_metrics(simulated, measured, group=None, n_groups=1):
+    """Error metrics of simulated against measured samples, per group in one pass.
+
+    `group` is each sample's group index (default: all in group 0); samples
+    where either value is NaN are skipped. Returns a dict of arrays with one
+    value per group: samples, rmse, mbe (simulated - measured), mae, r2 and
+    nrmse_percent (RMSE relative to the mean measured value).
+    """
+    keep = np.isfinite(simulated) & np.isfinite(measured)
+    group = np.zeros(np.count_nonzero(keep), dtype=int) if group is None else np.asarray(group)[keep]
+    simulated = np.asarray(simulated)[keep]
+    measured = np.asarray(measured)[keep]
+    error = simulated - measured
+
+    def total(weights=None):
+        return np.bincount(group, weights, minlength=n_groups)
+
+    samples = total()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total(measured) / samples
+        spread = measured - mean[group]
+        squared = total(error * error)
+        rmse = np.sqrt(squared / samples)
+        return {
+            'samples': samples,
+            'rmse': rmse,
+            'mbe': total(error) / samples,
+            'mae': total(np.abs(error)) / samples,
+            'r2': 1 - squared / total(spread * spread),
+            'nrmse_percent': 100 * rmse / mean,
+        }
+
+
+# Measurement files larger than this are compared by streaming instead of loading
+STREAM_THRESHOLD_BYTES = 200 * 1024 * 1024
+
+
+def iter_measurement_chunks(file_path, chunksize=100_000):
+    """Yield DataFrame chunks of a .csv or .xlsx measurement file without loading it whole."""
+    import pandas as pd
+
+    if file_path.lower().endswith('.csv'):
+        yield from pd.read_csv(file_path, chunksize=chunksize)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name) for name in next(rows, ())]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def _integrate_valid(hour, values):
+    """Trapezoid integral of values over hour, skipping NaN samples. Returns (energy, samples)."""
+    keep = np.isfinite(values)
+    if not np.any(keep):
+        return 0.0, 0
+    return compute_surface_under_plot(hour[keep], values[keep]), np.count_nonzero(keep)
+
+
+def stream_range_comparison(file_path, simulator, start, end, chain, chunksize=100_000, progress=None, ghi_albedo=None,
+                            method="numeric"):
+    """Stream per-day simulated vs measured energy from a measurement file of any size.
+
+    Rows are read in chunks; only the day currently being read is held in
+    memory, carried across chunk boundaries until the next day starts. The
+    file must be grouped by day, in ascending or descending order. The
+    simulated daily energies come from PVSystemSimulator.range_energy with
+    `method`, as in the in-memory comparison. Yields
+    (day, simulated, measured, corrected) energies in Wh for every day in
+    [start, end] with measured power, where corrected applies the same >10 %
+    fallback to measured irradiance as corrected_range_energy. With
+    `ghi_albedo` the irradiance column is horizontal and is transposed to
+    the module plane first (transpose_to_plane with that albedo).
+    """
+    import pandas as pd
+
+    start = np.datetime64(start, 'D')
+    end = np.datetime64(end, 'D')
+    _, sim_daily_energies = simulator.range_energy(start, end, chain, method)
+    current_day = None
+    direction = 0  # +1 for ascending days, -1 for descending, once two days were read
+    buffer = []
+    flushed = [0]
+    total_days = int((end - start).astype(int)) + 1
+
+    def flush():
+        timestamps, power, irradiance = (np.concatenate([part[i] for part in buffer]) for i in range(3))
+        order = np.argsort(timestamps, kind='stable')
+        minutes = (timestamps[order] - current_day).astype('timedelta64[m]').astype(int)
+        hour = minutes // 60 + (minutes % 60) / 60
+        excel_energy, samples = _integrate_valid(hour, power[order] * 1e3)  # from kW to W
+        if samples == 0:
+            return None
+
+        day = current_day.astype(object)
+        sim_energy = sim_daily_energies[(current_day - start).astype(int)]
+        corrected = sim_energy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            daily_error_percent = ((sim_energy - excel_energy) / excel_energy) * 100
+        if abs(daily_error_percent) > 10:
+            # Correct using Excel irradiance
+            if not has_irradiance:
+                raise ValueError("Missing 'irradiance' column in Excel file!")
+            day_irradiance = irradiance[order]
+            if ghi_albedo is not None:
+                day_irradiance = transpose_to_plane(simulator, timestamps[order], day_irradiance, ghi_albedo)
+            corrected, _ = _integrate_valid(hour, chain.apply(day_irradiance))
+        flushed[0] += 1
+        if progress is not None:
+            progress(min(flushed[0] / total_days, 1.0))
+        return day, sim_energy, excel_energy, corrected
+
+    for df in iter_measurement_chunks(file_path, chunksize):
+        df.columns = df.columns.str.strip().str.lower()  # normalize headers
+        timestamps = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+        nan_column = np.full(len(df), np.nan)
+        has_irradiance = 'irradiance' in df.columns
+        power = pd.to_numeric(df['power'], errors='coerce').to_numpy(dtype=float) if 'power' in df.columns else nan_column
+        irradiance = pd.to_numeric(df['irradiance'], errors='coerce').to_numpy(dtype=float) if has_irradiance else nan_column
+
+        valid = ~np.isnat(timestamps)
+        timestamps, power, irradiance = timestamps[valid], power[valid], irradiance[valid]
+        day_of = timestamps.astype('datetime64[D]')
+        in_range = (day_of >= start) & (day_of <= end)
+
+        # Split the chunk into runs of consecutive rows of the same day
+        bounds = np.flatnonzero(day_of[1:] != day_of[:-1]) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, day_of.size]):
+            if lo == hi:
+                continue
+            day = day_of[lo]
+            if day != current_day:
+                if current_day is not None:
+                    result = flush() if buffer else None
+                    if result is not None:
+                        yield result
+                    # A day behind the cursor was either read before or is out of order
+                    step = 1 if day > current_day else -1
+                    if direction == 0:
+                        direction = step
+                    elif step != direction:
+                        raise ValueError(f"Measurement file is not grouped by day in ascending or descending order "
+                                         f"({day} after {current_day}).")
+                current_day, buffer = day, []
+            if in_range[lo]:
+                buffer.append((timestamps[lo:hi], power[lo:hi], irradiance[lo:hi]))
+
+    if buffer:
+        result = flush()
+        if result is not None:
+            yield result
+
+
+# Default parameters, shared by the GUI fields and parameter files
+DEFAULT_CONFIG = {
+    'latitude': 31.7187,
+    'longitude': 34.7287,
+    'beta': 16,
+    'gamma': 180,
+    'surface_area': 1.0,
+    'num_modules': 1,
+    'clip_threshold': 120000000,
+    'alt_clip_threshold': 8500000,
+    'irradiance_losses': 30,
+    'system_losses': 2,
+    'efficiency_losses': 80,
+}
+
+# Parameter-file keys of the site's horizon profile and near-shading mask (see ShadingProfile)
+_SHADING_KEYS = ('horizon_file', 'near_shading_file')
+
+# Parameter-file keys besides the DEFAULT_CONFIG parameters
+_RUN_KEYS = ('start', 'end', 'date', 'measured_file', 'method', 'measured_irradiance', 'albedo',
+             'uncertainty', 'lifetime') + _SHADING_KEYS
+
+
+def load_config(file_path):
+    """Read simulation parameters from a JSON or YAML file, filling in the defaults."""
+    with open(file_path) as f:
+        if file_path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading YAML parameter files requires PyYAML (pip install pyyaml).")
+            config = yaml.safe_load(f) or {}
+        else:
+            config = json.load(f)
+
+    unknown = set(config) - set(DEFAULT_CONFIG) - set(_RUN_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown parameters in {file_path}: {', '.join(sorted(unknown))}")
+    return {**DEFAULT_CONFIG, **config}
+
+
+def parse_date(value):
+    """Accept a date, an ISO 'yyyy-mm-dd' string or the GUI's 'dd/mm/yyyy'."""
+    if isinstance(value, date):
+        return value
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date '{value}'. Please use yyyy-mm-dd or dd/mm/yyyy.")
+
+
+def power_chain_from_config(config):
+    """Build the PowerChain of a parameter set."""
+    return PowerChain(
+        surface_area=config['surface_area'],
+        num_modules=config['num_modules'],
+        irradiance_losses=config['irradiance_losses'],
+        system_losses=config['system_losses'],
+        efficiency_losses=config['efficiency_losses'],
+        clip_threshold=config['clip_threshold'],
+        alt_clip_threshold=config['alt_clip_threshold'],
+    )
+
+
+def simulator_from_config(config):
+    shading = load_shading(config.get('horizon_file'), config.get('near_shading_file'))
+    return PVSystemSimulator(config['latitude'], config['longitude'], config['beta'], config['gamma'], shading)
+
+
+def simulate_power_day(config, day):
+    """Simulate one day of a parameter set. Returns (time, irradiance, power) arrays."""
+    day = parse_date(day)
+    chain = power_chain_from_config(config)
+    time, irradiance = simulator_from_config(config).simulate_day_arrays(
+        day.year, day.month, day.day, mult=chain.irr_mult)
+    return time, irradiance, chain.apply(irradiance)
+
+
+def _shading_digests(config):
+    """Content digests of the config's shading files (None where there is none), for cache keys."""
+    return [measured_digest(config[name]) if config.get(name) else None for name in _SHADING_KEYS]
+
+
+def date_range_energy(config, start, end, measured_file=None, progress=None, cache=RESULT_CACHE):
+    """Energy of a parameter set over a date range, optionally compared with measured data.
+
+    Returns a dict with the simulated energy in kWh and, when `measured_file`
+    is given, the corrected simulated energy, the measured energy and the
+    error after correction. The config's 'method' ('numeric' or 'analytic',
+    see PVSystemSimulator.range_energy) selects the daily integration, and
+    'measured_irradiance' says whether the measured irradiance is on the
+    module 'plane' (default) or global horizontal ('ghi', transposed with
+    the config's 'albedo'). `progress(fraction)` is called between stages.
+    Results are kept in `cache` (None to always recompute), keyed by the
+    parameters, the dates and the content of the measured and shading files.
+    """
+    start = parse_date(start)
+    end = parse_date(end)
+    if end < start:
+        raise ValueError("End date must be after or equal to start date.")
+    if cache is None:
+        return _date_range_energy(config, start, end, measured_file, progress)
+
+    inputs = {
+        'config': {name: config[name] for name in DEFAULT_CONFIG},
+        'method': config.get('method', 'numeric'),
+        'measured_irradiance': config.get('measured_irradiance', 'plane'),
+        'albedo': config.get('albedo', 0.2),
+        'start': start, 'end': end, 'time_step': TIME_STEP,
+        'measured': measured_digest(measured_file) if measured_file is not None else None,
+        'shading': _shading_digests(config),
+    }
+    result = cache.fetch('date_range_energy', inputs, lambda: {
+        name: np.asarray(value) for name, value in _date_range_energy(config, start, end, measured_file, progress).items()})
+    return {name: value.item() for name, value in result.items()}
+
+
+def _date_range_energy(config, start, end, measured_file, progress):
+    simulator = simulator_from_config(config)
+    chain = power_chain_from_config(config)
+    dates, sim_daily_energies = simulator.range_energy(start, end, chain, config.get('method', 'numeric'))
+    result = {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'simulated_kwh': float(sim_daily_energies.sum()) / 1000,
+    }
+    if measured_file is None:
+        return result
+    if progress is not None:
+        progress(0.1)
+
+    measured_irradiance = config.get('measured_irradiance', 'plane')
+    if measured_irradiance not in ('plane', 'ghi'):
+        raise ValueError(f"Unknown measured_irradiance '{measured_irradiance}'. Please use 'plane' or 'ghi'.")
+    ghi_albedo = config.get('albedo', 0.2) if measured_irradiance == 'ghi' else None
+
+    if os.path.getsize(measured_file) > STREAM_THRESHOLD_BYTES:
+        # Very large exports: stream day by day in bounded memory
+        total_sim_energy_corrected = total_excel_energy = 0
+        stream_progress = progress and (lambda fraction: progress(0.1 + 0.9 * fraction))
+        for _, _, excel_daily_energy, sim_daily_energy in stream_range_comparison(
+                measured_file, simulator, start, end, chain, progress=stream_progress, ghi_albedo=ghi_albedo,
+                method=config.get('method', 'numeric')):
+            total_excel_energy += excel_daily_energy
+            total_sim_energy_corrected += sim_daily_energy
+    else:
+        measured = load_measured(measured_file)
+        plane_irradiance = None
+        if ghi_albedo is not None:
+            plane_irradiance = transpose_to_plane(simulator, measured.timestamps, measured.irradiance, ghi_albedo)
+        if progress is not None:
+            progress(0.9)
+        total_sim_energy_corrected, total_excel_energy = corrected_range_energy(
+            dates, sim_daily_energies, measured, chain, plane_irradiance)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent_error = ((total_sim_energy_corrected - total_excel_energy) / np.float64(total_excel_energy)) * 100
+    result.update({
+        'corrected_simulated_kwh': float(total_sim_energy_corrected) / 1000,
+        'measured_kwh': float(total_excel_energy) / 1000,
+        'error_percent': float(percent_error),
+    })
+    return result
+
+
+class EnergyIndex:
+    """Daily simulated and measured energy of one parameter set, with prefix sums.
+
+    ``dates`` is a contiguous datetime64[D] range; ``simulated`` and
+    ``measured`` hold the energy of every day in Wh (measured is NaN on days
+    without measured power). Running sums of the daily columns make the
+    total, or the simulated-vs-measured error, of any date range two
+    lookups. extend() simulates only the days not covered yet and
+    add_measured() merges newly arrived measured days; both re-accumulate
+    from the first changed day only. ``shading`` holds the content digests
+    of the config's shading files, so matches() notices edited files.
+    """
+
+    _columns = ('simulated', 'measured', 'simulated_measured', 'measured_days')
+
+    def __init__(self, config, dates, simulated, measured, shading=None):
+        self.config = config
+        self.shading = _shading_digests(config) if shading is None else shading
+        self.dates = dates
+        self.simulated = simulated
+        self.measured = measured
+        self._prefix = {name: np.zeros(1) for name in self._columns}
+        self._accumulate(0)
+
+    @classmethod
+    def build(cls, config, start, end, measured_file=None, progress=None, cache=RESULT_CACHE):
+        """Simulate `start` to `end` (see extend) and, optionally, merge the measured days of a file."""
+        index = cls(config, np.array([], dtype='datetime64[D]'), np.empty(0), np.empty(0))
+        index.extend(start, end, progress, cache)
+        if measured_file is not None:
+            index.add_measured(load_measured(measured_file))
+        return index
+
+    def matches(self, config):
+        """Whether the index was built with `config` and the current content of its shading files."""
+        return self.config == config and self.shading == _shading_digests(config)
+
+    def _simulate(self, ranges, progress, cache):
+        """Daily energy of every (first, last) day range, simulated a calendar year at a time."""
+        simulator = simulator_from_config(self.config)
+        chain = power_chain_from_config(self.config)
+        method = self.config.get('method', 'numeric')
+        days = sum(int((last - first).astype(int)) + 1 for first, last in ranges)
+        done = 0
+        energies = []
+        for first, last in ranges:
+            years = []
+            while first <= last:
+                stop = min(last, (first.astype('datetime64[Y]') + 1).astype('datetime64[D]') - 1)
+                compute = lambda first=first, stop=stop: {
+                    'energy': simulator.range_energy(first, stop, chain, method)[1]}
+                if cache is None:
+                    years.append(compute()['energy'])
+                else:
+                    inputs = {'config': {name: self.config[name] for name in DEFAULT_CONFIG}, 'method': method,
+                              'shading': self.shading, 'start': first, 'end': stop, 'time_step': TIME_STEP}
+                    years.append(cache.fetch('daily_energy', inputs, compute)['energy'])
+                done += years[-1].size
+                if progress is not None:
+                    progress(done / days)
+                first = stop + 1
+            energies.append(np.concatenate(years))
+        return energies
+
+    def extend(self, start, end, progress=None, cache=RESULT_CACHE):
+        """Also cover `start` to `end`, simulating only the days not yet in the index.
+
+        The new days are simulated a calendar year at a time: each year is
+        kept in `cache` (None to always simulate) and `progress(fraction)`
+        is called after it, so a long extension can be followed and
+        cancelled. The index is only changed once every day is simulated.
+        """
+        start = np.datetime64(parse_date(start), 'D')
+        end = np.datetime64(parse_date(end), 'D')
+        if end < start:
+            raise ValueError("End date must be after or equal to start date.")
+        if self.dates.size == 0:
+            self.simulated = self._simulate([(start, end)], progress, cache)[0]
+            self.dates = np.arange(start, end + 1)
+            self.measured = np.full(self.dates.size, np.nan)
+            self._accumulate(0)
+            return
+
+        ranges = []
+        if start < self.dates[0]:
+            ranges.append((start, self.dates[0] - 1))
+        if end > self.dates[-1]:
+            ranges.append((self.dates[-1] + 1, end))
+        if not ranges:
+            return
+        changed = self.dates.size
+        for (first, last), energy in zip(ranges, self._simulate(ranges, progress, cache)):
+            added = np.arange(first, last + 1)
+            nan = np.full(added.size, np.nan)
+            if first < self.dates[0]:
+                self.simulated = np.concatenate([energy, self.simulated])
+                self.measured = np.concatenate([nan, self.measured])
+                self.dates = np.concatenate([added, self.dates])
+                changed = 0
+            else:
+                self.simulated = np.concatenate([self.simulated, energy])
+                self.measured = np.concatenate([self.measured, nan])
+                self.dates = np.concatenate([self.dates, added])
+        self._accumulate(changed)
+
+    def add_measured(self, measured):
+        """Merge the daily measured energy of a MeasuredData; its days replace earlier values."""
+        energy, samples = measured.daily_power_energy()
+        days = measured.days[samples > 0]
+        if days.size == 0:
+            return
+        self.extend(min(days[0], self.dates[0]) if self.dates.size else days[0],
+                    max(days[-1], self.dates[-1]) if self.dates.size else days[-1])
+        rows = (days - self.dates[0]).astype(int)
+        self.measured[rows] = energy[samples > 0]
+        self._accumulate(rows.min())
+
+    def _accumulate(self, first):
+        """Rebuild the running sums from day `first` on (prefix[i] is the sum of days before i)."""
+        measured = np.isfinite(self.measured[first:])
+        values = {
+            'simulated': self.simulated[first:],
+            'measured': np.where(measured, self.measured[first:], 0),
+            'simulated_measured': np.where(measured, self.simulated[first:], 0),  # simulated, on measured days only
+            'measured_days': measured.astype(float),
+        }
+        for name in self._columns:
+            prefix = np.empty(self.dates.size + 1)
+            prefix[:first + 1] = self._prefix[name][:first + 1]
+            np.cumsum(values[name], out=prefix[first + 1:])
+            prefix[first + 1:] += prefix[first]
+            self._prefix[name] = prefix
+
+    def _position(self, day):
+        i = int((np.datetime64(parse_date(day), 'D') - self.dates[0]).astype(int)) if self.dates.size else -1
+        if not 0 <= i < self.dates.size:
+            raise ValueError(f"{day} is outside the index. Please extend it to cover the date range first.")
+        return i
+
+    def _totals(self, first, stop):
+        """Sums of every column over days first..stop - 1 (arrays allowed) as a result dict."""
+        sums = {name: self._prefix[name][stop] - self._prefix[name][first] for name in self._columns}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error = (sums['simulated_measured'] - sums['measured']) / sums['measured'] * 100
+        return {
+            'days': stop - first,
+            'measured_days': np.rint(sums['measured_days']).astype(int),
+            'simulated_kwh': sums['simulated'] / 1000,
+            'measured_kwh': sums['measured'] / 1000,
+            'simulated_on_measured_days_kwh': sums['simulated_measured'] / 1000,
+            'error_percent': error,
+        }
+
+    def total(self, start, end):
+        """Energy and error from `start` to `end` (inclusive) in constant time.
+
+        The error compares the simulated with the measured energy over the
+        measured days of the range only (NaN without any).
+        """
+        first, last = self._position(start), self._position(end)
+        if last < first:
+            raise ValueError("End date must be after or equal to start date.")
+        totals = self._totals(first, last + 1)
+        return {'start': str(self.dates[first]), 'end': str(self.dates[last]),
+                **{name: value.item() if isinstance(value, np.generic) else value for name, value in totals.items()}}
+
+    def rollup(self, period='M'):
+        """Totals per calendar month ('M') or year ('Y') as a dict of columns."""
+        if period not in ('M', 'Y'):
+            raise ValueError(f"Unknown period '{period}'. Please use 'M' or 'Y'.")
+        periods, starts = np.unique(self.dates.astype(f'datetime64[{period}]'), return_index=True)
+        return {'period': periods, **self._totals(starts, np.append(starts[1:], self.dates.size))}
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, config=json.dumps(self.config), shading=json.dumps(self.shading), dates=self.dates,
+                     simulated=self.simulated, measured=self.measured)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            shading = json.loads(data['shading'].item()) if 'shading' in data.files else [None] * len(_SHADING_KEYS)
+            return cls(json.loads(data['config'].item()), data['dates'], data['simulated'], data['measured'], shading)
+
+
+def compare_range(config, start, end, measured_file, quantity='power', progress=None):
+    """Compare the simulation with every measured sample of a date range.
+
+    The simulated irradiance of the range is interpolated onto the measured
+    timestamps (align_to_measured) and, for 'power', passed through the power
+    chain; measured irradiance is transposed first if the config's
+    'measured_irradiance' is 'ghi'. Returns a dict with the overall error
+    metrics and 'daily' and 'monthly' tables: dicts of equal-length columns
+    with the date (or month), the error_metrics, and the simulated and
+    measured energy over the compared samples (Wh, or Wh/m² for irradiance).
+    """
+    if quantity not in ('power', 'irradiance'):
+        raise ValueError(f"Unknown quantity '{quantity}'. Please use 'power' or 'irradiance'.")
+    start = parse_date(start)
+    end = parse_date(end)
+    if end < start:
+        raise ValueError("End date must be after or equal to start date.")
+
+    simulator = simulator_from_config(config)
+    chain = power_chain_from_config(config)
+    dates, time, irradiance = simulator.simulate_range(start, end, mult=chain.irr_mult)
+    measured = load_measured(measured_file)
+    if not getattr(measured, 'has_' + quantity):
+        raise ValueError(f"Missing '{quantity}' column in Excel file!")
+    if progress is not None:
+        progress(0.3)
+
+    with stage('alignment'):
+        rows, day, simulated = align_to_measured(dates, time, irradiance, measured)
+        if quantity == 'power':
+            simulated = chain.apply(simulated)
+            observed = measured.power[rows] * 1e3  # from kW to W
+        elif config.get('measured_irradiance', 'plane') == 'ghi':
+            observed = transpose_to_plane(simulator, measured.timestamps[rows], measured.irradiance[rows],
+                                          config.get('albedo', 0.2))
+        else:
+            observed = measured.irradiance[rows]
+        if not np.any(np.isfinite(observed)):
+            raise ValueError(f"No measured {quantity} in the selected date range.")
+
+    with stage('metrics'):
+        overall = {name: values[0].item() for name, values in error_metrics(simulated, observed).items()}
+        daily = error_metrics(simulated, observed, day, dates.size)
+
+        # Energy over the samples that were compared, so both sides see the same gaps
+        compared = np.isfinite(simulated) & np.isfinite(observed)
+        energies = []
+        for values in (simulated, observed):
+            full = np.full(measured.hour.size, np.nan)
+            full[rows[compared]] = values[compared]
+            energy, _ = measured.daily_energy(full)
+            energies.append(energy[np.clip(np.searchsorted(measured.days, dates), 0, measured.days.size - 1)])
+        daily['simulated_wh'], daily['measured_wh'] = (np.where(daily['samples'] > 0, energy, 0) for energy in energies)
+
+        months, month_of_day = np.unique(dates.astype('datetime64[M]'), return_inverse=True)
+        monthly = error_metrics(simulated, observed, month_of_day[day], months.size)
+        for name in ('simulated_wh', 'measured_wh'):
+            monthly[name] = np.bincount(month_of_day, daily[name], minlength=months.size)
+
+    if progress is not None:
+        progress(0.9)
+    present = daily['samples'] > 0
+    return {
+        'quantity': quantity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        **overall,
+        'daily': {'date': dates[present], **{name: values[present] for name, values in daily.items()}},
+        'monthly': {'month': months[monthly['samples'] > 0],
+                    **{name: values[monthly['samples'] > 0] for name, values in monthly.items()}},
+    }
+
+
+def _clipped_sse(prefix, irradiance, scale, limit):
+    """Sum of squared errors of min(scale · I, limit) against P for many (scale, limit) pairs.
+
+    `irradiance` is sorted and `prefix` holds the prefix sums of I², I·P, P
+    and P² in that order, so every pair costs one binary search: samples
+    with I <= limit / scale are unclipped, the rest sit at the limit.
+    """
+    sum_ii, sum_ip, sum_p, sum_pp = prefix
+    n = irradiance.size
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unclipped = np.searchsorted(irradiance, limit / scale, side='right')
+    finite_limit = np.where(np.isfinite(limit), limit, 0)  # no clipped samples when the limit is inf
+    return (scale ** 2 * sum_ii[unclipped] - 2 * scale * sum_ip[unclipped] + sum_pp[n]
+            + (n - unclipped) * finite_limit ** 2 - 2 * finite_limit * (sum_p[n] - sum_p[unclipped]))
+
+
+def calibrate_losses(config, start, end, measured_file, fit_clip=False, absorb='system_losses', progress=None):
+    """Fit the losses (and optionally the clipping limit) to the measured power over a date range.
+
+    The raw irradiance of the range is simulated once and interpolated onto
+    the measured timestamps. The model is P = min(k · I, L): only the
+    product k of all loss and size factors is identifiable, so the fitted k
+    is expressed by adjusting the `absorb` loss parameter and keeping the
+    others; a result outside 0-100 % points at a wrong surface area or
+    module count, and is listed in 'warnings'. With `fit_clip` the effective
+    limit L is fitted too and, if it fits better than the config's limit,
+    written to alt_clip_threshold (raising clip_threshold to it if lower).
+    The least-squares fit is a grid search refined around the best point,
+    with every grid point evaluated in O(log n) on sorted prefix sums.
+    Returns a dict with the fitted config, scale, limit (and whether it was
+    fitted), RMSE before and after, and warnings.
+    """
+    if absorb not in ('irradiance_losses', 'system_losses', 'efficiency_losses'):
+        raise ValueError(f"Cannot fit '{absorb}'. Please use irradiance_losses, system_losses or efficiency_losses.")
+    start = parse_date(start)
+    end = parse_date(end)
+    if end < start:
+        raise ValueError("End date must be after or equal to start date.")
+
+    simulator = simulator_from_config(config)
+    chain = power_chain_from_config(config)
+    dates, time, irradiance = simulator.simulate_range(start, end)
+    measured = load_measured(measured_file)
+    if not measured.has_power:
+        raise ValueError("Missing 'power' column in Excel file!")
+    if progress is not None:
+        progress(0.3)
+
+    with stage('calibration'):
+        # Simulated irradiance at every measured timestamp
+        rows, _, sim = align_to_measured(dates, time, irradiance, measured)
+        power = measured.power[rows] * 1e3  # from kW to W
+        valid = np.isfinite(power)
+        sim, power = sim[valid], power[valid]
+        if power.size == 0:
+            raise ValueError("No measured power in the selected date range.")
+
+        # Normalize for well-conditioned prefix sums
+        sim_max = max(sim.max(), 1e-12)
+        power_max = max(np.abs(power).max(), 1e-12)
+        order = np.argsort(sim, kind='stable')
+        x = sim[order] / sim_max
+        y = power[order] / power_max
+        prefix = [np.concatenate(([0], np.cumsum(values))) for values in (x * x, x * y, y, y * y)]
+
+        def sse(scale, limit):
+            return _clipped_sse(prefix, x, scale, limit)
+
+        # Start from the unclipped least-squares scale
+        k0 = prefix[1][-1] / max(prefix[0][-1], 1e-300)
+        if k0 <= 0:
+            raise ValueError("Measured power does not follow the simulated irradiance in this range.")
+        current_limit = chain.limit / power_max
+
+        def zoom(grid, i):
+            return np.linspace(grid[max(i - 1, 0)], grid[min(i + 1, grid.size - 1)], 64)
+
+        scales = np.geomspace(k0 / 4, k0 * 20, 256)
+        limits = np.array([current_limit])
+        if fit_clip:
+            # Candidate limits from the typical to above the highest measured power, after
+            # the current limit, which is kept on a tie
+            low = np.median(y[y > 0]) if np.any(y > 0) else 0.01
+            limits = np.append(limits, np.linspace(low, 1.5, 256))
+        for _ in range(4):
+            errors = sse(scales[:, None], limits[None, :])
+            i, j = np.unravel_index(np.nanargmin(errors), errors.shape)
+            best_scale, best_limit = scales[i], limits[j]
+            scales = zoom(scales, i)
+            if j > 0:
+                limits = np.append(current_limit, zoom(limits[1:], j - 1))
+        limit_fitted = bool(best_limit != current_limit)
+
+        n = x.size
+        rmse_before = np.sqrt(max(sse(chain.scale * sim_max / power_max, current_limit), 0) / n) * power_max
+        rmse_after = np.sqrt(max(sse(best_scale, best_limit), 0) / n) * power_max
+    if progress is not None:
+        progress(0.9)
+
+    scale = best_scale * power_max / sim_max
+    fitted = dict(config)
+    # Put the whole correction into the `absorb` loss: k = irr · area · n · eff · power
+    factors = {'irradiance_losses': chain.irr_mult, 'system_losses': chain.power_mult,
+               'efficiency_losses': chain.efficiency_mult}
+    others = chain.surface_area * chain.num_modules * np.prod([v for key, v in factors.items() if key != absorb])
+    fitted[absorb] = float(100 * (1 - scale / others))
+    limit = chain.limit
+    if limit_fitted:
+        limit = best_limit * power_max
+        fitted['alt_clip_threshold'] = float(limit)
+        fitted['clip_threshold'] = float(max(config['clip_threshold'], limit))
+    notes = []
+    if not 0 <= fitted[absorb] < 100:
+        notes.append(f"The fitted {absorb.replace('_', ' ')} of {fitted[absorb]:.1f}% are outside 0-100%. "
+                     f"Please check the surface area and the number of modules.")
+    return {
+        'config': fitted,
+        'scale': float(scale),
+        'limit': float(limit),
+        'limit_fitted': limit_fitted,
+        'samples': int(n),
+        'rmse_before_w': float(rmse_before),
+        'rmse_after_w': float(rmse_after),
+        'warnings': notes,
+    }
+
+
+def _clipped_energy(time, irradiance):
+    """(energy, peak): energy(scale, limit) is the trapezoid energy of min(scale · I, limit) over
+    (days × timesteps) samples, peak the highest irradiance sample.
+
+    The samples are sorted once with prefix sums of their weights and of
+    weight × irradiance, so every (scale, limit) pair, or arrays of them,
+    costs one binary search: samples with I <= limit / scale are unclipped,
+    the rest sit at the limit.
+    """
+    weights = trapezoid_weights(time).ravel()
+    irradiance = irradiance.ravel()
+    valid = np.isfinite(weights) & np.isfinite(irradiance)
+    order = np.argsort(irradiance[valid], kind='stable')
+    irradiance = irradiance[valid][order]
+    weights = weights[valid][order]
+    sum_wi = np.concatenate(([0], np.cumsum(weights * irradiance)))
+    sum_w = np.concatenate(([0], np.cumsum(weights)))
+
+    def energy(scale, limit):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            unclipped = np.searchsorted(irradiance, limit / scale, side='right')
+            clipped = np.where(np.isfinite(limit), limit * (sum_w[-1] - sum_w[unclipped]), 0)
+        return scale * sum_wi[unclipped] + clipped
+
+    return energy, (irradiance[-1] if irradiance.size else 0.0)
+
+
+def clipping_curve(config, start, end, limit='alt_clip_threshold', limits=None, n_limits=200, loss_targets=(1, 3, 5)):
+    """Energy over a date range as a function of one clipping limit, for inverter or export sizing.
+
+    `limit` is the parameter being sized ('clip_threshold' for the DC limit
+    or 'alt_clip_threshold' for the AC export limit); the other keeps its
+    config value. The candidate `limits` (W) default to `n_limits` values
+    from 0 to the unclipped peak power. The irradiance is simulated once and
+    the whole curve is evaluated from its sorted samples (_clipped_energy).
+    Returns a dict with the curve (limits_w, energy_kwh, loss_kwh,
+    loss_percent against the unclipped energy), the knee (the limit farthest
+    above the straight line from zero to the peak on the normalised curve,
+    where extra capacity stops paying off), the smallest limit for each
+    clipping loss in `loss_targets` (%) and the energy at the configured
+    limit.
+    """
+    if limit not in ('clip_threshold', 'alt_clip_threshold'):
+        raise ValueError(f"Cannot size '{limit}'. Please use clip_threshold or alt_clip_threshold.")
+    start = parse_date(start)
+    end = parse_date(end)
+    if end < start:
+        raise ValueError("End date must be after or equal to start date.")
+
+    chain = power_chain_from_config(config)
+    _, time, irradiance = simulator_from_config(config).simulate_range(start, end)
+    with stage('clipping_curve'):
+        energy, peak = _clipped_energy(time, irradiance)
+        peak *= chain.scale
+        if limits is None:
+            limits = np.linspace(0, peak, n_limits)
+        limits = np.asarray(limits, dtype=float)
+        other = config['alt_clip_threshold' if limit == 'clip_threshold' else 'clip_threshold']
+        unclipped = energy(chain.scale, other)
+        curve = energy(chain.scale, np.minimum(limits, other))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loss_percent = (unclipped - curve) / unclipped * 100
+
+        # Knee: largest gap between the normalised curve and the diagonal
+        knee = np.argmax(curve / max(unclipped, 1e-300) - limits / max(peak, 1e-300))
+        # Loss falls with the limit; the smallest candidate meeting each target
+        meets = [np.flatnonzero(loss_percent <= target) for target in loss_targets]
+    return {
+        'limit': limit,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'unclipped_kwh': float(unclipped) / 1000,
+        'peak_w': float(peak),
+        'limits_w': limits,
+        'energy_kwh': curve / 1000,
+        'loss_kwh': (unclipped - curve) / 1000,
+        'loss_percent': loss_percent,
+        'knee_limit_w': float(limits[knee]),
+        'knee_energy_kwh': float(curve[knee]) / 1000,
+        'knee_loss_percent': float(loss_percent[knee]),
+        'limits_for_loss_w': {target: float(limits[rows[0]]) if rows.size else None
+                              for target, rows in zip(loss_targets, meets)},
+        'configured_limit_w': float(config[limit]),
+        'configured_energy_kwh': float(energy(chain.scale, chain.limit)) / 1000,
+    }
+
+
+# Standard deviations for monte_carlo_yield: percentage points for the losses,
+# percent of the value for the clipping limits
+DEFAULT_UNCERTAINTY = {
+    'irradiance_losses': 2.0,
+    'system_losses': 1.0,
+    'efficiency_losses': 1.0,
+    'clip_threshold': 2.0,
+    'alt_clip_threshold': 2.0,
+}
+
+
+def monte_carlo_yield(config, start, end, samples=5000, uncertainty=None, seed=0, chunk_size=100_000,
+                      bins=50, progress=None):
+    """P50/P90 energy over a date range under uncertain losses and clipping limits.
+
+    Every sample draws the loss parameters and clipping limits from normal
+    distributions around the config values, with the standard deviations of
+    DEFAULT_UNCERTAINTY updated by `uncertainty` (or the config's
+    'uncertainty'); 0 keeps a parameter fixed. The raw irradiance is
+    simulated once; since every power chain is P = min(k · I, L), the sorted
+    irradiance samples with prefix sums of their trapezoid weights give each
+    parameter set's energy in one binary search, evaluated `chunk_size`
+    samples at a time. Weather is the clear-sky model, so the spread covers
+    the system parameters only. Returns a dict with the deterministic energy,
+    the mean, standard deviation, P50, P75, P90 and P99 (exceeded with that
+    probability) in kWh, every sample's energy and a histogram.
+    """
+    start = parse_date(start)
+    end = parse_date(end)
+    if end < start:
+        raise ValueError("End date must be after or equal to start date.")
+    spread = {**DEFAULT_UNCERTAINTY, **(config.get('uncertainty') or {}), **(uncertainty or {})}
+    unknown = set(spread) - set(DEFAULT_UNCERTAINTY)
+    if unknown:
+        raise ValueError(f"Cannot vary {', '.join(sorted(unknown))}. Please use {', '.join(DEFAULT_UNCERTAINTY)}.")
+
+    chain = power_chain_from_config(config)
+    _, time, irradiance = simulator_from_config(config).simulate_range(start, end)
+    energy, _ = _clipped_energy(time, irradiance)
+    if progress is not None:
+        progress(0.2)
+
+    rng = np.random.default_rng(seed)
+    energies = np.empty(samples)
+    with stage('monte_carlo'):
+        for first in range(0, samples, chunk_size):
+            n = min(chunk_size, samples - first)
+            drawn = {}
+            for name, sigma in spread.items():
+                value = config[name]
+                if name.endswith('_losses'):
+                    drawn[name] = np.clip(rng.normal(value, sigma, n), 0, 100)
+                else:
+                    drawn[name] = np.maximum(rng.normal(value, abs(value) * sigma / 100, n), 0) if np.isfinite(value) else value
+            sample_chain = PowerChain(chain.surface_area, chain.num_modules, **{name: drawn[name] for name in spread},
+                                      **{name: config[name] for name in DEFAULT_UNCERTAINTY if name not in spread})
+            energies[first:first + n] = energy(sample_chain.scale, np.minimum(sample_chain.clip_threshold,
+                                                                              sample_chain.alt_clip_threshold))
+            if progress is not None:
+                progress(0.2 + 0.8 * (first + n) / samples)
+
+    kwh = energies / 1000
+    counts, edges = np.histogram(kwh, bins=bins)
+    # P90 is the yield exceeded in 90 % of the samples, i.e. the 10th percentile
+    p50, p75, p90, p99 = np.percentile(kwh, [50, 25, 10, 1])
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'samples': samples,
+        'deterministic_kwh': float(energy(chain.scale, chain.limit)) / 1000,
+        'mean_kwh': float(kwh.mean()),
+        'std_kwh': float(kwh.std()),
+        'p50_kwh': float(p50),
+        'p75_kwh': float(p75),
+        'p90_kwh': float(p90),
+        'p99_kwh': float(p99),
+        'energies_kwh': kwh,
+        'histogram': (counts, edges),
+    }
+
+
+# Schedules for lifetime_projection; the config's 'lifetime' table overrides them
+DEFAULT_LIFETIME = {
+    'years': 25,
+    'start_year': None,  # First calendar year; None takes the year of the config's start date, else this year
+    'first_year_degradation': 0.0,  # % of the module output lost from the first year on (e.g. light-induced)
+    'degradation': 0.5,  # % of the initial module output lost per year, or a list with one rate per year
+    'inverter_degradation': 0.0,  # % of the inverter output lost per year since it was installed
+    'inverter_replacements': (),  # Project years (1 = first) that start with a new inverter
+    'clip_threshold': {},  # {calendar year: W}: DC limit from that year on
+    'alt_clip_threshold': {},  # {calendar year: W}: AC export limit from that year on
+}
+
+
+@lru_cache(maxsize=8)
+def _reference_year_energy(latitude, longitude, beta, gamma, shading, year):
+    """_clipped_energy of one calendar year; every year of the same length has the same irradiance."""
+    simulator = PVSystemSimulator(latitude, longitude, beta, gamma, shading)
+    _, time, irradiance = simulator.simulate_range(date(year, 1, 1), date(year, 12, 31))
+    return _clipped_energy(time, irradiance)
+
+
+def _yearly_schedule(initial, changes, years):
+    """`initial` for every one of `years`, replaced from each year of `changes` ({year: value}) on."""
+    values = np.full(years.size, float(initial))
+    for year, value in sorted((int(year), float(value)) for year, value in changes.items()):
+        values[years >= year] = value
+    return values
+
+
+def lifetime_projection(config, lifetime=None):
+    """Year-by-year energy of a parameter set over the system lifetime.
+
+    The schedules of DEFAULT_LIFETIME, updated by the config's 'lifetime'
+    table and `lifetime`, give every year a module factor (linear
+    degradation), an inverter factor (degradation since the last
+    replacement) and its DC and AC clipping limits. The sun geometry of this
+    model depends on the day of the year only, so one leap and one common
+    year are simulated and every year's power chain P = min(k · I, L) is
+    evaluated from the sorted samples of its calendar type
+    (_clipped_energy): a 30-year projection costs about two simulated
+    years. Returns a dict with the totals and the yearly table (calendar
+    and project year, factors, limits, energy, clipping loss and cumulative
+    energy in kWh).
+    """
+    settings = {**DEFAULT_LIFETIME, **(config.get('lifetime') or {}), **(lifetime or {})}
+    unknown = set(settings) - set(DEFAULT_LIFETIME)
+    if unknown:
+        raise ValueError(f"Unknown lifetime settings: {', '.join(sorted(unknown))}. Please use {', '.join(DEFAULT_LIFETIME)}.")
+    n = int(settings['years'])
+    if n < 1:
+        raise ValueError("A lifetime projection needs at least one year.")
+    start_year = settings['start_year']
+    if start_year is None:
+        start_year = parse_date(config['start']).year if config.get('start') is not None else date.today().year
+    years = int(start_year) + np.arange(n)
+    project_year = np.arange(1, n + 1)
+
+    rates = np.asarray(settings['degradation'], dtype=float)
+    if rates.ndim > 1 or (rates.ndim == 1 and rates.size != n):
+        raise ValueError(f"Degradation must be one rate or a list of {n} yearly rates.")
+    # Degradation of the years before each year, on top of the first-year loss
+    lost = np.concatenate(([0], np.cumsum(np.broadcast_to(rates, (n,)))[:-1]))
+    module = np.maximum((1 - settings['first_year_degradation'] / 100) * (1 - lost / 100), 0)
+    installed = np.maximum.accumulate(np.where(np.isin(project_year, list(settings['inverter_replacements'])),
+                                               project_year, 1))
+    inverter = np.maximum(1 - settings['inverter_degradation'] / 100 * (project_year - installed), 0)
+    clip = _yearly_schedule(config['clip_threshold'], settings['clip_threshold'], years)
+    alt_clip = _yearly_schedule(config['alt_clip_threshold'], settings['alt_clip_threshold'], years)
+
+    simulator = simulator_from_config(config)
+    scale = power_chain_from_config(config).scale * module * inverter
+    limit = np.minimum(clip, alt_clip)
+    energy = np.empty(n)
+    unclipped = np.empty(n)
+    leap = np.array([calendar.isleap(year) for year in years])
+    reference_years = []
+    with stage('lifetime'):
+        for rows in (~leap, leap):
+            if not rows.any():
+                continue
+            reference = int(years[rows][0])
+            reference_years.append(reference)
+            year_energy, _ = _reference_year_energy(simulator.latitude, simulator.longitude, simulator.beta,
+                                                    simulator.gamma, simulator.shading, reference)
+            energy[rows] = year_energy(scale[rows], limit[rows])
+            unclipped[rows] = year_energy(scale[rows], np.inf)
+
+    kwh = energy / 1000
+    return {
+        'start_year': int(years[0]),
+        'end_year': int(years[-1]),
+        'reference_years': sorted(reference_years),
+        'total_kwh': float(kwh.sum()),
+        'first_year_kwh': float(kwh[0]),
+        'last_year_kwh': float(kwh[-1]),
+        'clipping_loss_kwh': float(unclipped.sum() - energy.sum()) / 1000,
+        'table': {
+            'year': years,
+            'project_year': project_year,
+            'module_factor': module,
+            'inverter_factor': inverter,
+            'clip_threshold_w': clip,
+            'alt_clip_threshold_w': alt_clip,
+            'energy_kwh': kwh,
+            'clipping_loss_kwh': (unclipped - energy) / 1000,
+            'cumulative_kwh': np.cumsum(kwh),
+        },
+    }
+
+
+def _lifetime_worker(scenarios):
+    """lifetime_projection of a group of scenarios of one site, sharing its reference years."""
+    return [lifetime_projection(scenario) for scenario in scenarios]
+
+
+def lifetime_scenarios(scenarios, workers=None):
+    """lifetime_projection of many parameter sets, spread over processes.
+
+    Scenarios of the same site, orientation and shading go to the same
+    worker, which simulates their reference years once and evaluates every
+    schedule from the same sorted samples. Returns the results in order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    groups = {}
+    for i, scenario in enumerate(scenarios):
+        site = tuple(str(scenario.get(name)) for name in ('latitude', 'longitude', 'beta', 'gamma') + _SHADING_KEYS)
+        groups.setdefault(site, []).append(i)
+    if workers == 1 or len(groups) <= 1:
+        return _lifetime_worker(scenarios)
+
+    results = [None] * len(scenarios)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(rows, pool.submit(_profiled, PROFILE, _lifetime_worker, [scenarios[i] for i in rows]))
+                   for rows in groups.values()]
+        for rows, future in futures:
+            group_results, stats = future.result()
+            if stats is not None:
+                merge_stats(stats)
+            for i, result in zip(rows, group_results):
+                results[i] = result
+    return results
+
+
+def load_sites(file_path):
+    """Read a fleet table (CSV with a header row, or a JSON list of objects).
+
+    Each site is a parameter set like DEFAULT_CONFIG, plus an optional 'site'
+    name and shading files (horizon_file, near_shading_file); missing
+    parameters take the defaults.
+    """
+    if file_path.lower().endswith('.json'):
+        with open(file_path) as f:
+            rows = json.load(f)
+    else:
+        import csv
+
+        with open(file_path, newline='') as f:
+            rows = [{key.strip(): value for key, value in row.items() if value not in (None, '')}
+                    for row in csv.DictReader(f)]
+
+    sites = []
+    for i, row in enumerate(rows):
+        unknown = set(row) - set(DEFAULT_CONFIG) - set(_SHADING_KEYS) - {'site'}
+        if unknown:
+            raise ValueError(f"Unknown columns in {file_path}: {', '.join(sorted(unknown))}")
+        site = {key: float(value) for key, value in row.items() if key in DEFAULT_CONFIG}
+        site.update({key: str(row[key]) for key in _SHADING_KEYS if key in row})
+        site = {**DEFAULT_CONFIG, **site, 'site': str(row.get('site', i))}
+        site['num_modules'] = int(site['num_modules'])
+        sites.append(site)
+    return sites
+
+
+def _fleet_worker(out_path, rows, sites, start, end, method):
+    """Simulate a chunk of sites and write their daily energies into the shared result file."""
+    result = np.load(out_path, mmap_mode='r+')
+    for row, site in zip(rows, sites):
+        try:
+            chain = power_chain_from_config(site)
+            _, result[row] = simulator_from_config(site).range_energy(start, end, chain, method)
+        except ValueError:
+            result[row] = np.nan  # e.g. no sunrise on some day at this latitude and tilt
+    result.flush()
+    return len(rows)
+
+
+def run_fleet(sites, start, end, out_path, workers=None, chunk_size=64, method="numeric"):
+    """Simulate many sites in parallel processes.
+
+    Daily energies (Wh) are written straight into a (sites × days) float64
+    .npy file at `out_path`, memory-mapped by every worker, so only site
+    parameters travel between processes. Sites are grouped by location and
+    tilt before chunking so each worker reuses its geometry cache. Returns
+    (dates, daily) with daily memory-mapped read-only; sites that cannot be
+    simulated are NaN rows. `method` is passed to PVSystemSimulator.range_energy.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    start = parse_date(start)
+    end = parse_date(end)
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    if dates.size == 0:
+        raise ValueError("End date must be after or equal to start date.")
+
+    result = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float64, shape=(len(sites), dates.size))
+    result.flush()
+    del result
+
+    order = sorted(range(len(sites)), key=lambda i: (sites[i]['latitude'], sites[i]['longitude'], sites[i]['beta']))
+    chunks = [order[i:i + chunk_size] for i in range(0, len(order), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_profiled, PROFILE, _fleet_worker, out_path, rows, [sites[i] for i in rows], start, end,
+                               method)
+                   for rows in chunks]
+        for future in futures:
+            _, stats = future.result()
+            if stats is not None:
+                merge_stats(stats)
+
+    return dates, np.load(out_path, mmap_mode='r')
+
+
+def annual_energy(dates, daily):
+    """Sum (sites × days) daily energies per calendar year. Returns (years, sites × years)."""
+    years = dates.astype('datetime64[Y]').astype(int) + 1970
+    unique_years, starts = np.unique(years, return_index=True)
+    return unique_years, np.add.reduceat(np.asarray(daily), starts, axis=1)
+
+
+def minmax_decimate(x, y, n_bins):
+    """Reduce a sorted series to the first, lowest, highest and last point of `n_bins` buckets.
+
+    Unlike striding this keeps every peak and dip (spikes, clipping
+    plateaus), so the decimated line looks the same at screen resolution.
+    NaN gaps inside a bucket are skipped. Short series are returned as is.
+    """
+    y = np.asarray(y, dtype=float)
+    n_bins = max(int(n_bins), 1)
+    if y.size <= 4 * n_bins:
+        return x, y
+    size = -(-y.size // n_bins)
+    n_bins = -(-y.size // size)
+    buckets = np.full(n_bins * size, np.nan)
+    buckets[:y.size] = y
+    buckets = buckets.reshape(n_bins, size)
+    starts = np.arange(n_bins) * size
+    lowest = np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=1) + starts
+    highest = np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=1) + starts
+    ends = np.minimum(starts + size, y.size) - 1
+    keep = np.unique(np.concatenate([starts, lowest, highest, ends]))
+    keep = keep[keep < y.size]
+    return x[keep], y[keep]
+
+
+def lttb_decimate(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of a sorted series to `n_out` points.
+
+    Picks in every bucket the point spanning the largest triangle with the
+    previous pick and the next bucket's mean, which keeps the visual shape
+    with fewer points than min/max.
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    n_out = int(n_out)
+    if n_out >= n or n_out < 3:
+        return x, y
+    xf = np.asarray(x, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges = np.append(edges, n)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # mean of an all-NaN bucket
+        for i in range(n_out - 2):
+            lo, hi = edges[i], edges[i + 1]
+            next_x = xf[hi:edges[i + 2]].mean()
+            next_y = np.nanmean(y[hi:edges[i + 2]])
+            area = np.abs((xf[a] - next_x) * (y[lo:hi] - y[a]) - (xf[a] - xf[lo:hi]) * (next_y - y[a]))
+            a = lo + np.where(np.isnan(area), -1, area).argmax()
+            keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+class FigurePool:
+    """Figures of closed plot windows, cleared and handed out again instead of new ones.
+
+    The figures are plain matplotlib.figure.Figure objects, not pyplot
+    figures, so nothing keeps them alive once their window is gone.
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._free = []
+
+    def acquire(self, figsize):
+        if self._free:
+            figure = self._free.pop()
+            figure.set_size_inches(figsize)
+            return figure
+        from matplotlib.figure import Figure
+
+        return Figure(figsize=figsize)
+
+    def release(self, figure):
+        figure.clf()
+        if len(self._free) < self.max_size:
+            self._free.append(figure)
+
+
+FIGURE_POOL = FigurePool()
+
+
+class DecimatedLine:
+    """A line that draws its full (x, y) series at about two points per screen pixel.
+
+    The visible x range is re-decimated whenever it changes (zoom, pan), so
+    zooming in shows the raw samples again.
+    """
+
+    def __init__(self, ax, x, y, method='minmax', **style):
+        self.ax = ax
+        self.x = np.asarray(x)
+        self.y = np.asarray(y, dtype=float)
+        self.method = method
+        # Decimation keeps the first, last and extreme points, so the data limits match the full series
+        self.line, = ax.plot(*self._decimated(full=True), **style)
+
+    def set_ydata(self, y):
+        self.y = np.asarray(y, dtype=float)
+        self.refresh()
+
+    def refresh(self, full=False):
+        self.line.set_data(*self._decimated(full))
+
+    def _decimated(self, full):
+        x, y = self.x, self.y
+        if not full and x.size:
+            # Only the visible part, plus one point either side so the line runs to the edges
+            lo, hi = self.ax.get_xlim()
+            first = max(np.searchsorted(x, lo) - 1, 0)
+            last = min(np.searchsorted(x, hi) + 1, x.size)
+            x, y = x[first:last], y[first:last]
+        width = max(int(self.ax.get_window_extent().width), 100)
+        if self.method == 'lttb':
+            return lttb_decimate(x, y, 2 * width)
+        return minmax_decimate(x, y, width // 2)
+
+
+class PlotWindow:
+    """A plot Toplevel with a pooled figure, a navigation toolbar and decimated lines.
+
+    Lines are identified by label. update() swaps a line's data and redraws
+    only the lines (blitting) while the axes limits still fit, which keeps
+    re-plots after a parameter change cheap. Closing the window returns the
+    figure to FIGURE_POOL.
+    """
+
+    def __init__(self, root, title, figsize, signature=None):
+        self.signature = signature  # What the window shows; equal signatures can be updated in place
+        self.figure = FIGURE_POOL.acquire(figsize)
+        self.ax = self.figure.add_subplot()
+        self.lines = {}
+        self.closed = False
+        self._background = None
+        self._capturing = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        NavigationToolbar2Tk(self.canvas, self.window)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self._draw_cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+        self.window.bind('<Destroy>', self._on_destroy, add='+')
+
+    def plot(self, label, x, y, method='minmax', **style):
+        self.lines[label] = DecimatedLine(self.ax, x, y, method, label=label, **style)
+        return self.lines[label]
+
+    def draw(self):
+        for line in self.lines.values():
+            line.refresh(full=True)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
+
+    def update(self, curves):
+        """Replace the y data of labelled lines; returns False if the y range no longer fits."""
+        for label, y in curves.items():
+            self.lines[label].set_ydata(y)
+        bottom, top = self.ax.get_ylim()
+        peak = max((np.nanmax(line.y) for line in self.lines.values() if line.y.size), default=0)
+        if not bottom <= 0 or not peak * 1.01 <= top <= peak * 2:
+            return False
+
+        if self._background is None:
+            self._capture_background()
+        self.canvas.restore_region(self._background)
+        for line in self.lines.values():
+            self.ax.draw_artist(line.line)
+        self.canvas.blit(self.ax.bbox)
+        return True
+
+    def _capture_background(self):
+        # The axes without the lines, to restore before drawing the updated lines
+        artists = [line.line for line in self.lines.values()]
+        for artist in artists:
+            artist.set_visible(False)
+        self._capturing = True
+        try:
+            self.canvas.draw()
+        finally:
+            self._capturing = False
+            for artist in artists:
+                artist.set_visible(True)
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+
+    def _on_draw(self, event):
+        if not self._capturing:
+            self._background = None  # Limits, size or artists may have changed
 
-        results = {'Time': [], 'Irradiance': []}
-
-
-        # Time correction
-        time_corr = self.time_correction(day_of_year) / 60
-
-        # Before sunrise
-        t_before = t_sunrise - margin
-        lst_before = t_before + time_corr
-        omega_before = self.hour_angle(lst_before, solar_noon)
-        alpha_before = self.solar_elevation_angle(delta, omega_before)
-        psi_before = self.azimuth_of_sun(delta, alpha_before, omega_before)
-        ion_before = 1367 * (1 + 0.033 * np.cos(2 * np.pi * day_of_year / 365))
-        irr_before = self.module_irradiance(ion_before, alpha_before, psi_before) * mult
-        results['Time'].append(t_before)
-        results['Irradiance'].append(irr_before)
-
-        # Sunrise
-        lst_sunrise = t_sunrise + time_corr
-        omega_sunrise = self.hour_angle(lst_sunrise, solar_noon)
-        alpha_sunrise = self.solar_elevation_angle(delta, omega_sunrise)
-        psi_sunrise = self.azimuth_of_sun(delta, alpha_sunrise, omega_sunrise)
-        irr_sunrise = self.module_irradiance(ion_before, alpha_sunrise, psi_sunrise) * mult
-        results['Time'].append(t_sunrise)
-        results['Irradiance'].append(irr_sunrise)
-
-        # Main daytime loop (every 15 minutes)
-        time_range = np.arange(t_sunrise, t_sunset, 0.25)
-        for time in time_range:
-            lst = time + time_corr
-            omega = self.hour_angle(lst, solar_noon)
-            alpha = self.solar_elevation_angle(delta, omega)
-            psi = self.azimuth_of_sun(delta, alpha, omega)
-            ion = 1367 * (1 + 0.033 * np.cos(2 * np.pi * day_of_year / 365))
-            I_module = self.module_irradiance(ion, alpha, psi) * mult
-            results['Time'].append(time)
-            results['Irradiance'].append(I_module)
-
-        # Sunset
-        lst_sunset = t_sunset + time_corr
-        omega_sunset = self.hour_angle(lst_sunset, solar_noon)
-        alpha_sunset = self.solar_elevation_angle(delta, omega_sunset)
-        psi_sunset = self.azimuth_of_sun(delta, alpha_sunset, omega_sunset)
-        irr_sunset = self.module_irradiance(ion, alpha_sunset, psi_sunset) * mult
-        results['Time'].append(t_sunset)
-        results['Irradiance'].append(irr_sunset)
-
-        # After sunset
-        t_after = t_sunset + margin
-        lst_after = t_after + time_corr
-        omega_after = self.hour_angle(lst_after, solar_noon)
-        alpha_after = self.solar_elevation_angle(delta, omega_after)
-        psi_after = self.azimuth_of_sun(delta, alpha_after, omega_after)
-        irr_after = self.module_irradiance(ion, alpha_after, psi_after) * mult
-        results['Time'].append(t_after)
-        results['Irradiance'].append(irr_after)
-
-        if 89 <= day_of_year <= 301:
-            results['Time'] = [t + 1 for t in results['Time']]  # shift back so graph matches local clock time
-
-        return pd.DataFrame(results)
+    def _on_xlim_changed(self, ax):
+        for line in self.lines.values():
+            line.refresh()
 
+    def _on_destroy(self, event):
+        if event.widget is self.window and not self.closed:
+            self.closed = True
+            self.canvas.mpl_disconnect(self._draw_cid)
+            FIGURE_POOL.release(self.figure)
+
+
+def _format_power_axis(ax, y_max):
+    """Y range with 10 % headroom, ~10 ticks of at least 100 W and plain number labels."""
+    ax.set_ylim(0, y_max + y_max * 0.1)  # Add 10% padding to the top
+    y_tick_interval = max(100, y_max // 10)  # Divide range into 10 intervals, minimum interval is 100 Watts
+    ax.yaxis.set_major_locator(MultipleLocator(y_tick_interval))
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:,.0f}'))  # Remove scientific notation
 
 
 class PVSimulatorApp:
     def __init__(self, root):
+        _load_gui()
         self.root = root
         self.root.title("PV System Simulator")
 
         # Variables
-        self.latitude_var = tk.DoubleVar(value=31.7187)
-        self.longitude_var = tk.DoubleVar(value=34.7287)
-        self.beta_var = tk.DoubleVar(value=16)
-        self.gamma_var = tk.DoubleVar(value=180)
+        self.latitude_var = tk.DoubleVar(value=DEFAULT_CONFIG['latitude'])
+        self.longitude_var = tk.DoubleVar(value=DEFAULT_CONFIG['longitude'])
+        self.beta_var = tk.DoubleVar(value=DEFAULT_CONFIG['beta'])
+        self.gamma_var = tk.DoubleVar(value=DEFAULT_CONFIG['gamma'])
         self.date_var = tk.StringVar()
         self.year_var = tk.IntVar(value=2024)
 
-        self.surface_area_var = tk.DoubleVar(value=1.0)  # Default 1 m²
-        self.num_modules_var = tk.IntVar(value=1)        # Default 1 module
+        self.surface_area_var = tk.DoubleVar(value=DEFAULT_CONFIG['surface_area'])  # Default 1 m²
+        self.num_modules_var = tk.IntVar(value=DEFAULT_CONFIG['num_modules'])        # Default 1 module
+
+        self._job = None  # Cancel event of the running background computation
+        self._last_run = None  # (name, wall time in s, profile_stats()) of the last finished computation
+        self._power_plot = None  # PlotWindow of the last plot_results call, updated in place when possible
+        self._energy_index = None  # EnergyIndex of the last simulated-only date range, reused while the inputs match
+        self.horizon_file = None  # Horizon profile CSV of the site, None for an open sky
 
         self.create_widgets()
 
@@ -208,7 +2899,7 @@ class PVSimulatorApp:
 
         # Tilt Angle (β) Single or Range
         ttk.Label(left_frame, text="Tilt Angle (β):").grid(row=2, column=0, sticky="w")
-        self.beta_var = tk.DoubleVar(value=16)  # Default single value
+        self.beta_var = tk.DoubleVar(value=DEFAULT_CONFIG['beta'])  # Default single value
         ttk.Entry(left_frame, textvariable=self.beta_var).grid(row=2, column=1)
 
         self.beta_range_toggle = tk.BooleanVar(value=False)  # Default: single value
@@ -229,7 +2920,7 @@ class PVSimulatorApp:
 
         # Azimuth Angle (γ) Single or Range
         ttk.Label(left_frame, text="Azimuth Angle (γ):").grid(row=6, column=0, sticky="w")
-        self.gamma_var = tk.DoubleVar(value=180)  # Default single value
+        self.gamma_var = tk.DoubleVar(value=DEFAULT_CONFIG['gamma'])  # Default single value
         ttk.Entry(left_frame, textvariable=self.gamma_var).grid(row=6, column=1)
 
         self.gamma_range_toggle = tk.BooleanVar(value=False)  # Default: single value
@@ -256,27 +2947,27 @@ class PVSimulatorApp:
         ttk.Entry(left_frame, textvariable=self.num_modules_var).grid(row=11, column=1)
 
         # Power Clipping Threshold
-        self.clip_threshold_var = tk.DoubleVar(value=120000000)  # Default threshold for main clipping
+        self.clip_threshold_var = tk.DoubleVar(value=DEFAULT_CONFIG['clip_threshold'])  # Default threshold for main clipping
         ttk.Label(left_frame, text="Nominal Power (DC Limit) (W):").grid(row=12, column=0, sticky="w")
         ttk.Entry(left_frame, textvariable=self.clip_threshold_var).grid(row=12, column=1)
 
         # Alternate Clipping Threshold
-        self.alt_clip_threshold_var = tk.DoubleVar(value=8500000)  # Default threshold for alternate clipping
+        self.alt_clip_threshold_var = tk.DoubleVar(value=DEFAULT_CONFIG['alt_clip_threshold'])  # Default threshold for alternate clipping
         ttk.Label(left_frame, text="MAX Export Power (AC Limit) (W):").grid(row=13, column=0, sticky="w")
         ttk.Entry(left_frame, textvariable=self.alt_clip_threshold_var).grid(row=13, column=1)
 
         # Irradiance Multiplier
-        self.irradiance_multiplier_var = tk.DoubleVar(value=30)
+        self.irradiance_multiplier_var = tk.DoubleVar(value=DEFAULT_CONFIG['irradiance_losses'])
         ttk.Label(left_frame, text="Irradiance Losses (%):").grid(row=14, column=0, sticky="w")
         ttk.Entry(left_frame, textvariable=self.irradiance_multiplier_var).grid(row=14, column=1)
 
         # Power Multiplier
-        self.power_multiplier_var = tk.DoubleVar(value=2)
+        self.power_multiplier_var = tk.DoubleVar(value=DEFAULT_CONFIG['system_losses'])
         ttk.Label(left_frame, text="System Losses (%):").grid(row=15, column=0, sticky="w")
         ttk.Entry(left_frame, textvariable=self.power_multiplier_var).grid(row=15, column=1)
 
         # Efficiency Multiplier
-        self.Efficiency_multiplier_var = tk.DoubleVar(value=80)
+        self.Efficiency_multiplier_var = tk.DoubleVar(value=DEFAULT_CONFIG['efficiency_losses'])
         ttk.Label(left_frame, text="Efficiency Losses (%):").grid(row=16, column=0, sticky="w")
         ttk.Entry(left_frame, textvariable=self.Efficiency_multiplier_var).grid(row=16, column=1)
 
@@ -290,6 +2981,9 @@ class PVSimulatorApp:
         # Simulate Button
         ttk.Button(left_frame, text="Simulate", command=self.simulate).grid(row=19, column=0, columnspan=2, pady=10)
 
+        # Annual β×γ orientation sweep over the tilt/azimuth ranges
+        ttk.Button(left_frame, text="Optimize Orientation (Year)", command=self.optimize_orientation).grid(row=20, column=0, columnspan=2, pady=10)
+
         # Excel date input
         ttk.Label(right_frame, text="Excel Comparison Date (e.g., 21 June):").grid(row=0, column=0, sticky="w")
         self.excel_date_var = tk.StringVar()
@@ -302,6 +2996,10 @@ class PVSimulatorApp:
         ttk.Radiobutton(right_frame, text="Irradiance", variable=self.plot_type_var, value="irradiance").grid(row=1, column=1, sticky="w")
         ttk.Radiobutton(right_frame, text="Power", variable=self.plot_type_var, value="power").grid(row=2, column=1, sticky="w")
 
+        # Measured irradiance on the module plane, or horizontal (transposed to the plane)
+        self.ghi_toggle = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="Excel irradiance is horizontal (GHI)", variable=self.ghi_toggle).grid(row=2, column=0, sticky="w")
+
         ttk.Button(right_frame, text="Compare Simulation with Excel", command=self.compare_with_excel).grid(row=3, column=0, columnspan=2, pady=10)
 
         # Total Energy from Date Range
@@ -317,6 +3015,42 @@ class PVSimulatorApp:
         ttk.Button(right_frame, text="Compute Energy for Date Range", command=self.compute_date_range_energy).grid(row=6, column=0, columnspan=2, pady=10)
         ttk.Button(right_frame, text="Compare Simulated with Excel Energy", command=lambda: self.compute_date_range_energy(include_excel=True)).grid(row=7, column=0, columnspan=2, pady=10)
 
+        # Progress of background computations
+        self.progress_var = tk.DoubleVar(value=0)
+        self.status_var = tk.StringVar(value="Ready")
+        ttk.Progressbar(right_frame, variable=self.progress_var, maximum=100, length=250).grid(row=8, column=0, columnspan=2, pady=(20, 5))
+        ttk.Label(right_frame, textvariable=self.status_var).grid(row=9, column=0, sticky="w")
+        self.cancel_button = ttk.Button(right_frame, text="Cancel", command=self.cancel_background, state="disabled")
+        self.cancel_button.grid(row=9, column=1, sticky="e")
+
+        # Stage timings of the last computation
+        self.profile_var = tk.BooleanVar(value=PROFILE)
+        ttk.Checkbutton(right_frame, text="Collect stage timings", variable=self.profile_var,
+                        command=lambda: enable_profiling(self.profile_var.get())).grid(row=10, column=0, sticky="w", pady=(10, 0))
+        ttk.Button(right_frame, text="Last Run Stats", command=self.show_last_run_stats).grid(row=10, column=1, sticky="e", pady=(10, 0))
+
+        ttk.Button(right_frame, text="Calibrate Losses to Excel (Date Range)", command=self.calibrate_losses).grid(row=11, column=0, columnspan=2, pady=10)
+
+        # Plot the whole date range against the measured power
+        ttk.Button(right_frame, text="Plot Simulated vs Excel Power (Date Range)", command=self.plot_range_with_excel).grid(row=12, column=0, columnspan=2, pady=10)
+
+        # Error metrics over every measured sample of the date range (Excel Plot Type picks power or irradiance)
+        ttk.Button(right_frame, text="Error Metrics vs Excel (Date Range)", command=self.show_error_metrics).grid(row=13, column=0, columnspan=2, pady=10)
+
+        # Yield distribution under loss and clipping uncertainty
+        ttk.Button(right_frame, text="P50/P90 Energy (Date Range)", command=self.compute_yield_uncertainty).grid(row=14, column=0, columnspan=2, pady=10)
+
+        # Energy vs AC export limit, for inverter / export agreement sizing
+        ttk.Button(right_frame, text="Size Export Limit (Date Range)", command=self.size_export_limit).grid(row=15, column=0, columnspan=2, pady=10)
+
+        # Horizon profile applied to every simulation (cancel the dialog for an open sky)
+        self.horizon_var = tk.StringVar(value="Open sky")
+        ttk.Button(right_frame, text="Load Horizon Profile", command=self.load_horizon_profile).grid(row=16, column=0, sticky="w", pady=10)
+        ttk.Label(right_frame, textvariable=self.horizon_var).grid(row=16, column=1, sticky="w")
+
+        # Yearly energy over the system lifetime from the Year field on (schedules from DEFAULT_LIFETIME)
+        ttk.Button(right_frame, text="Lifetime Projection (25 Years)", command=self.project_lifetime).grid(row=17, column=0, columnspan=2, pady=10)
+
     def simulate(self):
         try:
             latitude = self.latitude_var.get()
@@ -356,6 +3090,11 @@ class PVSimulatorApp:
             except (ValueError, IndexError):
                 raise ValueError("Invalid date format. Please use 'day month' (e.g., '14 May').")
 
+            if beta_use_range and gamma_use_range:
+                # Both angles swept: score every (β, γ) pair on annual energy instead
+                self.optimize_orientation()
+                return
+
             # Plot results for single or multiple values
             self.plot_results(
                 latitude=latitude,
@@ -383,196 +3122,518 @@ class PVSimulatorApp:
                  beta_start=None, beta_stop=None, beta_step=None, beta=None,
                  gamma_start=None, gamma_stop=None, gamma_step=None, gamma=None, 
                  swipe_mode=None):
-        """Plot results for single or multiple combinations of tilt and azimuth angles."""
-        try:
-            # Initialize the plot
-            fig, ax = plt.subplots(figsize=(16, 10))
-
-            if swipe_mode == "beta" and beta_start is not None and beta_stop is not None:
-                # Swipe over tilt angle (β)
-                for beta in np.arange(beta_start, beta_stop + beta_step, beta_step):
-                    simulator = PVSystemSimulator(latitude, longitude, beta, gamma)
-                    irr_mult = 1 - self.irradiance_multiplier_var.get() / 100 if hasattr(self, 'irradiance_multiplier_var') else 1.0
-                    results = simulator.simulate_day(year, month, day, mult=irr_mult)
-                    power_mult = 1 - self.power_multiplier_var.get() / 100 if hasattr(self, 'power_multiplier_var') else 1.0
-                    Efficiency_mult = 1 - self.Efficiency_multiplier_var.get() / 100 if hasattr(self, 'Efficiency_multiplier_var') else 1.0
-                    results['Power'] = results['Irradiance'] * surface_area * num_modules * power_mult * Efficiency_mult
-                    clip_threshold = self.clip_threshold_var.get()
-                    results['Power'] = np.minimum(results['Power'], clip_threshold)
-                    new_clip_threshold = self.alt_clip_threshold_var.get()
-                    results['Power'] = np.minimum(results['Power'], new_clip_threshold)
-                    ax.plot(results['Time'], results['Power'], label=f"β={beta:.1f}", linewidth=1.5)
-
-            elif swipe_mode == "gamma" and gamma_start is not None and gamma_stop is not None:
-                # Swipe over azimuth angle (γ)
-                for gamma_val in np.arange(gamma_start, gamma_stop + gamma_step, gamma_step):
-                    simulator = PVSystemSimulator(latitude, longitude, beta, gamma_val)
-                    irr_mult = 1 - self.irradiance_multiplier_var.get() / 100 if hasattr(self, 'irradiance_multiplier_var') else 1.0
-                    results = simulator.simulate_day(year, month, day, mult=irr_mult)
-                    power_mult = 1 - self.power_multiplier_var.get() / 100 if hasattr(self, 'power_multiplier_var') else 1.0
-                    Efficiency_mult = 1 - self.Efficiency_multiplier_var.get() / 100 if hasattr(self, 'Efficiency_multiplier_var') else 1.0
-                    results['Power'] = results['Irradiance'] * surface_area * num_modules * power_mult * Efficiency_mult
-                    clip_threshold = self.clip_threshold_var.get()
-                    results['Power'] = np.minimum(results['Power'], clip_threshold)
-                    new_clip_threshold = self.alt_clip_threshold_var.get()
-                    results['Power'] = np.minimum(results['Power'], new_clip_threshold)
-                    ax.plot(results['Time'], results['Power'], label=f"γ={gamma_val:.1f}", linewidth=1.5)
+        """Plot results for single or multiple combinations of tilt and azimuth angles.
 
+        The curves are computed in the background and drawn as each one finishes.
+        If the previous plot window is still open and shows the same site, day
+        and angles, its curves are replaced in place (only the losses, clipping
+        or module count changed).
+        """
+        try:
+            chain = self.power_chain()
+            chain.surface_area = surface_area
+            chain.num_modules = num_modules
+            shading = self.shading()
+
+            def compute_curves(progress):
+                if swipe_mode == "beta" and beta_start is not None and beta_stop is not None:
+                    # Swipe over tilt angle (β)
+                    betas = np.arange(beta_start, beta_stop + beta_step, beta_step)
+                    for i, beta_val in enumerate(betas):
+                        simulator = PVSystemSimulator(latitude, longitude, beta_val, gamma, shading)
+                        time, irradiance = simulator.simulate_day_arrays(year, month, day, mult=chain.irr_mult)
+                        progress((i + 1) / len(betas), (time, chain.apply(irradiance), {'label': f"β={beta_val:.1f}"}))
+
+                elif swipe_mode == "gamma" and gamma_start is not None and gamma_stop is not None:
+                    # Swipe over azimuth angle (γ); the sun position (and so the shading) does not depend on γ
+                    simulator = PVSystemSimulator(latitude, longitude, beta, gamma_start)
+                    time, alpha, psi, ion, *azimuth = simulator.day_sun_position(year, month, day, azimuth=shading is not None)
+                    if shading is not None:
+                        ion = ion * shading.factor(alpha, azimuth[0])
+                    gammas = np.arange(gamma_start, gamma_stop + gamma_step, gamma_step)
+                    for i, gamma_val in enumerate(gammas):
+                        irradiance = simulator.module_irradiance(ion, alpha, psi, gamma=gamma_val) * chain.irr_mult
+                        progress((i + 1) / len(gammas), (time, chain.apply(irradiance), {'label': f"γ={gamma_val:.1f}"}))
+
+                else:
+                    # Single tilt (β) and azimuth (γ) angle
+                    simulator = PVSystemSimulator(latitude, longitude, beta, gamma, shading)
+                    time, irradiance = simulator.simulate_day_arrays(year, month, day, mult=chain.irr_mult)
+                    progress(1.0, (time, chain.apply(irradiance), {'label': 'Power Output (W)', 'color': 'blue'}))
+
+            # Everything that decides the curves' shape and labels, but not their scale
+            signature = (latitude, longitude, year, month, day, swipe_mode, beta, gamma,
+                         beta_start, beta_stop, beta_step, gamma_start, gamma_stop, gamma_step, self.horizon_file)
+            plot = self._power_plot
+            if plot is None or plot.closed or plot.signature != signature:
+                # Initialize the plot
+                plot = self._power_plot = PlotWindow(self.root, "Power Output Plot", (16, 10), signature)
+                ax = plot.ax
+                ax.set_xlabel('Time (hours)', fontsize=14)
+                ax.set_ylabel('Power Output (Watts)', fontsize=14)
+                ax.set_title(f'Power Output vs Time on {day}/{month}/{year}', fontsize=16)
+                ax.grid(visible=True, which='both', linestyle='--', linewidth=0.5, alpha=0.7)
+                plot.canvas.draw()
             else:
-                # Single tilt (β) and azimuth (γ) angle
-                simulator = PVSystemSimulator(latitude, longitude, beta, gamma)
-                irr_mult = 1 - self.irradiance_multiplier_var.get() / 100 if hasattr(self, 'irradiance_multiplier_var') else 1.0
-                results = simulator.simulate_day(year, month, day, mult=irr_mult)
-                power_mult = 1 - self.power_multiplier_var.get() / 100 if hasattr(self, 'power_multiplier_var') else 1.0
-                Efficiency_mult = 1 - self.Efficiency_multiplier_var.get() / 100 if hasattr(self, 'Efficiency_multiplier_var') else 1.0
-                results['Power'] = results['Irradiance'] * surface_area * num_modules*Efficiency_mult*power_mult
-                clip_threshold = self.clip_threshold_var.get()
-                results['Power'] = np.minimum(results['Power'], clip_threshold)
-                new_clip_threshold = self.alt_clip_threshold_var.get()
-                results['Power'] = np.minimum(results['Power'], new_clip_threshold)
-                ax.plot(results['Time'], results['Power'], label='Power Output (W)', color='blue', linewidth=1.5)
-
-            # Dynamically set the y-axis range
-            y_min = 0
-            y_max = results['Power'].max()
-            ax.set_ylim(y_min, y_max + y_max * 0.1)  # Add 10% padding to the top
-
-            # Dynamically calculate y-axis tick intervals
-            y_tick_interval = max(100, y_max // 10)  # Divide range into 10 intervals, minimum interval is 100 Watts
-            ax.yaxis.set_major_locator(MultipleLocator(y_tick_interval))
-
-            # Set axis labels, title, and grid
-            ax.set_xlabel('Time (hours)', fontsize=14)
-            ax.set_ylabel('Power Output (Watts)', fontsize=14)
-            ax.set_title(f'Power Output vs Time on {day}/{month}/{year}', fontsize=16)
-
-            # Remove scientific notation and format y-axis as plain numbers
-            ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:,.0f}'))
-
-            # Add legend and grid
-            ax.legend(fontsize=8, loc='upper right')
-            ax.grid(visible=True, which='both', linestyle='--', linewidth=0.5, alpha=0.7)
-
-            # Show the plot
-            plot_window = tk.Toplevel(self.root)
-            plot_window.title("Power Output Plot")
-            canvas = FigureCanvasTkAgg(fig, master=plot_window)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+                plot.window.lift()
+
+            def draw_curve(curve):
+                time, power, style = curve
+                label = style.pop('label')
+                if label in plot.lines:
+                    # Same curve with new losses: blit it if it still fits the axes
+                    if plot.update({label: power}):
+                        return
+                else:
+                    plot.plot(label, time, power, linewidth=1.5, **style)
+                    plot.ax.legend(fontsize=8, loc='upper right')
+
+                # Dynamically set the y-axis range and ticks
+                _format_power_axis(plot.ax, max(np.nanmax(line.y) for line in plot.lines.values()))
+                plot.canvas.draw_idle()
+
+            self.run_in_background(compute_curves, lambda _: None, on_partial=draw_curve,
+                                   status="Simulating...")
 
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
-    def compute_date_range_energy(self, include_excel=False):
+    def optimize_orientation(self):
+        """Plot the annual-energy heatmap over the tilt × azimuth ranges and mark the optimum."""
         try:
-            from datetime import datetime, timedelta
-
-            # Read simulation inputs
             latitude = self.latitude_var.get()
             longitude = self.longitude_var.get()
-            beta = self.beta_var.get()
-            gamma = self.gamma_var.get()
-            surface_area = self.surface_area_var.get()
-            num_modules = self.num_modules_var.get()
-            power_mult = 1 - self.power_multiplier_var.get() / 100
-            irr_mult = 1 - self.irradiance_multiplier_var.get() / 100
-            Efficiency_mult = 1 - self.Efficiency_multiplier_var.get() / 100
+            year = self.year_var.get()
+            chain = self.power_chain()
+            shading = self.shading()
+
+            # A range toggle that is off sweeps just the single value
+            if self.beta_range_toggle.get():
+                betas = np.arange(self.beta_start_var.get(), self.beta_stop_var.get() + self.beta_step_var.get(), self.beta_step_var.get())
+            else:
+                betas = np.array([self.beta_var.get()])
+            if self.gamma_range_toggle.get():
+                gammas = np.arange(self.gamma_start_var.get(), self.gamma_stop_var.get() + self.gamma_step_var.get(), self.gamma_step_var.get())
+            else:
+                gammas = np.array([self.gamma_var.get()])
+
+            def sweep(progress):
+                return orientation_sweep(latitude, longitude, betas, gammas, date(year, 1, 1), date(year, 12, 31),
+                                         chain, progress=progress, shading=shading)
+
+            def show(result):
+                energy, best_beta, best_gamma = result
+                best_energy = np.nanmax(energy)
+
+                plot = PlotWindow(self.root, "Orientation Sweep", (12, 8))
+                fig, ax = plot.figure, plot.ax
+                mesh = ax.pcolormesh(gammas, betas, energy / 1000, shading='nearest')
+                fig.colorbar(mesh, ax=ax, label='Annual Energy (kWh)')
+                ax.plot(best_gamma, best_beta, marker='*', color='red', markersize=15, linestyle='none',
+                        label=f"Optimum β={best_beta:.1f}, γ={best_gamma:.1f}: {best_energy / 1000:,.2f} kWh")
+                ax.set_xlabel('Azimuth Angle γ (degrees)', fontsize=14)
+                ax.set_ylabel('Tilt Angle β (degrees)', fontsize=14)
+                ax.set_title(f'Annual Energy vs Orientation in {year}', fontsize=16)
+                ax.legend(fontsize=8, loc='upper right')
+                plot.canvas.draw()
+
+            self.run_in_background(sweep, show, status="Sweeping orientations...")
 
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def config(self):
+        """Current GUI inputs as a parameter set (DEFAULT_CONFIG keys plus the measured-irradiance option)."""
+        return {
+            'latitude': self.latitude_var.get(),
+            'longitude': self.longitude_var.get(),
+            'beta': self.beta_var.get(),
+            'gamma': self.gamma_var.get(),
+            'surface_area': self.surface_area_var.get(),
+            'num_modules': self.num_modules_var.get(),
+            'clip_threshold': self.clip_threshold_var.get(),
+            'alt_clip_threshold': self.alt_clip_threshold_var.get(),
+            'irradiance_losses': self.irradiance_multiplier_var.get(),
+            'system_losses': self.power_multiplier_var.get(),
+            'efficiency_losses': self.Efficiency_multiplier_var.get(),
+            'measured_irradiance': 'ghi' if self.ghi_toggle.get() else 'plane',
+            'horizon_file': self.horizon_file,
+        }
+
+    def power_chain(self):
+        """Build a PowerChain from the current GUI inputs."""
+        return power_chain_from_config(self.config())
+
+    def shading(self):
+        """ShadingProfile of the loaded horizon profile, or None."""
+        return load_shading(self.horizon_file)
+
+    def load_horizon_profile(self):
+        """Pick a horizon profile CSV (azimuth and elevation columns in degrees); cancelling clears it."""
+        try:
+            file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+            if file_path:
+                load_shading(file_path)  # Report a malformed file now rather than on the next simulation
+            self.horizon_file = file_path or None
+            self.horizon_var.set(os.path.basename(file_path) if file_path else "Open sky")
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def run_in_background(self, task, on_done, on_partial=None, status="Working..."):
+        """Run task(progress) on a worker thread and hand its results back to the Tk main loop.
+
+        The task reports with progress(fraction, partial=None), which raises
+        Cancelled once the user presses Cancel. Partial results go to
+        on_partial and the return value to on_done, both called from the main
+        loop via after(), so neither the task nor the worker touch Tk.
+        """
+        if self._job is not None:
+            messagebox.showinfo("Busy", "Another computation is still running. Wait for it or press Cancel.")
+            return
+
+        events = queue.Queue()
+        cancel = threading.Event()
+
+        def progress(fraction, partial=None):
+            if cancel.is_set():
+                raise Cancelled()
+            events.put(('progress', fraction, partial))
+
+        def worker():
+            # The last item of a final event is the run time, for the Last Run Stats panel
+            started = perf_counter()
+            try:
+                result = task(progress)
+                events.put(('done', result, perf_counter() - started))
+            except Cancelled:
+                events.put(('cancelled', None, perf_counter() - started))
+            except Exception as e:
+                events.put(('error', e, perf_counter() - started))
+
+        self._job = cancel
+        reset_stats()
+        self.progress_var.set(0)
+        self.status_var.set(status)
+        self.cancel_button.state(['!disabled'])
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(50, self._poll_background, events, on_done, on_partial, status)
+
+    def _poll_background(self, events, on_done, on_partial, status):
+        # Polls again only while the final event is still to come; errors in the
+        # callbacks are shown but never stop (or restart) the polling
+        while True:
+            try:
+                kind, value, partial = events.get_nowait()
+            except queue.Empty:
+                self.root.after(50, self._poll_background, events, on_done, on_partial, status)
+                return
+            if kind == 'progress':
+                self.progress_var.set(value * 100)
+                if partial is not None and on_partial is not None:
+                    try:
+                        on_partial(partial)
+                    except Exception as e:
+                        messagebox.showerror("Error", str(e))
+                continue
+
+            self._job = None
+            self.cancel_button.state(['disabled'])
+            self._last_run = (status.rstrip('.'), partial, profile_stats())
+            if kind == 'done':
+                self.progress_var.set(100)
+                self.status_var.set("Done")
+                try:
+                    on_done(value)
+                except Exception as e:
+                    messagebox.showerror("Error", str(e))
+            elif kind == 'cancelled':
+                self.progress_var.set(0)
+                self.status_var.set("Cancelled")
+            else:
+                self.status_var.set("Failed")
+                messagebox.showerror("Error", str(value))
+            return
+
+    def show_last_run_stats(self):
+        """Show the per-stage time breakdown of the last background computation."""
+        if self._last_run is None:
+            messagebox.showinfo("Last Run Stats", "No computation has finished yet.")
+            return
+        name, wall_time, stats = self._last_run
+        if not stats['stages']:
+            messagebox.showinfo("Last Run Stats",
+                                f"{name}: {wall_time:.3f} s\n\nTick 'Collect stage timings' and run again for a breakdown.")
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Last Run Stats")
+        ttk.Label(window, text=f"{name}: {wall_time:.3f} s wall time "
+                               f"(totals include nested stages, self times do not)").pack(padx=10, pady=5)
+        table = ttk.Treeview(window, columns=("calls", "total", "self", "share"), height=12)
+        table.heading("#0", text="Stage")
+        table.heading("calls", text="Calls")
+        table.heading("total", text="Total (ms)")
+        table.heading("self", text="Self (ms)")
+        table.heading("share", text="% of run")
+        for stage_name, entry in sorted(stats['stages'].items(), key=lambda item: -item[1]['total_s']):
+            table.insert("", tk.END, text=stage_name, values=(
+                entry['calls'], f"{entry['total_s'] * 1e3:.2f}", f"{entry['self_s'] * 1e3:.2f}",
+                f"{100 * entry['total_s'] / wall_time:.1f}"))
+        for counter_name, value in sorted(stats['counters'].items()):
+            table.insert("", tk.END, text=counter_name, values=(value, "", "", ""))
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    def compute_yield_uncertainty(self):
+        """Plot the Monte Carlo energy distribution over the date range with its P50 and P90."""
+        try:
+            start_date = datetime.strptime(self.range_start_date_var.get(), "%d/%m/%Y").date()
+            end_date = datetime.strptime(self.range_end_date_var.get(), "%d/%m/%Y").date()
+            config = self.config()
+            if end_date < start_date:
+                raise ValueError("End date must be after or equal to start date.")
+
+            def show(result):
+                counts, edges = result['histogram']
+                plot = PlotWindow(self.root, "Energy Distribution", (10, 6))
+                ax = plot.ax
+                ax.stairs(counts, edges, fill=True, alpha=0.6, label=f"{result['samples']} parameter sets")
+                for name, color in (('p50', 'green'), ('p90', 'red')):
+                    ax.axvline(result[name + '_kwh'], color=color, linestyle='--',
+                               label=f"{name.upper()}: {result[name + '_kwh']:,.2f} kWh")
+                ax.axvline(result['deterministic_kwh'], color='black', label=f"Inputs as entered: {result['deterministic_kwh']:,.2f} kWh")
+                ax.set_xlabel("Energy (kWh)")
+                ax.set_ylabel("Samples")
+                ax.set_title(f"Energy from {result['start']} to {result['end']} under loss and clipping uncertainty")
+                ax.legend(fontsize=8)
+                plot.canvas.draw()
+
+            self.run_in_background(
+                lambda progress: monte_carlo_yield(config, start_date, end_date, progress=progress),
+                show, status="Sampling parameter sets...")
+
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def size_export_limit(self):
+        """Plot energy and clipping loss over the date range against the AC export limit, with the knee."""
+        try:
+            start_date = datetime.strptime(self.range_start_date_var.get(), "%d/%m/%Y").date()
+            end_date = datetime.strptime(self.range_end_date_var.get(), "%d/%m/%Y").date()
+            config = self.config()
+            if end_date < start_date:
+                raise ValueError("End date must be after or equal to start date.")
+
+            def show(result):
+                plot = PlotWindow(self.root, "Export Limit Sizing", (12, 7))
+                ax = plot.ax
+                ax.plot(result['limits_w'], result['energy_kwh'], color='blue', label="Energy")
+                ax.axhline(result['unclipped_kwh'], color='gray', linestyle=':', label=f"Unclipped: {result['unclipped_kwh']:,.2f} kWh")
+                ax.plot(result['knee_limit_w'], result['knee_energy_kwh'], marker='*', color='red', markersize=15, linestyle='none',
+                        label=f"Knee: {result['knee_limit_w']:,.0f} W, {result['knee_loss_percent']:.1f}% clipped")
+                for target, value in result['limits_for_loss_w'].items():
+                    if value is not None:
+                        ax.axvline(value, color='orange', linestyle='--', linewidth=0.8)
+                        ax.annotate(f"{target}% loss: {value:,.0f} W", (value, 0), rotation=90, fontsize=8,
+                                    xytext=(3, 5), textcoords='offset points')
+                ax.set_xlabel("AC Export Limit (W)")
+                ax.set_ylabel("Energy (kWh)")
+                ax.xaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:,.0f}'))
+                ax.set_title(f"Energy vs Export Limit from {result['start']} to {result['end']}")
+                ax.grid(True)
+                ax.legend(fontsize=8, loc='upper left')
+                plot.canvas.draw()
+
+            self.run_in_background(lambda progress: clipping_curve(config, start_date, end_date),
+                                   show, status="Sizing export limit...")
+
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def project_lifetime(self):
+        """Plot the yearly energy over the system lifetime with the default degradation."""
+        try:
+            config = self.config()
+            start_year = self.year_var.get()
+
+            def show(result):
+                table = result['table']
+                plot = PlotWindow(self.root, "Lifetime Projection", (12, 7))
+                ax = plot.ax
+                ax.bar(table['year'], table['energy_kwh'], color='blue', label="Energy")
+                ax.bar(table['year'], table['clipping_loss_kwh'], bottom=table['energy_kwh'], color='orange',
+                       label="Clipping loss")
+                ax.set_xlabel("Year")
+                ax.set_ylabel("Energy (kWh)")
+                ax.set_title(f"Energy from {result['start_year']} to {result['end_year']}: "
+                             f"{result['total_kwh']:,.2f} kWh in total")
+                ax.grid(True, axis='y')
+                ax.legend(fontsize=8, loc='upper right')
+                plot.canvas.draw()
+
+            self.run_in_background(lambda progress: lifetime_projection(config, {'start_year': start_year}),
+                                   show, status="Projecting lifetime...")
+
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def show_error_metrics(self):
+        """Show RMSE, MBE, MAE and R² of the simulation against an Excel file, per month and day."""
+        try:
+            start_date = datetime.strptime(self.range_start_date_var.get(), "%d/%m/%Y").date()
+            end_date = datetime.strptime(self.range_end_date_var.get(), "%d/%m/%Y").date()
+            config = self.config()
+            quantity = self.plot_type_var.get()
+            if end_date < start_date:
+                raise ValueError("End date must be after or equal to start date.")
+
+            file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            if not file_path:
+                return
+
+            def show(result):
+                unit = "W" if quantity == "power" else "W/m²"
+                window = tk.Toplevel(self.root)
+                window.title("Error Metrics")
+                ttk.Label(window, text=(
+                    f"{quantity.capitalize()} from {result['start']} to {result['end']}, {result['samples']} samples: "
+                    f"RMSE {result['rmse']:,.1f} {unit} ({result['nrmse_percent']:.1f}%), "
+                    f"MBE {result['mbe']:,.1f} {unit}, MAE {result['mae']:,.1f} {unit}, R² {result['r2']:.3f}")).pack(padx=10, pady=5)
+
+                columns = ("samples", "rmse", "mbe", "mae", "r2", "simulated", "measured")
+                table = ttk.Treeview(window, columns=columns, height=20)
+                table.heading("#0", text="Month / Day")
+                for column, heading in zip(columns, ("Samples", f"RMSE ({unit})", f"MBE ({unit})", f"MAE ({unit})", "R²",
+                                                     f"Simulated ({unit}h)", f"Measured ({unit}h)")):
+                    table.heading(column, text=heading)
+                    table.column(column, width=110, anchor="e")
+
+                def values(table_rows, i):
+                    return (table_rows['samples'][i], f"{table_rows['rmse'][i]:,.1f}", f"{table_rows['mbe'][i]:,.1f}",
+                            f"{table_rows['mae'][i]:,.1f}", f"{table_rows['r2'][i]:.3f}",
+                            f"{table_rows['simulated_wh'][i]:,.0f}", f"{table_rows['measured_wh'][i]:,.0f}")
+
+                # Months as expandable rows holding their days
+                daily, monthly = result['daily'], result['monthly']
+                day_months = daily['date'].astype('datetime64[M]')
+                for i, month in enumerate(monthly['month']):
+                    parent = table.insert("", tk.END, text=str(month), values=values(monthly, i))
+                    for j in np.flatnonzero(day_months == month):
+                        table.insert(parent, tk.END, text=str(daily['date'][j]), values=values(daily, j))
+                table.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+            self.run_in_background(
+                lambda progress: compare_range(config, start_date, end_date, file_path, quantity, progress),
+                show, status="Comparing with measured data...")
+
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def cancel_background(self):
+        """Ask the running computation to stop at its next progress report."""
+        if self._job is not None:
+            self._job.set()
+            self.status_var.set("Cancelling...")
+
+    def compute_date_range_energy(self, include_excel=False):
+        try:
             # Read date range
             start_str = self.range_start_date_var.get()
             end_str = self.range_end_date_var.get()
             start_date = datetime.strptime(start_str, "%d/%m/%Y").date()
             end_date = datetime.strptime(end_str, "%d/%m/%Y").date()
+            config = self.config()
 
             if end_date < start_date:
                 raise ValueError("End date must be after or equal to start date.")
 
-            # Simulate energy over date range
-            simulator = PVSystemSimulator(latitude, longitude, beta, gamma)
-            total_sim_energy = 0
-            current_date = start_date
-            while current_date <= end_date:
-                sim_df = simulator.simulate_day(current_date.year, current_date.month, current_date.day, mult=irr_mult)
-                sim_power = sim_df['Irradiance'] * surface_area * num_modules * Efficiency_mult * power_mult
-                clip1 = self.clip_threshold_var.get()
-                clip2 = self.alt_clip_threshold_var.get()
-                sim_power = np.minimum(sim_power, clip1)
-                sim_power = np.minimum(sim_power, clip2)
-                total_sim_energy += compute_surface_under_plot(sim_df['Time'], sim_power)
-                current_date += timedelta(days=1)
-
             # If Excel is NOT requested, show simulated result only
             if not include_excel:
-                messagebox.showinfo("Total Energy Output",
-                                    f"Simulated energy from {start_str} to {end_str}:\n"
-                                    f"{total_sim_energy / 1000:.2f} kWh")
+                previous = self._energy_index
+
+                def total(progress):
+                    # An index of an overlapping or adjacent range is extended by the requested days
+                    # only; any other range gets a new index rather than simulating the gap
+                    index = previous
+                    if index is not None and (
+                            not index.matches(config) or np.datetime64(start_date) > index.dates[-1] + 1
+                            or np.datetime64(end_date) < index.dates[0] - 1):
+                        index = None
+                    if index is None:
+                        return EnergyIndex.build(config, start_date, end_date, progress=progress)
+                    index.extend(start_date, end_date, progress=progress)
+                    return index
+
+                def show_total(index):
+                    self._energy_index = index
+                    result = index.total(start_date, end_date)
+                    messagebox.showinfo("Total Energy Output",
+                                        f"Simulated energy from {start_str} to {end_str}:\n"
+                                        f"{result['simulated_kwh']:.2f} kWh")
+
+                self.run_in_background(total, show_total, status="Computing energy...")
                 return
 
             # If Excel is requested → ask for file and compute Excel total
-            file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
+            file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
             if not file_path:
                 return
 
-            df = pd.read_excel(file_path)
-            df.columns = df.columns.str.strip().str.lower()
-            df['datetime'] = pd.to_datetime(df['date'])
-            df['power'] = pd.to_numeric(df['power'], errors='coerce')
-            df['irradiance'] = pd.to_numeric(df['irradiance'], errors='coerce')
-            df['hour'] = df['datetime'].dt.hour + df['datetime'].dt.minute / 60
-            df['date_only'] = df['datetime'].dt.date
-
-            total_excel_energy = 0
-            total_sim_energy_corrected = 0
-            current_date = start_date
-
-            while current_date <= end_date:
-                sim_df = simulator.simulate_day(current_date.year, current_date.month, current_date.day, mult = irr_mult)
-                sim_power = sim_df['Irradiance'] * surface_area * num_modules * Efficiency_mult * power_mult
-                sim_power = np.minimum(sim_power, self.clip_threshold_var.get())
-                sim_power = np.minimum(sim_power, self.alt_clip_threshold_var.get())
-                sim_daily_energy = compute_surface_under_plot(sim_df['Time'], sim_power)
-
-                df_day = df[df['date_only'] == current_date].dropna(subset=['power', 'hour'])
-
-                if not df_day.empty:
-                    df_day = df_day.sort_values(by='hour')
-                    excel_power = df_day['power'] * 1e3  # from kW to W
-                    excel_daily_energy = compute_surface_under_plot(df_day['hour'], excel_power)
-
-                    # Compare error
-                    daily_error_percent = ((sim_daily_energy - excel_daily_energy) / excel_daily_energy) * 100
-
-                    if abs(daily_error_percent) > 10:
-                        # Correct using Excel irradiance
-                        if 'irradiance' not in df_day.columns:
-                            raise ValueError("Missing 'irradiance' column in Excel file!")
-
-                        df_day = df[df['date_only'] == current_date].dropna(subset=['irradiance', 'hour'])
-                        df_day = df_day.sort_values(by='hour')
-                        excel_irradiance = df_day['irradiance'] 
-                        corrected_power = excel_irradiance * surface_area * num_modules * Efficiency_mult * power_mult
-                        corrected_power = np.minimum(corrected_power, self.clip_threshold_var.get())
-                        corrected_power = np.minimum(corrected_power, self.alt_clip_threshold_var.get())
-
-                        sim_daily_energy = compute_surface_under_plot(df_day['hour'], corrected_power)
-
-                    # Accumulate
-                    total_excel_energy += excel_daily_energy
-                    total_sim_energy_corrected += sim_daily_energy
-
-                current_date += timedelta(days=1)
-
-            # After the loop → Show final corrected results
-            percent_error = ((total_sim_energy_corrected - total_excel_energy) / total_excel_energy) * 100
-            messagebox.showinfo("Corrected Simulated vs Excel Energy",
-                f"Corrected simulated energy from {start_str} to {end_str}: {total_sim_energy_corrected / 1000:.2f} kWh\n"
-                f"Measured Excel energy from {start_str} to {end_str}: {total_excel_energy / 1000:.2f} kWh\n"
-                f"Error after correction: {percent_error:.2f}%")
+            def show_comparison(result):
+                messagebox.showinfo("Corrected Simulated vs Excel Energy",
+                    f"Corrected simulated energy from {start_str} to {end_str}: {result['corrected_simulated_kwh']:.2f} kWh\n"
+                    f"Measured Excel energy from {start_str} to {end_str}: {result['measured_kwh']:.2f} kWh\n"
+                    f"Error after correction: {result['error_percent']:.2f}%")
+
+            self.run_in_background(
+                lambda progress: date_range_energy(config, start_date, end_date, measured_file=file_path, progress=progress),
+                show_comparison, status="Comparing with measured data...")
 
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
 
+    def calibrate_losses(self):
+        """Fit the losses (and optionally the clipping limit) to an Excel file over the date range."""
+        try:
+            start_str = self.range_start_date_var.get()
+            end_str = self.range_end_date_var.get()
+            start_date = datetime.strptime(start_str, "%d/%m/%Y").date()
+            end_date = datetime.strptime(end_str, "%d/%m/%Y").date()
+            config = self.config()
+            if end_date < start_date:
+                raise ValueError("End date must be after or equal to start date.")
+
+            file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            if not file_path:
+                return
+            fit_clip = messagebox.askyesno("Calibrate Losses", "Also fit the clipping limit?")
+
+            def apply(result):
+                fitted = result['config']
+                message = (f"Fitted to {result['samples']} measured samples from {start_str} to {end_str}.\n"
+                           f"Only the product of the losses can be fitted; it is put into System Losses.\n\n"
+                           f"System Losses: {fitted['system_losses']:.2f}%\n")
+                if result['limit_fitted']:
+                    message += f"Clipping limit: {result['limit']:,.0f} W\n"
+                elif fit_clip:
+                    message += "Clipping limit: unchanged (no other limit fits better)\n"
+                message += f"RMSE: {result['rmse_before_w']:,.1f} W → {result['rmse_after_w']:,.1f} W\n\n"
+                for note in result['warnings']:
+                    message += f"Warning: {note}\n\n"
+                message += "Apply these values?"
+                if messagebox.askyesno("Calibration Result", message):
+                    self.power_multiplier_var.set(round(fitted['system_losses'], 4))
+                    if result['limit_fitted']:
+                        self.clip_threshold_var.set(round(fitted['clip_threshold'], 1))
+                        self.alt_clip_threshold_var.set(round(fitted['alt_clip_threshold'], 1))
+
+            self.run_in_background(
+                lambda progress: calibrate_losses(config, start_date, end_date, file_path, fit_clip, progress=progress),
+                apply, status="Calibrating...")
+
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
     def compare_with_excel(self):
         try:
             # Read GUI inputs
@@ -583,6 +3644,10 @@ class PVSimulatorApp:
             year = self.year_var.get()
             sim_date_str = self.date_var.get().strip()
             excel_date_str = self.excel_date_var.get().strip()
+            chain = self.power_chain()
+            shading = self.shading()
+            plot_type = self.plot_type_var.get()
+            ghi = self.ghi_toggle.get()
 
             # Parse both dates (simulation + Excel)
             months = [
@@ -596,96 +3661,470 @@ class PVSimulatorApp:
             month_sim = months.index(month_sim.capitalize()) + 1
             month_excel = months.index(month_excel.capitalize()) + 1
 
-            from datetime import date
             date_sim = date(year, month_sim, day_sim)
             date_excel = date(year, month_excel, day_excel)
 
-            # Simulate for selected date
-            simulator = PVSystemSimulator(latitude, longitude, beta, gamma)
-            sim_df = simulator.simulate_day(year, month_sim, day_sim)
-
             # Read Excel and filter one day
             file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
             if not file_path:
                 return  # User cancelled
-            df = pd.read_excel(file_path)
-            df.columns = df.columns.str.strip().str.lower()  # ✅ normalize headers
 
-            df['datetime'] = pd.to_datetime(df['date'])
-            df['power'] = pd.to_numeric(df['power'], errors='coerce')  # ✅ convert to numeric
-            df['hour'] = df['datetime'].dt.hour + df['datetime'].dt.minute / 60
-            df['date_only'] = df['datetime'].dt.date
-            df_day = df[df['date_only'] == date_excel]
+            def load(progress):
+                # Simulate for selected date
+                simulator = PVSystemSimulator(latitude, longitude, beta, gamma, shading)
+                sim = SimulationResult.simulate(simulator, date_sim, date_sim, mult=chain.irr_mult)
+                sim.apply_chain(chain)
+                progress(0.1)
+                measured = load_measured(file_path)
+                excel_plane = None
+                if ghi:
+                    rows = measured.day_slice(date_excel)
+                    excel_plane = transpose_to_plane(simulator, measured.timestamps[rows], measured.irradiance[rows])
+                progress(0.9)
+                return sim, measured, excel_plane
+
+            self.run_in_background(
+                load, lambda result: self._plot_excel_comparison(*result, date_sim, date_excel, plot_type),
+                status="Loading measured data...")
+
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
 
+    def _plot_excel_comparison(self, sim, measured, excel_plane, date_sim, date_excel, plot_type):
+        sim_time, sim_irradiance, sim_power = sim.day(0)
+        excel_hour, excel_power, excel_irradiance = measured.day_arrays(date_excel)
+        if excel_plane is not None:
+            excel_irradiance = excel_plane  # GHI transposed to the module plane
 
-            if df_day.empty:
-                raise ValueError(f"No data in Excel for {date_excel}")
-            if 'irradiance' not in df_day.columns:
-                raise ValueError("Missing 'irradiance' column in Excel file")
+        if excel_hour.size == 0:
+            raise ValueError(f"No data in Excel for {date_excel}")
+        if not measured.has_irradiance:
+            raise ValueError("Missing 'irradiance' column in Excel file")
 
-            # Start plotting
-            fig, ax = plt.subplots(figsize=(12, 6))
-            plot_type = self.plot_type_var.get()
+        if plot_type == "power" and not measured.has_power:
+            raise ValueError("Missing 'power' column in Excel file")
 
-            if plot_type == "irradiance":
-                if 'irradiance' not in df_day.columns:
-                    raise ValueError("Missing 'irradiance' column in Excel file")
+        # Start plotting; the measured day may hold thousands of samples, so lines are decimated
+        plot = PlotWindow(self.root, "Irradiance Comparison", (12, 6))
+        ax = plot.ax
 
-                irr_mult = 1 - self.irradiance_multiplier_var.get() / 100 if hasattr(self, 'irradiance_multiplier_var') else 1.0
-                sim_df['Irradiance'] = sim_df['Irradiance'] * irr_mult
-                ax.plot(sim_df['Time'], sim_df['Irradiance'], label=f"Simulated Irradiance ({date_sim})", color='blue')
-                ax.plot(df_day['hour'], df_day['irradiance'], label=f"Excel Irradiance ({date_excel})", color='orange', linestyle='--')
-                ax.set_ylabel("Irradiance (W/m²)")
-                ax.set_title(f"Irradiance Comparison on {date_excel}")
+        if plot_type == "irradiance":
+            plot.plot(f"Simulated Irradiance ({date_sim})", sim_time, sim_irradiance, color='blue')
+            plot.plot(f"Excel Irradiance ({date_excel})", excel_hour, excel_irradiance, color='orange', linestyle='--')
+            ax.set_ylabel("Irradiance (W/m²)")
+            ax.set_title(f"Irradiance Comparison on {date_excel}")
 
 
-            elif plot_type == "power":
-                if 'power' not in df_day.columns:
-                    raise ValueError("Missing 'power' column in Excel file")
+        elif plot_type == "power":
+            excel_power = excel_power * 1e3
 
-                power_mult = 1 - self.power_multiplier_var.get() / 100 if hasattr(self, 'power_multiplier_var') else 1.0
-                irr_mult = 1 - self.irradiance_multiplier_var.get() / 100 if hasattr(self, 'irradiance_multiplier_var') else 1.0
-                Efficiency_mult = 1 - self.Efficiency_multiplier_var.get() / 100 if hasattr(self, 'Efficiency_multiplier_var') else 1.0
-                sim_power = sim_df['Irradiance'] * self.surface_area_var.get() * self.num_modules_var.get() * irr_mult * Efficiency_mult  * power_mult
+            plot.plot(f"Simulated Power ({date_sim})", sim_time, sim_power, color='blue')
+            plot.plot(f"Excel Power ({date_excel})", excel_hour, excel_power, color='orange', linestyle='--')
+            ax.set_ylabel("Power (W)")
+            ax.set_title(f"Power Comparison on {date_excel}")
 
-                clip_threshold = self.clip_threshold_var.get()
-                sim_power = np.minimum(sim_power, clip_threshold)
-                new_clip_threshold = self.alt_clip_threshold_var.get()
-                sim_power = np.minimum(sim_power, new_clip_threshold)
-                excel_power = pd.to_numeric(df_day['power'], errors='coerce') * 1e3
+            ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:,.0f}'))  # Plain number formatting
 
-                ax.plot(sim_df['Time'], sim_power, label=f"Simulated Power ({date_sim})", color='blue')
-                ax.plot(df_day['hour'], excel_power, label=f"Excel Power ({date_excel})", color='orange', linestyle='--')
-                ax.set_ylabel("Power (W)")
-                ax.set_title(f"Power Comparison on {date_excel}")
 
-                from matplotlib.ticker import FuncFormatter
-                ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:,.0f}'))  # Plain number formatting
+        # Common settings
+        ax.set_xlabel("Time (hours)")
+        ax.legend(fontsize=7)
+        ax.grid(True)
 
+        # 🔧 Add finer axis resolution here
+        ax.xaxis.set_major_locator(MultipleLocator(1))   # adjust as needed
 
-            # Common settings
-            ax.set_xlabel("Time (hours)")
-            ax.legend(fontsize=7)
-            ax.grid(True)
+        plot.draw()
 
-            # 🔧 Add finer axis resolution here
-            from matplotlib.ticker import MultipleLocator
-            ax.xaxis.set_major_locator(MultipleLocator(1))   # adjust as needed
-            
+    def plot_range_with_excel(self):
+        """Plot simulated and measured power over the whole date range in one zoomable window.
 
-            # Show in new window
-            window = tk.Toplevel(self.root)
-            window.title("Irradiance Comparison")
-            canvas = FigureCanvasTkAgg(fig, master=window)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        A year of 1-minute data is several hundred thousand points per line;
+        both lines are min/max decimated to the window width and re-decimated
+        when zooming.
+        """
+        try:
+            start_date = datetime.strptime(self.range_start_date_var.get(), "%d/%m/%Y").date()
+            end_date = datetime.strptime(self.range_end_date_var.get(), "%d/%m/%Y").date()
+            if end_date < start_date:
+                raise ValueError("End date must be after or equal to start date.")
+            simulator = simulator_from_config(self.config())
+            chain = self.power_chain()
+
+            file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+            if not file_path:
+                return
+
+            def load(progress):
+                sim = SimulationResult.simulate(simulator, start_date, end_date, mult=chain.irr_mult)
+                sim.apply_chain(chain)
+                progress(0.3)
+                # Padding repeats each day's last sample; bracket every day with zero power at midnight
+                days = mdates.date2num(sim.dates)[:, None]
+                keep = np.arange(sim.time.shape[1]) < np.count_nonzero(sim.time != sim.time[:, -1:], axis=1)[:, None] + 1
+                zeros = np.zeros_like(days)
+                sim_x = np.hstack([days, days + sim.time / 24, days + 1])
+                sim_y = np.hstack([zeros, sim.power, zeros])
+                edge = np.ones_like(days, dtype=bool)
+                keep = np.hstack([edge, keep, edge])
+                progress(0.5)
+
+                measured = load_measured(file_path)
+                if not measured.has_power:
+                    raise ValueError("Missing 'power' column in Excel file")
+                first, last = np.searchsorted(measured.days, [np.datetime64(start_date), np.datetime64(end_date) + 1])
+                rows = slice(measured.offsets[first], measured.offsets[last])
+                progress(0.9)
+                return sim_x[keep], sim_y[keep], mdates.date2num(measured.timestamps[rows]), measured.power[rows] * 1e3
+
+            def show(result):
+                sim_x, sim_y, excel_x, excel_y = result
+                if excel_x.size == 0:
+                    raise ValueError(f"No data in Excel between {start_date} and {end_date}")
+                plot = PlotWindow(self.root, "Power Comparison (Date Range)", (14, 7))
+                ax = plot.ax
+                plot.plot("Simulated Power", sim_x, sim_y, color='blue')
+                plot.plot("Excel Power", excel_x, excel_y, color='orange', alpha=0.8)
+                ax.xaxis_date()
+                ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(ax.xaxis.get_major_locator()))
+                ax.set_ylabel("Power (W)")
+                ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:,.0f}'))
+                ax.set_title(f"Power Comparison from {start_date} to {end_date}")
+                ax.legend(fontsize=7)
+                ax.grid(True)
+                plot.draw()
+
+            self.run_in_background(load, show, status="Loading measured data...")
 
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
 
-
-if __name__ == "__main__":
+def run_gui():
+    _load_gui()
     root = tk.Tk()
     app = PVSimulatorApp(root)
     root.mainloop()
+
+
+def main(argv=None):
+    """Command-line entry point. Without a command the GUI is started."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="PV_System_Simulator.py", description="PV System Simulator")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="write per-stage timings to PATH (.json, or a pstats dump for any other extension)")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('gui', help="start the graphical interface (default)")
+
+    energy = commands.add_parser('energy', help="energy over a date range, optionally compared with measured data")
+    energy.add_argument('config', help="JSON or YAML parameter file")
+    energy.add_argument('--start', help="first day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    energy.add_argument('--end', help="last day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    energy.add_argument('--measured', help="measured .xlsx/.csv file to compare with; overrides the file")
+    energy.add_argument('--method', choices=('numeric', 'analytic'),
+                        help="daily integration: sampled curves or closed form on unclipped days; overrides the file")
+    energy.add_argument('--no-cache', action='store_true', help="recompute instead of reusing a cached result")
+
+    day = commands.add_parser('day', help="simulated irradiance and power of one day as CSV")
+    day.add_argument('config', help="JSON or YAML parameter file")
+    day.add_argument('--date', help="day to simulate (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    day.add_argument('--output', help="CSV file to write (default: stdout)")
+
+    transpose = commands.add_parser('transpose', help="measured horizontal irradiance (GHI) on the module plane, as CSV")
+    transpose.add_argument('config', help="JSON or YAML parameter file (site and orientation)")
+    transpose.add_argument('measured', help="measured .xlsx/.csv file whose irradiance column is GHI")
+    transpose.add_argument('--albedo', type=float, help="ground reflectance (default: the file's, else 0.2)")
+    transpose.add_argument('--output', help="CSV file to write (default: stdout)")
+
+    calibrate = commands.add_parser('calibrate', help="fit the losses (and optionally the clipping limit) to measured power")
+    calibrate.add_argument('config', help="JSON or YAML parameter file")
+    calibrate.add_argument('--measured', help="measured .xlsx/.csv file; overrides the file")
+    calibrate.add_argument('--start', help="first day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    calibrate.add_argument('--end', help="last day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    calibrate.add_argument('--fit-clip', action='store_true', help="also fit the clipping limit")
+    calibrate.add_argument('--absorb', default='system_losses',
+                           choices=('irradiance_losses', 'system_losses', 'efficiency_losses'),
+                           help="loss parameter that takes the fitted correction (default: system_losses)")
+
+    metrics = commands.add_parser('metrics', help="error metrics against every measured sample of a date range")
+    metrics.add_argument('config', help="JSON or YAML parameter file")
+    metrics.add_argument('--measured', help="measured .xlsx/.csv file; overrides the file")
+    metrics.add_argument('--start', help="first day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    metrics.add_argument('--end', help="last day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    metrics.add_argument('--quantity', choices=('power', 'irradiance'), default='power', help="what to compare (default: power)")
+    metrics.add_argument('--daily', metavar='CSV', help="write the per-day error table")
+    metrics.add_argument('--monthly', metavar='CSV', help="write the per-month error table")
+
+    montecarlo = commands.add_parser('montecarlo', help="P50/P90 energy over a date range under loss and clipping uncertainty")
+    montecarlo.add_argument('config', help="JSON or YAML parameter file (optionally with an 'uncertainty' table)")
+    montecarlo.add_argument('--start', help="first day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    montecarlo.add_argument('--end', help="last day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    montecarlo.add_argument('--samples', type=int, default=5000, help="parameter sets to draw (default: 5000)")
+    montecarlo.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    montecarlo.add_argument('--histogram', metavar='CSV', help="write the yield histogram")
+
+    sizing = commands.add_parser('sizing', help="energy and clipping loss over a date range as a function of a clipping limit")
+    sizing.add_argument('config', help="JSON or YAML parameter file")
+    sizing.add_argument('--start', help="first day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    sizing.add_argument('--end', help="last day (yyyy-mm-dd or dd/mm/yyyy); overrides the file")
+    sizing.add_argument('--limit', choices=('clip_threshold', 'alt_clip_threshold'), default='alt_clip_threshold',
+                        help="limit to size: DC (clip_threshold) or AC export (alt_clip_threshold, default)")
+    sizing.add_argument('--n-limits', type=int, default=200, help="candidate limits from 0 to the peak power (default: 200)")
+    sizing.add_argument('--curve', metavar='CSV', help="write the energy-vs-limit curve")
+
+    lifetime = commands.add_parser('lifetime', help="year-by-year energy over the system lifetime with degradation and limit schedules")
+    lifetime.add_argument('config', help="JSON or YAML parameter file (optionally with a 'lifetime' table)")
+    lifetime.add_argument('--years', type=int, help="years to project; overrides the file")
+    lifetime.add_argument('--start-year', type=int, help="first calendar year; overrides the file")
+    lifetime.add_argument('--scenarios', help="JSON list of parameter overrides (each with an optional 'scenario' name), "
+                                              "projected in parallel")
+    lifetime.add_argument('--workers', type=int, help="worker processes for --scenarios (default: all cores)")
+    lifetime.add_argument('--table', metavar='CSV', help="write the year-by-year table (one block per scenario)")
+
+    index = commands.add_parser('index', help="daily energy index: build or update it, and query date ranges")
+    index.add_argument('path', help="index file (.npz)")
+    index.add_argument('--config', help="JSON or YAML parameter file; builds the index or extends an existing one")
+    index.add_argument('--start', help="first day to cover (yyyy-mm-dd or dd/mm/yyyy); overrides the file, and "
+                                       "without --config extends the index with its stored parameters")
+    index.add_argument('--end', help="last day to cover (yyyy-mm-dd or dd/mm/yyyy); as --start")
+    index.add_argument('--measured', help="merge the measured days of this .xlsx/.csv file")
+    index.add_argument('--query', nargs=2, action='append', default=[], metavar=('START', 'END'),
+                       help="energy and error of a date range (repeatable)")
+    index.add_argument('--rollup', choices=('M', 'Y'), help="monthly or annual totals")
+
+    fleet = commands.add_parser('fleet', help="daily and annual energy of many sites in parallel")
+    fleet.add_argument('sites', help="CSV or JSON table of site parameters")
+    fleet.add_argument('--start', required=True, help="first day (yyyy-mm-dd or dd/mm/yyyy)")
+    fleet.add_argument('--end', required=True, help="last day (yyyy-mm-dd or dd/mm/yyyy)")
+    fleet.add_argument('--out', default="fleet_daily.npy", help="(sites x days) daily energy array in Wh (.npy)")
+    fleet.add_argument('--summary', help="CSV of annual energy per site in kWh (default: stdout)")
+    fleet.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    fleet.add_argument('--chunk-size', type=int, default=64, help="sites per task")
+    fleet.add_argument('--method', choices=('numeric', 'analytic'), default='numeric',
+                       help="daily integration: sampled curves or closed form on unclipped days")
+
+    cache = commands.add_parser('cache', help="size of the result cache, or clear it")
+    cache.add_argument('--clear', action='store_true', help="delete all cached results")
+
+    args = parser.parse_args(argv)
+    if args.profile:
+        enable_profiling()
+        reset_stats()
+    try:
+        return _run_command(args)
+    finally:
+        if args.profile:
+            export_stats(args.profile)
+
+
+def _json_finite(value):
+    """`value` with NaN and infinite floats, also inside dicts and lists, replaced by None."""
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _json_finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_finite(item) for item in value]
+    return value
+
+
+def _print_json(result):
+    """Print a command result as standard JSON: null for NaN and infinite values."""
+    json.dump(_json_finite(result), sys.stdout, indent=2, allow_nan=False)
+    sys.stdout.write("\n")
+
+
+def _write_table(path, table):
+    """Write a dict of equal-length columns as CSV."""
+    with open(path, 'w') as out:
+        out.write(",".join(table) + "\n")
+        for row in zip(*table.values()):
+            out.write(",".join(str(value) if isinstance(value, np.datetime64) else f"{value:.6g}" for value in row) + "\n")
+
+
+def _run_command(args):
+    if args.command in (None, 'gui'):
+        run_gui()
+        return 0
+
+    try:
+        if args.command == 'fleet':
+            sites = load_sites(args.sites)
+            dates, daily = run_fleet(sites, args.start, args.end, args.out, args.workers, args.chunk_size, args.method)
+            years, annual = annual_energy(dates, daily)
+            out = open(args.summary, 'w') if args.summary else sys.stdout
+            try:
+                out.write("site," + ",".join(f"{year}_kwh" for year in years) + "\n")
+                for site, row in zip(sites, annual):
+                    out.write(site['site'] + "," + ",".join(f"{value / 1000:.3f}" for value in row) + "\n")
+            finally:
+                if args.summary:
+                    out.close()
+            return 0
+
+        if args.command == 'cache':
+            if RESULT_CACHE is None:
+                raise ValueError("The result cache is off (PV_SIM_RESULT_CACHE_MB=0).")
+            if args.clear:
+                RESULT_CACHE.clear()
+            entries = RESULT_CACHE.entries()
+            _print_json({
+                'directory': RESULT_CACHE.directory,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': RESULT_CACHE.max_bytes,
+            })
+            return 0
+
+        if args.command == 'index':
+            energy_index = EnergyIndex.load(args.path) if os.path.exists(args.path) else None
+            if args.config:
+                config = load_config(args.config)
+                if energy_index is not None and not energy_index.matches(config):
+                    raise ValueError(f"{args.path} was built with other parameters or shading files. "
+                                     f"Please use a new index file.")
+                start = args.start or config.get('start')
+                end = args.end or config.get('end')
+                if energy_index is None and (start is None or end is None):
+                    raise ValueError("A start and end date are required (--start/--end or in the parameter file).")
+                if energy_index is None:
+                    energy_index = EnergyIndex.build(config, start, end)
+                elif start is not None and end is not None:
+                    energy_index.extend(start, end)
+            if energy_index is None:
+                raise ValueError(f"No index at {args.path}. Please build it with --config first.")
+            if not args.config and (args.start or args.end):
+                # Extend with the parameters the index was built with
+                if not energy_index.matches(energy_index.config):
+                    raise ValueError(f"The shading files of {args.path} have changed. Please rebuild it with --config.")
+                energy_index.extend(args.start or energy_index.dates[0], args.end or energy_index.dates[-1])
+            if args.config or args.measured or args.start or args.end:
+                energy_index.save(args.path)
+
+            result = {'first': str(energy_index.dates[0]), 'last': str(energy_index.dates[-1]),
+                      'queries': [energy_index.total(start, end) for start, end in args.query]}
+            if args.rollup:
+                result['rollup'] = {name: [str(value) if isinstance(value, np.datetime64) else value.item() for value in column]
+                                    for name, column in energy_index.rollup(args.rollup).items()}
+            _print_json(result)
+            return 0
+
+        config = load_config(args.config)
+        if args.command == 'energy':
+            start = args.start or config.get('start')
+            end = args.end or config.get('end')
+            if start is None or end is None:
+                raise ValueError("A start and end date are required (--start/--end or in the parameter file).")
+            if args.method:
+                config['method'] = args.method
+            result = date_range_energy(config, start, end, measured_file=args.measured or config.get('measured_file'),
+                                       cache=None if args.no_cache else RESULT_CACHE)
+            _print_json(result)
+
+        elif args.command == 'calibrate':
+            start = args.start or config.get('start')
+            end = args.end or config.get('end')
+            measured_file = args.measured or config.get('measured_file')
+            if start is None or end is None or measured_file is None:
+                raise ValueError("A start date, end date and measured file are required.")
+            result = calibrate_losses(config, start, end, measured_file, args.fit_clip, args.absorb)
+            for note in result['warnings']:
+                print(f"Warning: {note}", file=sys.stderr)
+            _print_json(result)
+
+        elif args.command == 'montecarlo':
+            start = args.start or config.get('start')
+            end = args.end or config.get('end')
+            if start is None or end is None:
+                raise ValueError("A start and end date are required (--start/--end or in the parameter file).")
+            result = monte_carlo_yield(config, start, end, args.samples, seed=args.seed)
+            del result['energies_kwh']
+            counts, edges = result.pop('histogram')
+            if args.histogram:
+                _write_table(args.histogram, {'from_kwh': edges[:-1], 'to_kwh': edges[1:], 'samples': counts})
+            _print_json(result)
+
+        elif args.command == 'sizing':
+            start = args.start or config.get('start')
+            end = args.end or config.get('end')
+            if start is None or end is None:
+                raise ValueError("A start and end date are required (--start/--end or in the parameter file).")
+            result = clipping_curve(config, start, end, args.limit, n_limits=args.n_limits)
+            curve = {name: result.pop(name) for name in ('limits_w', 'energy_kwh', 'loss_kwh', 'loss_percent')}
+            if args.curve:
+                _write_table(args.curve, curve)
+            _print_json(result)
+
+        elif args.command == 'lifetime':
+            overrides = {name: value for name, value in (('years', args.years), ('start_year', args.start_year))
+                         if value is not None}
+            config['lifetime'] = {**(config.get('lifetime') or {}), **overrides}
+            scenarios = [{}]
+            if args.scenarios:
+                with open(args.scenarios) as f:
+                    scenarios = json.load(f)
+            configs = []
+            for scenario in scenarios:
+                unknown = set(scenario) - set(DEFAULT_CONFIG) - set(_RUN_KEYS) - {'scenario'}
+                if unknown:
+                    raise ValueError(f"Unknown parameters in {args.scenarios}: {', '.join(sorted(unknown))}")
+                configs.append({**config, **scenario, 'lifetime': {**config['lifetime'], **(scenario.get('lifetime') or {})}})
+            results = lifetime_scenarios(configs, args.workers)
+            tables = [result.pop('table') for result in results]
+            if args.scenarios:
+                for i, (scenario, result) in enumerate(zip(scenarios, results)):
+                    result['scenario'] = str(scenario.get('scenario', i))
+            if args.table:
+                _write_table(args.table, {'scenario': np.concatenate([np.full(table['year'].size, i) for i, table in enumerate(tables)]),
+                                          **{name: np.concatenate([table[name] for table in tables]) for name in tables[0]}})
+            _print_json(results[0] if not args.scenarios else {'scenarios': results})
+
+        elif args.command == 'metrics':
+            start = args.start or config.get('start')
+            end = args.end or config.get('end')
+            measured_file = args.measured or config.get('measured_file')
+            if start is None or end is None or measured_file is None:
+                raise ValueError("A start date, end date and measured file are required.")
+            result = compare_range(config, start, end, measured_file, args.quantity)
+            for name, path in (('daily', args.daily), ('monthly', args.monthly)):
+                table = result.pop(name)
+                if path:
+                    _write_table(path, table)
+            _print_json(result)
+
+        elif args.command == 'transpose':
+            measured = load_measured(args.measured)
+            albedo = args.albedo if args.albedo is not None else config.get('albedo', 0.2)
+            plane = transpose_to_plane(simulator_from_config(config), measured.timestamps, measured.irradiance, albedo)
+            out = open(args.output, 'w') if args.output else sys.stdout
+            try:
+                out.write("date,ghi,poa\n")
+                for timestamp, ghi, poa in zip(measured.timestamps.astype('datetime64[s]').astype(str),
+                                               measured.irradiance, plane):
+                    out.write(f"{timestamp},{ghi:.6f},{poa:.6f}\n")
+            finally:
+                if args.output:
+                    out.close()
+
+        elif args.command == 'day':
+            day_value = args.date or config.get('date')
+            if day_value is None:
+                raise ValueError("A date is required (--date or in the parameter file).")
+            time, irradiance, power = simulate_power_day(config, day_value)
+            out = open(args.output, 'w') if args.output else sys.stdout
+            try:
+                out.write("Time,Irradiance,Power\n")
+                for row in zip(time, irradiance, power):
+                    out.write("%.6f,%.6f,%.6f\n" % row)
+            finally:
+                if args.output:
+                    out.close()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
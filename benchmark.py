@@ -0,0 +1,225 @@
+"""Benchmarks for the simulation and measured-data comparison paths.
+
+Synthetic measurement files (1 day, 1 year and 5 years at 1, 5 and 15 minute
+resolution) are generated from the simulator itself with a fixed random seed,
+so every run times exactly the same work. Each file is compared both in memory
+and through the day-by-day streaming path that files over 200 MB take. Results
+are written as JSON; with a baseline file the run fails when a case got slower
+than the threshold.
+
+    python benchmark.py                                        # run and print
+    python benchmark.py --save-baseline bench_baseline.json    # record a baseline
+    python benchmark.py --baseline bench_baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# Keep the measured-data cache of the benchmark away from the user's cache
+os.environ.setdefault("PV_SIM_CACHE_DIR", tempfile.mkdtemp(prefix="pv_bench_cache_"))
+# Time the computations, not result-cache hits
+os.environ["PV_SIM_RESULT_CACHE_MB"] = "0"
+
+import PV_System_Simulator as pv
+
+
+SITE = {'latitude': 31.7187, 'longitude': 34.7287, 'beta': 16, 'gamma': 180}
+YEAR = 2024
+SPANS = {'1d': 1, '1y': 366, '5y': 5 * 365 + 1}
+RESOLUTIONS = (1, 5, 15)  # minutes
+XLSX_MAX_ROWS = 40_000  # larger files are written as CSV, writing big workbooks takes minutes
+
+
+def synthetic_measurements(days, resolution, seed=0):
+    """DataFrame with date, irradiance (W/m²) and power (kW) every `resolution` minutes.
+
+    Irradiance is the simulated clear-sky irradiance dimmed by random clouds,
+    power follows it through the default power chain.
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    start = date(YEAR, 1, 1)
+    end = start + timedelta(days=days - 1)
+    simulator = pv.PVSystemSimulator(**SITE)
+    chain = pv.power_chain_from_config(pv.DEFAULT_CONFIG)
+    dates, time_grid, irradiance = simulator.simulate_range(start, end)
+
+    hours = np.arange(0, 24 * 60, resolution) / 60
+    sampled = np.empty((dates.size, hours.size))
+    for i in range(dates.size):
+        valid = ~np.isnan(time_grid[i])
+        if valid.any():
+            sampled[i] = np.interp(hours, time_grid[i, valid], irradiance[i, valid], left=0, right=0)
+        else:
+            sampled[i] = 0
+    clouds = np.clip(1 - rng.gamma(0.5, 0.3, size=sampled.shape), 0.05, 1)
+    sampled *= clouds
+
+    timestamps = (dates[:, None] + (hours * 60).astype('timedelta64[m]')).ravel()
+    return pd.DataFrame({
+        'date': timestamps,
+        'irradiance': sampled.ravel(),
+        'power': chain.apply(sampled.ravel() * chain.irr_mult) / 1e3,  # from W to kW
+    })
+
+
+def write_dataset(directory, span, resolution):
+    """Write one synthetic measurement file and return its path."""
+    frame = synthetic_measurements(SPANS[span], resolution)
+    if len(frame) <= XLSX_MAX_ROWS:
+        path = os.path.join(directory, f"measured_{span}_{resolution}min.xlsx")
+        frame.to_excel(path, index=False)
+    else:
+        path = os.path.join(directory, f"measured_{span}_{resolution}min.csv")
+        frame.to_csv(path, index=False)
+    return path
+
+
+# In-memory caches of the simulator; cleared before every timed call so each
+# case times the computation, not a cache lookup
+CACHES = (pv._day_irradiance, pv._range_irradiance, pv.site_geometry, pv._load_measured_cached)
+
+
+def clear_caches():
+    for cache in CACHES:
+        cache.cache_clear()
+
+
+def timed(func, repeat):
+    """Median and minimum wall time of `repeat` cold calls (in-memory caches cleared first), in seconds."""
+    durations = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(durations), 'min_s': min(durations), 'repeat': repeat}
+
+
+def streamed(func):
+    """Run `func` with the streaming threshold at zero, so every measurement file is streamed."""
+    def run():
+        threshold = pv.STREAM_THRESHOLD_BYTES
+        pv.STREAM_THRESHOLD_BYTES = 0
+        try:
+            return func()
+        finally:
+            pv.STREAM_THRESHOLD_BYTES = threshold
+    return run
+
+
+def benchmark_cases(directory, spans):
+    """(name, callable, repeat) for every benchmarked path."""
+    config = dict(pv.DEFAULT_CONFIG)
+    chain = pv.power_chain_from_config(config)
+    simulator = pv.PVSystemSimulator(**SITE)
+    start = date(YEAR, 1, 1)
+
+    def beta_sweep():
+        # Same work as the β swipe in the GUI plot, without drawing
+        for beta in np.arange(10, 60, 10):
+            sweep_simulator = pv.PVSystemSimulator(SITE['latitude'], SITE['longitude'], beta, SITE['gamma'])
+            time_grid, irradiance = sweep_simulator.simulate_day_arrays(YEAR, 6, 21, mult=chain.irr_mult)
+            chain.apply(irradiance)
+
+    def gamma_sweep():
+        # Same work as the γ swipe in the GUI plot, without drawing
+        time_grid, alpha, psi, ion = simulator.day_sun_position(YEAR, 6, 21)
+        for gamma in np.arange(150, 220, 10):
+            chain.apply(simulator.module_irradiance(ion, alpha, psi, gamma=gamma) * chain.irr_mult)
+
+    cases = [
+        ("simulate_day", lambda: simulator.simulate_day(YEAR, 6, 21), 20),
+        ("plot_sweep_beta", beta_sweep, 10),
+        ("plot_sweep_gamma", gamma_sweep, 10),
+        ("orientation_sweep_1y_5deg", lambda: pv.orientation_sweep(
+            SITE['latitude'], SITE['longitude'], np.arange(0, 91, 5), np.arange(90, 271, 5),
+            date(YEAR, 1, 1), date(YEAR, 12, 31), chain), 3),
+    ]
+    for span in spans:
+        end = start + timedelta(days=SPANS[span] - 1)
+        cases.append((f"range_energy_{span}",
+                      lambda end=end: pv.date_range_energy(config, start, end), 5))
+        for resolution in RESOLUTIONS:
+            path = write_dataset(directory, span, resolution)
+            suffix = f"{span}_{resolution}min"
+            cases.append((f"ingest_{suffix}", lambda path=path: pv.MeasuredData.from_file(path), 3))
+            # The warm-up leaves the parsed file in the on-disk measured-data cache, so this
+            # times loading it from there plus the simulation and comparison, not Excel/CSV parsing
+            compare_measured = lambda path=path, end=end: pv.date_range_energy(config, start, end, measured_file=path)
+            cases.append((f"range_energy_excel_{suffix}", compare_measured, 3))
+            # The synthetic files stay below the 200 MB threshold, so force the streaming path
+            cases.append((f"range_energy_stream_{suffix}", streamed(compare_measured), 3))
+    return cases
+
+
+def compare(results, baseline, threshold, min_delta):
+    """(name, baseline, current) median times of the cases slower than the baseline by more than `threshold`."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median_s'], result['median_s']
+        if after - before > max(threshold * before, min_delta):
+            regressions.append((name, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PV System Simulator")
+    parser.add_argument('--spans', nargs='+', choices=list(SPANS), default=list(SPANS),
+                        help="measurement spans to generate (default: all)")
+    parser.add_argument('--output', help="JSON file for the results (default: stdout)")
+    parser.add_argument('--baseline', help="baseline JSON to compare with; exit 1 on regression")
+    parser.add_argument('--save-baseline', help="write the results as a new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed relative slowdown against the baseline (default: 0.25)")
+    parser.add_argument('--min-delta', type=float, default=0.002,
+                        help="slowdowns below this many seconds are ignored (default: 0.002)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="pv_bench_") as directory:
+        for name, func, repeat in benchmark_cases(directory, args.spans):
+            func()  # warm-up: imports and the on-disk measured-data cache
+            results[name] = timed(func, repeat)
+            print(f"{name:40s} {results[name]['median_s'] * 1e3:10.2f} ms", file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1e3:.2f} ms -> {after * 1e3:.2f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
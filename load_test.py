@@ -0,0 +1,178 @@
+"""Load test for pv_service.py on localhost.
+
+Starts the service on a free port (or uses an already running one with
+--port), then keeps --clients keep-alive connections busy. Each connection
+sends --requests batch requests of --batch jobs. Jobs are drawn with a fixed
+seed from --distinct site/orientation/date-range combinations, so repeats
+exercise the coalescing and the in-memory results; use --distinct 0 for all
+different jobs. Throughput and latency percentiles are printed as JSON.
+
+    python load_test.py                                  # default mix
+    python load_test.py --clients 32 --batch 1 --distinct 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def make_jobs(count, distinct, seed=0):
+    """`count` jobs drawn from `distinct` combinations (all different when distinct is 0)."""
+    rng = np.random.default_rng(seed)
+    n = count if distinct <= 0 else distinct
+    starts = np.datetime64('2024-01-01') + rng.integers(0, 335, n)
+    lengths = rng.choice([7, 30, 90, 365], n)
+    pool = [{
+        'latitude': round(float(latitude), 3), 'longitude': round(float(longitude), 3),
+        'beta': int(beta), 'gamma': int(gamma),
+        'start': str(start), 'end': str(start + length - 1),
+    } for latitude, longitude, beta, gamma, start, length in zip(
+        rng.uniform(20, 50, n), rng.uniform(-10, 40, n), rng.integers(0, 60, n), rng.integers(90, 271, n),
+        starts, lengths)]
+    if distinct <= 0:
+        return pool
+    return [pool[i] for i in rng.integers(0, n, count)]
+
+
+async def request(reader, writer, method, path, payload=None):
+    """Send one request on an open connection and return the decoded JSON response."""
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    status = (await reader.readline()).decode('latin-1').split(' ', 2)[1]
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    response = json.loads(await reader.readexactly(length))
+    if status != '200':
+        raise RuntimeError(f"{method} {path}: {status} {response}")
+    return response
+
+
+async def client(port, batches, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    errors = 0
+    try:
+        for jobs in batches:
+            start = time.perf_counter()
+            response = await request(reader, writer, 'POST', '/batch', {'jobs': jobs})
+            latencies.append(time.perf_counter() - start)
+            errors += sum('error' in result for result in response['results'])
+    finally:
+        writer.close()
+    return errors
+
+
+async def run(port, clients, requests, batch, distinct, seed):
+    jobs = make_jobs(clients * requests * batch, distinct, seed)
+    latencies = []
+    tasks = []
+    for c in range(clients):
+        mine = jobs[c * requests * batch:(c + 1) * requests * batch]
+        tasks.append(client(port, [mine[i:i + batch] for i in range(0, len(mine), batch)], latencies))
+    start = time.perf_counter()
+    errors = sum(await asyncio.gather(*tasks))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    stats = await request(reader, writer, 'GET', '/stats')
+    writer.close()
+
+    latencies_ms = np.array(latencies) * 1e3
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'jobs': len(jobs),
+        'job_errors': errors,
+        'seconds': elapsed,
+        'requests_per_s': len(latencies) / elapsed,
+        'jobs_per_s': len(jobs) / elapsed,
+        'latency_ms': {
+            'mean': statistics.fmean(latencies_ms),
+            'p50': float(np.percentile(latencies_ms, 50)),
+            'p90': float(np.percentile(latencies_ms, 90)),
+            'p99': float(np.percentile(latencies_ms, 99)),
+            'max': float(latencies_ms.max()),
+        },
+        'server': stats,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_service(port, workers):
+    """Start pv_service.py in a subprocess and wait until it accepts connections."""
+    env = dict(os.environ)
+    # Measure the service, not results left on disk by earlier runs
+    env.setdefault("PV_SIM_CACHE_DIR", tempfile.mkdtemp(prefix="pv_load_test_cache_"))
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pv_service.py"),
+               "--port", str(port)]
+    if workers:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("pv_service.py exited during startup")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("pv_service.py did not start within 30 s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the PV simulation service")
+    parser.add_argument('--port', type=int, help="port of a running service (default: start one on a free port)")
+    parser.add_argument('--workers', type=int, help="worker threads of the started service")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent connections (default: 16)")
+    parser.add_argument('--requests', type=int, default=20, help="batch requests per connection (default: 20)")
+    parser.add_argument('--batch', type=int, default=8, help="jobs per request (default: 8)")
+    parser.add_argument('--distinct', type=int, default=200,
+                        help="distinct jobs to draw from; 0 makes every job different (default: 200)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the job mix (default: 0)")
+    parser.add_argument('--output', help="JSON file for the report (default: stdout)")
+    args = parser.parse_args(argv)
+
+    process = None
+    port = args.port
+    if port is None:
+        port = free_port()
+        process = start_service(port, args.workers)
+    try:
+        report = asyncio.run(run(port, args.clients, args.requests, args.batch, args.distinct, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report['job_errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Local HTTP/JSON service for batch yield simulations.
+
+    python pv_service.py --port 8765 --workers 4
+
+    POST /energy   one job: parameters as in a parameter file, plus start and end
+    POST /batch    {"jobs": [job, ...]} -> {"results": [result or {"error": ...}, ...]}
+    GET  /stats    request, job, coalescing and cache counters
+    GET  /health
+
+A job gets the same answer as `PV_System_Simulator.py energy` with those
+parameters. Jobs that finished before are answered from memory, as long as
+the measured and shading files they name are unchanged. A job that
+is identical to one still running waits for that computation instead of
+starting its own. Everything else runs on a thread pool; the asyncio front
+end only parses requests and awaits results, so slow jobs do not hold up
+other clients. The thread pool shares the simulator's per-site geometry and
+irradiance caches, which stay warm between requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import PV_System_Simulator as pv
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+# Job parameters naming input files; their content is part of the job key
+FILE_KEYS = ('measured_file',) + pv._SHADING_KEYS
+
+
+class SimulationService:
+    """Coalescing, memoizing front for date_range_energy jobs."""
+
+    def __init__(self, workers=None, max_results=10_000):
+        # ThreadPoolExecutor's own default, resolved here so /stats can report it
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pv-worker")
+        self.max_results = max_results
+        self.results = OrderedDict()  # job key -> result, least recently used first
+        self.in_flight = {}  # job key -> future of the running computation
+        self.stats = {'requests': 0, 'jobs': 0, 'computed': 0, 'coalesced': 0, 'memory_hits': 0, 'errors': 0}
+
+    @staticmethod
+    def normalize(job):
+        """Full parameter set of a job, with numbers coerced and dates in ISO form."""
+        if not isinstance(job, dict):
+            raise ValueError("A job must be a JSON object.")
+        unknown = set(job) - set(pv.DEFAULT_CONFIG) - set(pv._RUN_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        if job.get('start') is None or job.get('end') is None:
+            raise ValueError("A job needs a start and an end date.")
+        config = {**pv.DEFAULT_CONFIG, **job}
+        for name in pv.DEFAULT_CONFIG:
+            value = config[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"Parameter '{name}' must be a number.")
+            try:
+                config[name] = int(value) if name == 'num_modules' else float(value)
+            except ValueError:
+                raise ValueError(f"Parameter '{name}' must be a number.")
+        for name in FILE_KEYS:
+            if config.get(name) is not None and not isinstance(config[name], str):
+                raise ValueError(f"Parameter '{name}' must be a file path.")
+        config['start'] = pv.parse_date(config['start']).isoformat()
+        config['end'] = pv.parse_date(config['end']).isoformat()
+        return config
+
+    @staticmethod
+    def job_key(config):
+        """Canonical JSON of a normalized job plus the content hash of every file it names.
+        Hashing reads the files, so this runs on the thread pool."""
+        files = {name: pv.measured_digest(config[name]) for name in FILE_KEYS if config.get(name)}
+        return json.dumps({'config': config, 'files': files}, sort_keys=True)
+
+    @staticmethod
+    def compute(config):
+        return pv.date_range_energy(config, config['start'], config['end'], measured_file=config.get('measured_file'))
+
+    async def run_job(self, job):
+        self.stats['jobs'] += 1
+        config = self.normalize(job)
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(self.pool, self.job_key, config)
+        if key in self.results:
+            self.results.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return self.results[key]
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        future = loop.run_in_executor(self.pool, self.compute, config)
+        self.in_flight[key] = future
+        try:
+            # Shielded, so a client that disconnects does not cancel the job for the others
+            result = await asyncio.shield(future)
+        finally:
+            self.in_flight.pop(key, None)
+        self.stats['computed'] += 1
+        self.results[key] = result
+        if len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+        return result
+
+    async def run_batch_job(self, job):
+        """Result of one job of a batch, or its error, so a bad job cannot fail the others."""
+        try:
+            return await self.run_job(job)
+        except (ValueError, KeyError, OSError) as e:
+            self.stats['errors'] += 1
+            return {'error': str(e)}
+        except Exception as e:
+            self.stats['errors'] += 1
+            return {'error': f"Internal error: {type(e).__name__}: {e}"}
+
+    async def dispatch(self, method, path, body):
+        """(status, payload) of one request."""
+        self.stats['requests'] += 1
+        routes = {'/health': 'GET', '/stats': 'GET', '/energy': 'POST', '/batch': 'POST'}
+        if path not in routes:
+            return 404, {'error': f"Unknown path {path}"}
+        if method != routes[path]:
+            return 405, {'error': f"{path} expects {routes[path]}"}
+
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/stats':
+            return 200, {**self.stats, 'in_flight': len(self.in_flight), 'cached_results': len(self.results),
+                         'workers': self.workers}
+
+        try:
+            request = json.loads(body or b'null')
+            if path == '/energy':
+                return 200, await self.run_job(request)
+            if not isinstance(request, dict) or not isinstance(request.get('jobs'), list):
+                raise ValueError('A batch must be {"jobs": [...]}.')
+            return 200, {'results': await asyncio.gather(*(self.run_batch_job(job) for job in request['jobs']))}
+        except (ValueError, KeyError, OSError) as e:
+            self.stats['errors'] += 1
+            return 400, {'error': str(e)}
+        except Exception as e:
+            self.stats['errors'] += 1
+            return 500, {'error': f"Internal error: {type(e).__name__}: {e}"}
+
+    async def handle(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one (keep-alive) connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.dispatch(method, path.split('?', 1)[0], body)
+                data = json.dumps(pv._json_finite(payload), allow_nan=False).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        f"Content-Type: application/json\r\n"
+                        f"Content-Length: {len(data)}\r\n")
+                if not keep_alive:
+                    head += "Connection: close\r\n"
+                writer.write(head.encode('latin-1') + b"\r\n" + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # Malformed request or client gone
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Listening on http://{host}:{port}", file=sys.stderr, flush=True)
+        if ready is not None:
+            ready()
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON batch service for the PV System Simulator")
+    parser.add_argument('--host', default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument('--workers', type=int, help="simulation threads (default: Python's thread pool default)")
+    parser.add_argument('--max-results', type=int, default=10_000, help="finished results kept in memory (default: 10000)")
+    args = parser.parse_args(argv)
+
+    service = SimulationService(args.workers, args.max_results)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
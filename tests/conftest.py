@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Keep the on-disk caches of the test run away from the user's cache; the
+# result cache is off so every test computes what it checks
+os.environ["PV_SIM_CACHE_DIR"] = tempfile.mkdtemp(prefix="pv_test_cache_")
+os.environ["PV_SIM_RESULT_CACHE_MB"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
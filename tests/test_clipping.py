@@ -0,0 +1,112 @@
+"""Sorted prefix-sum evaluation of P = min(k · I, L) against the direct loops it replaces:
+calibration errors, clipping curves, Monte Carlo samples and lifetime years."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import PV_System_Simulator as pv
+
+# About 4.7 kW peak, so both clipping limits cut into the summer days
+SYSTEM = dict(pv.DEFAULT_CONFIG, surface_area=1.7, num_modules=20, clip_threshold=5000, alt_clip_threshold=4000)
+
+
+def range_energy(config, start, end):
+    """Energy (Wh) of a parameter set, simulated and integrated day by day."""
+    simulator = pv.simulator_from_config(config)
+    chain = pv.power_chain_from_config(config)
+    total = 0.0
+    for day in np.arange(np.datetime64(start), np.datetime64(end) + 1):
+        day = day.astype(object)
+        time, irradiance = simulator.simulate_day_arrays(day.year, day.month, day.day, mult=chain.irr_mult)
+        power = chain.apply(irradiance)
+        total += sum((power[i] + power[i + 1]) / 2 * (time[i + 1] - time[i]) for i in range(time.size - 1))
+    return total
+
+
+def test_clipped_sse_matches_loop():
+    rng = np.random.default_rng(1)
+    x = np.sort(rng.uniform(0, 1, 500))
+    y = np.minimum(0.8 * x, 0.6) + rng.normal(0, 0.02, x.size)
+    prefix = [np.concatenate(([0], np.cumsum(values))) for values in (x * x, x * y, y, y * y)]
+    for scale in (0.3, 0.8, 1.7):
+        for limit in (0.0, 0.2, 0.6, 2.0, np.inf):
+            direct = sum((min(scale * xi, limit) - yi) ** 2 for xi, yi in zip(x, y))
+            assert pv._clipped_sse(prefix, x, scale, limit) == pytest.approx(direct, rel=1e-9, abs=1e-12)
+
+
+def test_calibration_rmse_matches_direct_residuals(tmp_path):
+    start, end = "2024-06-01", "2024-06-07"
+    simulator = pv.simulator_from_config(SYSTEM)
+    dates, time, irradiance = simulator.simulate_range(start, end)
+    stamps = np.arange(np.datetime64(start), np.datetime64(end) + 1, np.timedelta64(10, 'm')).astype('datetime64[ns]')
+    measured = pv.MeasuredData.from_frame(pd.DataFrame({'date': stamps, 'power': np.zeros(stamps.size)}))
+    _, _, sim = pv.align_to_measured(dates, time, irradiance, measured)
+    truth = np.minimum(0.2 * sim, 3500) + np.random.default_rng(2).normal(0, 20, sim.size)
+    path = tmp_path / "measured.csv"
+    pd.DataFrame({'date': stamps.astype(str), 'power': truth / 1000}).to_csv(path, index=False)
+
+    result = pv.calibrate_losses(SYSTEM, start, end, str(path), fit_clip=True)
+    fitted = np.array([min(result['scale'] * value, result['limit']) for value in sim])
+    assert result['samples'] == sim.size
+    assert result['limit_fitted']
+    assert result['rmse_after_w'] == pytest.approx(np.sqrt(np.mean((fitted - truth) ** 2)), rel=1e-6)
+    assert result['rmse_after_w'] < 25
+
+
+def test_clipped_energy_matches_loop():
+    _, time, irradiance = pv.simulator_from_config(SYSTEM).simulate_range("2024-03-01", "2024-03-10")
+    energy, peak = pv._clipped_energy(time, irradiance)
+    assert peak == irradiance.max()
+    for scale in (10, 30):
+        for limit in (0.0, 5000.0, 12000.0, np.inf):
+            direct = 0.0
+            for t, values in zip(time, irradiance):
+                power = np.minimum(scale * values, limit)
+                direct += sum((power[i] + power[i + 1]) / 2 * (t[i + 1] - t[i]) for i in range(t.size - 1))
+            assert energy(scale, limit) == pytest.approx(direct, rel=1e-9, abs=1e-9)
+
+
+def test_clipping_curve_matches_resimulation():
+    start, end = "2024-06-10", "2024-06-13"
+    limits = [0, 2500, 3500, 4500, 6000]
+    curve = pv.clipping_curve(SYSTEM, start, end, limits=limits)
+    for limit, energy in zip(limits, curve['energy_kwh']):
+        direct = range_energy(dict(SYSTEM, alt_clip_threshold=limit), start, end)
+        assert energy * 1000 == pytest.approx(direct, rel=1e-9, abs=1e-9)
+    assert curve['configured_energy_kwh'] * 1000 == pytest.approx(range_energy(SYSTEM, start, end), rel=1e-9)
+
+
+def test_monte_carlo_samples_match_resimulation():
+    start, end = "2024-06-10", "2024-06-12"
+    samples = 6
+    result = pv.monte_carlo_yield(SYSTEM, start, end, samples=samples, seed=3)
+    # The same draws, in the order monte_carlo_yield takes them
+    rng = np.random.default_rng(3)
+    drawn = {}
+    for name, sigma in pv.DEFAULT_UNCERTAINTY.items():
+        if name.endswith('_losses'):
+            drawn[name] = np.clip(rng.normal(SYSTEM[name], sigma, samples), 0, 100)
+        else:
+            drawn[name] = np.maximum(rng.normal(SYSTEM[name], SYSTEM[name] * sigma / 100, samples), 0)
+    for i, energy in enumerate(result['energies_kwh']):
+        config = dict(SYSTEM, **{name: float(values[i]) for name, values in drawn.items()})
+        assert energy * 1000 == pytest.approx(range_energy(config, start, end), rel=1e-9)
+    assert result['deterministic_kwh'] * 1000 == pytest.approx(range_energy(SYSTEM, start, end), rel=1e-9)
+
+
+def test_lifetime_matches_year_by_year_simulation():
+    lifetime = {'years': 3, 'start_year': 2023, 'first_year_degradation': 1.0, 'degradation': [0.5, 0.7, 0.9],
+                'inverter_degradation': 2.0, 'inverter_replacements': [3], 'alt_clip_threshold': {2024: 3000}}
+    result = pv.lifetime_projection(SYSTEM, lifetime)
+    assert result['reference_years'] == [2023, 2024]
+    simulator = pv.simulator_from_config(SYSTEM)
+    chain = pv.power_chain_from_config(SYSTEM)
+    module, inverter, limits = [0.99, 0.99 * 0.995, 0.99 * 0.988], [1.0, 0.98, 1.0], [4000, 3000, 3000]
+    for year, module_factor, inverter_factor, limit, energy in zip(
+            (2023, 2024, 2025), module, inverter, limits, result['table']['energy_kwh']):
+        _, time, irradiance = simulator.simulate_range(date(year, 1, 1), date(year, 12, 31))
+        power = np.minimum(chain.scale * module_factor * inverter_factor * irradiance, limit)
+        direct = ((power[:, 1:] + power[:, :-1]) / 2 * np.diff(time, axis=1)).sum()
+        assert energy * 1000 == pytest.approx(direct, rel=1e-9)
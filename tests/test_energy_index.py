@@ -0,0 +1,79 @@
+"""EnergyIndex prefix-sum totals and rollups against direct sums over the daily energies."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import PV_System_Simulator as pv
+
+CONFIG = dict(pv.DEFAULT_CONFIG)
+
+
+def measured_store(start, end, seed=0):
+    """Hourly measured power (kW) on `start`, `end` and random days in between."""
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+    days = np.union1d(days[[0, -1]], rng.choice(days, size=days.size // 3, replace=False))
+    stamps = (days[:, None] + np.arange(6, 19).astype('timedelta64[h]')).ravel()
+    return pv.MeasuredData.from_frame(pd.DataFrame({'date': stamps, 'power': rng.uniform(0, 0.1, stamps.size)}))
+
+
+def direct_total(dates, simulated, measured, first, last):
+    days = [i for i in range(dates.size) if np.datetime64(first) <= dates[i] <= np.datetime64(last)]
+    on_measured = [i for i in days if np.isfinite(measured[i])]
+    simulated_measured = sum(simulated[i] for i in on_measured)
+    measured_total = sum(measured[i] for i in on_measured)
+    return {
+        'days': len(days),
+        'measured_days': len(on_measured),
+        'simulated_kwh': sum(simulated[i] for i in days) / 1000,
+        'measured_kwh': measured_total / 1000,
+        'simulated_on_measured_days_kwh': simulated_measured / 1000,
+        'error_percent': (simulated_measured - measured_total) / measured_total * 100 if on_measured else np.nan,
+    }
+
+
+def assert_totals(totals, expected):
+    for name, value in expected.items():
+        assert totals[name] == pytest.approx(value, rel=1e-12, abs=1e-9, nan_ok=True), name
+
+
+def test_extended_index_matches_direct_sums():
+    index = pv.EnergyIndex.build(CONFIG, "2024-02-10", "2024-03-20", cache=None)
+    index.extend("2024-01-15", "2024-04-05", cache=None)
+    measured = measured_store("2024-01-01", "2024-04-30")
+    index.add_measured(measured)
+
+    dates, simulated = pv.simulator_from_config(CONFIG).range_energy(
+        "2024-01-01", "2024-04-30", pv.power_chain_from_config(CONFIG))
+    np.testing.assert_array_equal(index.dates, dates)
+    np.testing.assert_allclose(index.simulated, simulated, rtol=1e-12)
+    energy, samples = measured.daily_power_energy()
+    expected_measured = np.full(dates.size, np.nan)
+    expected_measured[np.searchsorted(dates, measured.days[samples > 0])] = energy[samples > 0]
+    np.testing.assert_array_equal(index.measured, expected_measured)
+
+    for first, last in [("2024-01-01", "2024-04-30"), ("2024-02-29", "2024-02-29"), ("2024-01-20", "2024-03-31")]:
+        assert_totals(index.total(first, last), direct_total(dates, simulated, expected_measured, first, last))
+
+    rollup = index.rollup('M')
+    for i, month in enumerate(rollup['period']):
+        first = month.astype('datetime64[D]')
+        last = (month + 1).astype('datetime64[D]') - 1
+        assert_totals({name: values[i] for name, values in rollup.items()},
+                      direct_total(dates, simulated, expected_measured, first, last))
+
+
+def test_saved_index_round_trips(tmp_path):
+    index = pv.EnergyIndex.build(CONFIG, "2024-05-01", "2024-05-31", cache=None)
+    index.add_measured(measured_store("2024-05-01", "2024-05-31", seed=1))
+    index.save(tmp_path / "index.npz")
+    loaded = pv.EnergyIndex.load(tmp_path / "index.npz")
+    assert loaded.matches(CONFIG)
+    assert not loaded.matches(dict(CONFIG, beta=20))
+    assert_totals(loaded.total("2024-05-03", "2024-05-27"), index.total("2024-05-03", "2024-05-27"))
+
+
+def test_dates_outside_the_index_are_rejected():
+    index = pv.EnergyIndex.build(CONFIG, "2024-05-01", "2024-05-10", cache=None)
+    with pytest.raises(ValueError, match="outside the index"):
+        index.total("2024-04-30", "2024-05-05")
@@ -0,0 +1,59 @@
+"""Closed-form daily insolation against the sampled (numeric) integral it replaces."""
+import numpy as np
+import pytest
+
+import PV_System_Simulator as pv
+
+SITES = [
+    (31.7187, 34.7287, 16, 180),
+    (0.0, 0.0, 0, 180),
+    (-33.9, 151.2, 30, 0),
+    (60.0, 10.0, 60, 180),
+    (66.0, 20.0, 45, 200),
+    (45.0, -100.0, 90, 90),
+    (-45.0, 170.0, 10, 45),
+    (50.0, 5.0, 0, 0),
+]
+
+
+def unclipped_chain():
+    return pv.power_chain_from_config(dict(pv.DEFAULT_CONFIG, clip_threshold=1e12, alt_clip_threshold=1e12))
+
+
+@pytest.mark.parametrize("latitude, longitude, beta, gamma", SITES)
+def test_analytic_matches_numeric(latitude, longitude, beta, gamma):
+    simulator = pv.PVSystemSimulator(latitude, longitude, beta, gamma)
+    chain = unclipped_chain()
+    dates, numeric = simulator.range_energy("2023-01-01", "2024-12-31", chain, "numeric")
+    analytic_dates, analytic = simulator.range_energy("2023-01-01", "2024-12-31", chain, "analytic")
+    np.testing.assert_array_equal(analytic_dates, dates)
+    np.testing.assert_allclose(analytic, numeric, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("latitude, longitude, beta, gamma", SITES)
+def test_daily_insolation_matches_trapezoid_loop(latitude, longitude, beta, gamma):
+    geometry = pv.SiteGeometry(latitude, longitude, 2024)
+    insolation, peak, exact = geometry.daily_insolation(beta, gamma)
+    simulator = pv.PVSystemSimulator(latitude, longitude, beta, gamma)
+    for day in range(0, geometry.days.size, 7):
+        when = (np.datetime64("2024-01-01") + day).astype(object)
+        time, alpha, psi, ion = simulator.day_sun_position(when.year, when.month, when.day)
+        irradiance = simulator.module_irradiance(ion, alpha, psi)
+        trapezoid = sum((irradiance[i] + irradiance[i + 1]) / 2 * (time[i + 1] - time[i]) for i in range(time.size - 1))
+        assert exact[day]
+        assert insolation[day] == pytest.approx(trapezoid, rel=1e-9, abs=1e-9)
+        assert irradiance.max() <= peak[day] * (1 + 1e-12)
+
+
+def test_clipped_days_fall_back_to_numeric():
+    simulator = pv.PVSystemSimulator(*SITES[0])
+    config = dict(pv.DEFAULT_CONFIG)
+    chain = pv.power_chain_from_config(config)
+    _, unclipped = simulator.range_energy("2024-01-01", "2024-12-31", chain, "numeric")
+    # A limit between the winter and the summer peak clips part of the year
+    peaks = [chain.apply(simulator.simulate_day_arrays(2024, month, 21, mult=chain.irr_mult)[1]).max() for month in (6, 12)]
+    chain = pv.power_chain_from_config(dict(config, clip_threshold=np.mean(peaks)))
+    _, numeric = simulator.range_energy("2024-01-01", "2024-12-31", chain, "numeric")
+    _, analytic = simulator.range_energy("2024-01-01", "2024-12-31", chain, "analytic")
+    assert 0 < np.count_nonzero(numeric < unclipped) < numeric.size
+    np.testing.assert_allclose(analytic, numeric, rtol=1e-9)
@@ -0,0 +1,51 @@
+"""ResultCache running size total and eviction against a directory scan."""
+import os
+
+import numpy as np
+
+import PV_System_Simulator as pv
+
+
+def scanned_total(cache):
+    return sum(size for _, size, _ in cache.entries())
+
+
+def recorded_total(cache):
+    with open(os.path.join(cache.directory, '.size')) as f:
+        return int(f.read())
+
+
+def test_fetch_stores_and_reuses_entries(tmp_path):
+    cache = pv.ResultCache(str(tmp_path), 10 ** 6)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'energy': np.arange(5.0)}
+
+    first = cache.fetch('test', {'day': '2024-01-01'}, compute)
+    again = cache.fetch('test', {'day': '2024-01-01'}, compute)
+    np.testing.assert_array_equal(again['energy'], first['energy'])
+    assert len(calls) == 1
+    assert cache.get(cache.key('test', {'day': '2024-01-02'})) is None
+
+
+def test_running_total_and_eviction_match_scan(tmp_path):
+    cache = pv.ResultCache(str(tmp_path), 10 ** 9)
+    for i in range(6):
+        cache.put(f"{i:064x}", {'values': np.full(1000, float(i))})
+        os.utime(cache._path(f"{i:064x}"), ns=(i * 10 ** 9, i * 10 ** 9))  # put order is use order
+        assert recorded_total(cache) == scanned_total(cache)
+
+    entry_size = scanned_total(cache) // 6
+    # Room for three entries: the next write evicts the least recently used
+    cache.max_bytes = 4 * entry_size - 1
+    cache.get(f"{0:064x}")  # now the most recently used
+    cache.put(f"{6:064x}", {'values': np.zeros(1000)})
+    left = sorted(os.path.basename(path)[:64] for path, _, _ in cache.entries())
+    assert left == sorted(f"{i:064x}" for i in (0, 5, 6))
+    assert recorded_total(cache) == scanned_total(cache) <= cache.max_bytes
+
+    cache.clear()
+    assert cache.entries() == []
+    assert recorded_total(cache) == 0